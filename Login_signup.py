@@ -6,12 +6,16 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QFont
 from PyQt6.QtCore import Qt
 from models import User
+from async_db import AsyncDatabase
+from credentials import CredentialService
 import sys
 
 class Login_signup(QMainWindow):
-    def __init__(self, db, on_login_success):
+    def __init__(self, db, on_login_success, credentials=None):
         super().__init__()
         self.db = db
+        self.async_db = AsyncDatabase(db)
+        self.credentials = credentials or CredentialService()
         self.on_login_success = on_login_success
         self.setWindowTitle("Login Form")
         self.setGeometry(100, 100, 400, 400)
@@ -44,9 +48,9 @@ class Login_signup(QMainWindow):
         self.login_password.setEchoMode(QLineEdit.EchoMode.Password)
         self.login_password.setStyleSheet("padding: 10px; font-size: 14px; color: white;")
 
-        login_btn = QPushButton("Login")
-        login_btn.setStyleSheet(self.button_style())
-        login_btn.clicked.connect(self.handle_login)
+        self.login_btn = QPushButton("Login")
+        self.login_btn.setStyleSheet(self.button_style())
+        self.login_btn.clicked.connect(self.handle_login)
 
         signup_btn = QPushButton("Signup")
         signup_btn.setStyleSheet(self.button_style())
@@ -58,7 +62,7 @@ class Login_signup(QMainWindow):
         login_layout.addWidget(self.login_email)
         login_layout.addSpacing(5)
         login_layout.addWidget(self.login_password)
-        login_layout.addWidget(login_btn)
+        login_layout.addWidget(self.login_btn)
         login_layout.addWidget(signup_btn)
 
         login_page.setLayout(login_layout)
@@ -100,9 +104,9 @@ class Login_signup(QMainWindow):
         self.signup_confirm.setEchoMode(QLineEdit.EchoMode.Password)
         self.signup_confirm.setStyleSheet("padding: 10px; font-size: 14px; color: white;")
 
-        register_btn = QPushButton("Register")
-        register_btn.setStyleSheet(self.button_style())
-        register_btn.clicked.connect(self.register_handel)
+        self.register_btn = QPushButton("Register")
+        self.register_btn.setStyleSheet(self.button_style())
+        self.register_btn.clicked.connect(self.register_handel)
 
         back_btn = QPushButton("Back to Login")
         back_btn.setStyleSheet(self.button_style())
@@ -116,7 +120,7 @@ class Login_signup(QMainWindow):
         signup_layout.addWidget(self.signup_email)
         signup_layout.addWidget(self.signup_password)
         signup_layout.addWidget(self.signup_confirm)
-        signup_layout.addWidget(register_btn)
+        signup_layout.addWidget(self.register_btn)
         signup_layout.addWidget(back_btn)
 
         signup_page.setLayout(signup_layout)
@@ -157,11 +161,30 @@ class Login_signup(QMainWindow):
         if not email or not password:
             QMessageBox.warning(self,"Error","Please fill in all fields")
             return
-        user_data = self.db.get_user_by_email(email)
+        self.login_btn.setEnabled(False)
+        self.async_db.run(self.check_login, email, password,
+                          on_result=self.finish_login, on_error=self.show_db_error)
+
+    def check_login(self, email, password):
+        # Runs on a worker thread; returns (user_data, matches). Verification
+        # happens in the credential service's process pool.
+        user_data = self.db.get_user_by_email(email, cached=False)
+        if not user_data:
+            return None, False
+        matches, new_hash = self.credentials.verify(password, user_data[4]).result()
+        if new_hash is not None:
+            # Plaintext or outdated work factor: store the upgraded hash
+            self.db.update_user_password(user_data[0], new_hash)
+            user_data = user_data[:4] + (new_hash,) + user_data[5:]
+        return user_data, matches
+
+    def finish_login(self, result):
+        self.login_btn.setEnabled(True)
+        user_data, matches = result
         if not user_data :
             QMessageBox.warning(self, "Error", "User not found")
             return
-        if user_data[4] != password:
+        if not matches:
             QMessageBox.warning(self, "Error","Incorrect password")
             return
         self.current_user = User(*user_data)
@@ -179,12 +202,31 @@ class Login_signup(QMainWindow):
             return
         if password != confirm_password:
             QMessageBox.warning(self,"Error", "Password don't match")
+            return
+
+        self.register_btn.setEnabled(False)
+        self.async_db.run(self.create_account, first_name, last_name, email, password,
+                          on_result=self.finish_register, on_error=self.show_db_error)
+
+    def create_account(self, first_name, last_name, email, password):
+        # Runs on a worker thread; returns None when the email is taken
         if self.db.get_user_by_email(email):
+            return None
+        password_hash = self.credentials.hash(password).result()
+        user_id = self.db.add_user(first_name, last_name, email, password_hash)
+        self.db.update_user_status(user_id, True)
+        return User(user_id, first_name, last_name, email, password_hash, False, None)
+
+    def finish_register(self, user):
+        self.register_btn.setEnabled(True)
+        if user is None:
             QMessageBox.warning(self,"Error", "Email already Registered")
             return
-        
-        user_id = self.db.add_user(first_name, last_name, email, password)
-        self.current_user = User(user_id, first_name, last_name, email,password,False, None)
-        self.db.update_user_status(user_id, True)
+        self.current_user = user
         self.on_login_success(self.current_user)
 
+    def show_db_error(self, error):
+        self.login_btn.setEnabled(True)
+        self.register_btn.setEnabled(True)
+        QMessageBox.warning(self, "Error", f"Database error: {error}")
+
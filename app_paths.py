@@ -0,0 +1,17 @@
+import os
+
+APP_NAME = 'messaging_app'
+
+
+def data_path(filename):
+    # `filename` in the per-user data directory, e.g.
+    # ~/.local/share/messaging_app, where diagnostics files are kept instead
+    # of the working directory. The directory may not exist yet.
+    from PyQt6.QtCore import QStandardPaths
+    base = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericDataLocation)
+    return os.path.join(base, APP_NAME, filename)
+
+
+def enabled(variable):
+    # Opt-in switches are environment variables set to 1
+    return os.environ.get(variable, '') not in ('', '0')
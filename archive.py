@@ -0,0 +1,245 @@
+import argparse
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+
+ARCHIVE_COLUMNS = 'id, sender_id, receiver_id, group_id, content, timestamp, is_read, conversation'
+MAX_ATTACHED = 8  # SQLite allows 10 attached databases per connection
+
+
+def compress(content):
+    # Short messages usually grow under zlib; those are stored as plain text
+    encoded = content.encode('utf-8')
+    data = zlib.compress(encoded, 9)
+    return data if len(data) < len(encoded) else content
+
+
+def decompress(content):
+    if isinstance(content, bytes):
+        return zlib.decompress(content).decode('utf-8')
+    return content
+
+
+def schema_name(period):
+    return 'archive_' + period.replace('-', '_')
+
+
+class MessageArchive:
+    # Messages older than a cut-off live in one SQLite file per month next
+    # to the main database, with content zlib-compressed where that makes it
+    # smaller. The message_archives table in the main database lists the
+    # files and the range each covers.
+    # Archive files are attached to a connection only when a history page
+    # reaches past the hot messages table, at most MAX_ATTACHED at a time.
+
+    def __init__(self, pool):
+        self.pool = pool
+        base, _ = os.path.splitext(os.path.abspath(pool.path))
+        self.prefix = base + '.archive-'
+        self._attached = threading.local()
+
+    def create_tables(self, cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_archives (
+            period TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            oldest TIMESTAMP NOT NULL,
+            newest TIMESTAMP NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL
+        )
+        ''')
+
+    def archive_path(self, period):
+        return f'{self.prefix}{period}.db'
+
+    def attach(self, conn, periods):
+        # Must run outside a transaction. Returns {period: schema}. The least
+        # recently used archives are detached to stay under the limit.
+        attached = getattr(self._attached, 'schemas', None)
+        if attached is None:
+            attached = self._attached.schemas = {}
+        schemas = attached.setdefault(id(conn), OrderedDict())
+        for period in periods:
+            if period in schemas:
+                schemas.move_to_end(period)
+                continue
+            while len(schemas) >= MAX_ATTACHED:
+                _, old_schema = schemas.popitem(last=False)
+                conn.execute(f'DETACH DATABASE {old_schema}')
+            schema = schema_name(period)
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (self.archive_path(period),))
+            schemas[period] = schema
+        return {period: schemas[period] for period in periods}
+
+    def detach_all(self, conn):
+        schemas = getattr(self._attached, 'schemas', {}).pop(id(conn), {})
+        for schema in schemas.values():
+            conn.execute(f'DETACH DATABASE {schema}')
+
+    def periods_before(self, cursor, timestamp):
+        # Archived periods that can hold messages older than `timestamp`,
+        # newest first
+        if timestamp is None:
+            cursor.execute('SELECT period FROM message_archives ORDER BY period DESC')
+        else:
+            cursor.execute('''
+            SELECT period FROM message_archives WHERE oldest <= ? ORDER BY period DESC
+            ''', (timestamp,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def find_message(self, conn, message_id):
+        # (timestamp, id) of an archived message, or None
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT period FROM message_archives WHERE ? BETWEEN first_id AND last_id
+        ORDER BY period DESC
+        ''', (message_id,))
+        periods = [row[0] for row in cursor.fetchall()]
+        for period, schema in self.attach(conn, periods).items():
+            cursor.execute(f'SELECT timestamp, id FROM {schema}.messages WHERE id = ?', (message_id,))
+            row = cursor.fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def page_before(self, conn, query, params, anchor, limit):
+        # Continues a newest-first history page into the archives. `query`
+        # selects from `messages m` with content as the fifth column; rows
+        # come back newest first with content decompressed.
+        cursor = conn.cursor()
+        rows = []
+        for period in self.periods_before(cursor, anchor[0] if anchor else None):
+            schema = self.attach(conn, [period])[period]
+            archive_query = query.replace('FROM messages m', f'FROM {schema}.messages m')
+            if anchor is not None:
+                archive_query += ' AND (m.timestamp, m.id) < (?, ?)'
+                archive_params = params + tuple(anchor)
+            else:
+                archive_params = params
+            cursor.execute(archive_query + ' ORDER BY m.timestamp DESC, m.id DESC LIMIT ?',
+                           archive_params + (limit - len(rows),))
+            rows.extend(row[:4] + (decompress(row[4]),) + row[5:] for row in cursor.fetchall())
+            if len(rows) >= limit:
+                break
+            if rows:
+                anchor = (rows[-1][5], rows[-1][0])
+        return rows
+
+    def iter_archived(self, conn, query, params, batch_size=500):
+        # Every archived row matching `query`, oldest first
+        cursor = conn.cursor()
+        cursor.execute('SELECT period FROM message_archives ORDER BY period')
+        for period in [row[0] for row in cursor.fetchall()]:
+            schema = self.attach(conn, [period])[period]
+            archive_cursor = conn.cursor()
+            archive_cursor.execute(query.replace('FROM messages m', f'FROM {schema}.messages m')
+                                   + ' ORDER BY m.timestamp, m.id', params)
+            while True:
+                rows = archive_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[:4] + (decompress(row[4]),) + row[5:]
+
+    def archive_before(self, cutoff, batch_size=5000):
+        # Moves messages with a timestamp before `cutoff` out of the main
+        # database in batches, each its own transaction so regular writes
+        # keep going in between. Returns the number of messages moved.
+        moved = 0
+        last_id = 0
+        try:
+            while True:
+                cursor = self.pool.reader().cursor()
+                cursor.execute(f'''
+                SELECT {ARCHIVE_COLUMNS} FROM messages
+                WHERE id > ? AND timestamp < ?
+                ORDER BY id LIMIT ?
+                ''', (last_id, cutoff, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return moved
+                last_id = rows[-1][0]
+                by_period = {}
+                for row in rows:
+                    by_period.setdefault(str(row[5])[:7], []).append(row)
+                periods = sorted(by_period)
+                for start in range(0, len(periods), MAX_ATTACHED):
+                    moved += self.move_batch({period: by_period[period]
+                                              for period in periods[start:start + MAX_ATTACHED]})
+        finally:
+            with self.pool.write() as conn:
+                self.detach_all(conn)
+
+    def move_batch(self, by_period):
+        # Two transactions, because with WAL the main database and each
+        # archive commit separately: the copies are committed to the
+        # archives first, then registered and deleted from the main database.
+        # A crash in between leaves the messages in both places and the redo
+        # copies them again, which OR REPLACE makes idempotent; the other
+        # order could lose them from both files.
+        with self.pool.write() as conn:
+            schemas = self.attach(conn, list(by_period))
+            for period, rows in by_period.items():
+                schema = schemas[period]
+                conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {schema}.messages (
+                    id INTEGER PRIMARY KEY,
+                    sender_id INTEGER NOT NULL,
+                    receiver_id INTEGER,
+                    group_id INTEGER,
+                    content NOT NULL,
+                    timestamp TIMESTAMP,
+                    is_read BOOLEAN,
+                    conversation TEXT
+                )
+                ''')
+                conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS {schema}.idx_messages_conversation
+                ON messages (conversation, timestamp, id)
+                ''')
+                conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS {schema}.idx_messages_group
+                ON messages (group_id, timestamp, id)
+                ''')
+                conn.executemany(f'INSERT OR REPLACE INTO {schema}.messages ({ARCHIVE_COLUMNS}) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (row[:4] + (compress(row[4]),) + row[5:] for row in rows))
+        with self.pool.write() as conn:
+            for period, rows in by_period.items():
+                conn.execute('''
+                INSERT INTO message_archives
+                    (period, path, oldest, newest, first_id, last_id, message_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (period) DO UPDATE SET
+                    oldest = min(oldest, excluded.oldest),
+                    newest = max(newest, excluded.newest),
+                    first_id = min(first_id, excluded.first_id),
+                    last_id = max(last_id, excluded.last_id),
+                    message_count = message_count + excluded.message_count
+                ''', (period, self.archive_path(period), min(str(row[5]) for row in rows),
+                      max(str(row[5]) for row in rows), min(row[0] for row in rows),
+                      max(row[0] for row in rows), len(rows)))
+                conn.executemany('DELETE FROM messages WHERE id = ?', ((row[0],) for row in rows))
+        return sum(len(rows) for rows in by_period.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old messages into per-month archive databases.')
+    parser.add_argument('--db', default='messaging_app.db')
+    parser.add_argument('--max-age-days', type=int, default=180)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    from database import Database
+    db = Database(args.db)
+    moved = db.archive_messages(args.max_age_days, args.batch_size)
+    db.close()
+    print(f'Archived {moved} messages')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class QuerySignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+class QueryTask(QRunnable):
+    def __init__(self, fn, args, kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = QuerySignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as error:
+            self.signals.failed.emit(error)
+        else:
+            self.signals.finished.emit(result)
+
+
+class AsyncDatabase(QObject):
+    # Runs Database calls on a worker thread pool and hands results back on the
+    # GUI thread through queued signals. Each worker thread reads through its
+    # own pooled connection, so queries never wait on the GUI thread.
+    query_failed = pyqtSignal(object)  # exception not handled by on_error
+
+    def __init__(self, db, thread_pool=None):
+        super().__init__()
+        self.db = db
+        self.thread_pool = thread_pool or QThreadPool.globalInstance()
+        self._pending = set()
+        self._latest = {}
+        self.closed = False
+
+    def run(self, fn, *args, on_result=None, on_error=None, key=None, **kwargs):
+        # `fn` is a callable or the name of a Database method. When `key` is
+        # given, results of an earlier call with the same key that are still in
+        # flight are dropped, so only the newest answer reaches the UI.
+        if isinstance(fn, str):
+            fn = getattr(self.db, fn)
+        task = QueryTask(fn, args, kwargs)
+        self._pending.add(task)
+        if key is not None:
+            self._latest[key] = task
+        task.signals.finished.connect(
+            lambda result: self._deliver(task, key, on_result, result))
+        task.signals.failed.connect(
+            lambda error: self._deliver(task, key, on_error, error, failed=True))
+        self.thread_pool.start(task)
+        return task
+
+    def close(self):
+        # Results of calls still in flight are dropped from now on
+        self.closed = True
+
+    def _deliver(self, task, key, callback, value, failed=False):
+        self._pending.discard(task)
+        if self.closed:
+            return
+        if key is not None:
+            if self._latest.get(key) is not task:
+                return
+            del self._latest[key]
+        if callback is not None:
+            callback(value)
+        elif failed:
+            self.query_failed.emit(value)
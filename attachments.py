@@ -0,0 +1,192 @@
+import hashlib
+import shutil
+import tempfile
+import zlib
+
+CHUNK_SIZE = 256 * 1024
+SPOOL_SIZE = 8 * 1024 * 1024  # unseekable sources larger than this spill to a temp file
+COMPRESS_RATIO = 0.9  # compress when that saves at least 10%
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def read_chunks(source, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def compressed_chunks(chunks):
+    compressor = zlib.compressobj(6)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def decompressed_chunks(chunks, chunk_size):
+    # Output is capped at `chunk_size` per piece however well the data compressed
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        data = decompressor.decompress(chunk, chunk_size)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+class PreparedContent:
+    # A source that has been hashed and measured, ready for AttachmentStore.store
+    def __init__(self, source, sha256, size, stored_size, compression):
+        self.source = source
+        self.sha256 = sha256
+        self.size = size
+        self.stored_size = stored_size
+        self.compression = compression
+
+
+class AttachmentStore:
+    # File contents live in attachment_contents, one row per distinct SHA-256,
+    # optionally zlib-compressed; attachments links them to messages with the
+    # file name and size. Listing attachments never touches the content rows.
+    # Contents are written and read a chunk at a time through incremental
+    # BLOB I/O, so a file is never held in memory whole. SQLite limits a
+    # single BLOB to 1 GB by default.
+
+    def create_tables(self, cursor):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachment_contents (
+            id INTEGER PRIMARY KEY,
+            sha256 TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            stored_size INTEGER NOT NULL,
+            compression TEXT,
+            data BLOB NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY,
+            message_id INTEGER NOT NULL,
+            content_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            mime_type TEXT,
+            size INTEGER NOT NULL,
+            FOREIGN KEY (message_id) REFERENCES messages(id),
+            FOREIGN KEY (content_id) REFERENCES attachment_contents(id)
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attachments_message
+        ON attachments (message_id)
+        ''')
+
+    def prepare(self, source, compress=None):
+        # First pass over a binary file object, outside any transaction:
+        # hash, size and compressed size. With compress=None, compression is
+        # used only when it saves enough.
+        if not source.seekable():
+            spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+            shutil.copyfileobj(source, spool, CHUNK_SIZE)
+            source = spool
+        source.seek(0)
+        sha256 = hashlib.sha256()
+        size = 0
+        compressed_size = 0
+        chunks = read_chunks(source)
+        if compress is not False:
+            def measured(chunks):
+                nonlocal size
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            compressed_size = sum(len(data) for data in compressed_chunks(measured(chunks)))
+        else:
+            for chunk in chunks:
+                sha256.update(chunk)
+                size += len(chunk)
+        if compress or (compress is None and compressed_size < size * COMPRESS_RATIO):
+            return PreparedContent(source, sha256.hexdigest(), size, compressed_size, 'zlib')
+        return PreparedContent(source, sha256.hexdigest(), size, size, None)
+
+    def store(self, conn, prepared):
+        # Inside a write transaction. Returns the content id, reusing an
+        # existing row with the same hash without writing anything.
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM attachment_contents WHERE sha256 = ?', (prepared.sha256,))
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        cursor.execute('''
+        INSERT INTO attachment_contents (sha256, size, stored_size, compression, data)
+        VALUES (?, ?, ?, ?, zeroblob(?))
+        ''', (prepared.sha256, prepared.size, prepared.stored_size, prepared.compression, prepared.stored_size))
+        content_id = cursor.lastrowid
+
+        # Second pass, checked against the first in case the file changed
+        prepared.source.seek(0)
+        sha256 = hashlib.sha256()
+
+        def hashed(chunks):
+            for chunk in chunks:
+                sha256.update(chunk)
+                yield chunk
+
+        chunks = hashed(read_chunks(prepared.source))
+        if prepared.compression == 'zlib':
+            chunks = compressed_chunks(chunks)
+        written = 0
+        with conn.blobopen('attachment_contents', 'data', content_id, readonly=False) as blob:
+            for data in chunks:
+                if written + len(data) > prepared.stored_size:
+                    raise ValueError('attachment changed while it was being stored')
+                blob.write(data)
+                written += len(data)
+        if written != prepared.stored_size or sha256.hexdigest() != prepared.sha256:
+            raise ValueError('attachment changed while it was being stored')
+        return content_id
+
+    def attach(self, conn, message_id, content_id, filename, mime_type, size):
+        return conn.execute('''
+        INSERT INTO attachments (message_id, content_id, filename, mime_type, size)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (message_id, content_id, filename, mime_type, size)).lastrowid
+
+    def for_messages(self, conn, message_ids):
+        # (id, message_id, filename, mime_type, size) for the given messages
+        rows = []
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            rows += conn.execute(f'''
+            SELECT id, message_id, filename, mime_type, size FROM attachments
+            WHERE message_id IN ({', '.join('?' * len(chunk))}) ORDER BY id
+            ''', chunk).fetchall()
+        return rows
+
+    def iter_content(self, conn, attachment_id, chunk_size=CHUNK_SIZE):
+        # The original bytes, at most `chunk_size` at a time. The blob stays
+        # open (and the read transaction with it) until iteration ends.
+        row = conn.execute('''
+        SELECT c.id, c.compression FROM attachments a
+        JOIN attachment_contents c ON c.id = a.content_id
+        WHERE a.id = ?
+        ''', (attachment_id,)).fetchone()
+        if row is None:
+            raise KeyError(attachment_id)
+        content_id, compression = row
+        with conn.blobopen('attachment_contents', 'data', content_id, readonly=True) as blob:
+            chunks = iter(lambda: blob.read(chunk_size), b'')
+            if compression == 'zlib':
+                chunks = decompressed_chunks(chunks, chunk_size)
+            yield from chunks
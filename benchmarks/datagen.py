@@ -0,0 +1,84 @@
+import random
+from datetime import datetime, timedelta
+
+from database import Database, conversation_key
+
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Dev', 'Emma', 'Farhan', 'Grace', 'Hasan', 'Isla', 'Jamal',
+               'Kira', 'Liam', 'Maya', 'Nabil', 'Olivia', 'Priya', 'Quinn', 'Rafi', 'Sara', 'Tariq']
+LAST_NAMES = ['Ahmed', 'Brown', 'Chowdhury', 'Das', 'Evans', 'Fischer', 'Garcia', 'Hossain',
+              'Islam', 'Jones', 'Khan', 'Lee', 'Miah', 'Nguyen', 'Okafor', 'Patel', 'Rahman', 'Smith']
+WORDS = ['hello', 'meeting', 'tomorrow', 'lunch', 'project', 'deadline', 'call', 'thanks', 'later',
+         'photo', 'weekend', 'update', 'ready', 'coffee', 'train', 'late', 'great', 'plan', 'ok', 'sure']
+
+
+class SyntheticData:
+    # Ids produced by build_database, used to pick realistic query arguments
+    def __init__(self, user_ids, group_ids, memberships, conversations):
+        self.user_ids = user_ids
+        self.group_ids = group_ids
+        self.memberships = memberships
+        self.conversations = conversations
+
+
+def build_database(path, users=1000, groups=50, members_per_group=20, messages=100000,
+                   contacts_per_user=10, group_message_ratio=0.3, online_ratio=0.2,
+                   batch_size=10000, seed=0, stats=None):
+    rng = random.Random(seed)
+    db = Database(path, stats=stats)
+    start = datetime.now() - timedelta(days=365)
+
+    with db.pool.write() as conn:
+        conn.executemany('''
+        INSERT INTO users (first_name, last_name, email, password, is_online, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f'user{i}@example.com', 'password',
+               rng.random() < online_ratio, start) for i in range(users)))
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+
+        group_ids = []
+        memberships = {}
+        for i in range(groups):
+            owner = rng.choice(user_ids)
+            group_id = conn.execute('INSERT INTO groups (name, created_by) VALUES (?, ?)',
+                                    (f'Group {i}', owner)).lastrowid
+            members = set(rng.sample(user_ids, min(members_per_group, len(user_ids)))) | {owner}
+            conn.executemany('INSERT INTO group_members (group_id, user_id) VALUES (?, ?)',
+                             ((group_id, member) for member in members))
+            group_ids.append(group_id)
+            memberships[group_id] = sorted(members)
+
+    conversations = set()
+    for user_id in user_ids:
+        for peer in rng.sample(user_ids, min(contacts_per_user, len(user_ids))):
+            if peer != user_id:
+                conversations.add((min(user_id, peer), max(user_id, peer)))
+    conversations = sorted(conversations)
+
+    step = timedelta(days=365) / max(messages, 1)
+
+    def message_rows():
+        # Timestamps are spread evenly over the past year in insertion order
+        for i in range(messages):
+            timestamp = (start + i * step).strftime('%Y-%m-%d %H:%M:%S')
+            content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+            if group_ids and rng.random() < group_message_ratio:
+                group_id = rng.choice(group_ids)
+                yield (rng.choice(memberships[group_id]), None, group_id, content, timestamp, None)
+            else:
+                user1, user2 = rng.choice(conversations)
+                sender, receiver = (user1, user2) if rng.random() < 0.5 else (user2, user1)
+                yield (sender, receiver, None, content, timestamp, conversation_key(sender, receiver))
+
+    rows = message_rows()
+    with db.bulk_messages():
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            with db.pool.write() as conn:
+                conn.executemany('''
+                INSERT INTO messages (sender_id, receiver_id, group_id, content, timestamp, conversation)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+
+    return db, SyntheticData(user_ids, group_ids, memberships, conversations)
@@ -0,0 +1,368 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.datagen import WORDS, build_database
+from credentials import hash_password
+from database import Database
+from query_stats import percentile
+
+# Relative frequency of each client action
+DEFAULT_MIX = {
+    'send_direct': 5,
+    'send_group': 2,
+    'read_history': 3,
+    'read_group_history': 1,
+    'heartbeat': 1,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}')
+        mix[name] = float(weight)
+    return mix
+
+
+def is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class Recorder:
+    # Latencies of successful calls and counts of failed ones, per action.
+    # Each client thread has its own, so recording takes no lock.
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def time(self, action, call, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = call(*args, **kwargs)
+        except Exception as error:
+            kind = 'database is locked' if is_lock_error(error) else type(error).__name__
+            errors = self.errors.setdefault(action, {})
+            errors[kind] = errors.get(kind, 0) + 1
+            return None
+        self.latencies.setdefault(action, []).append(time.perf_counter() - started)
+        return result
+
+    def merge(self, other):
+        for action, latencies in other.latencies.items():
+            self.latencies.setdefault(action, []).extend(latencies)
+        for action, errors in other.errors.items():
+            merged = self.errors.setdefault(action, {})
+            for kind, count in errors.items():
+                merged[kind] = merged.get(kind, 0) + count
+
+
+class SimulatedClient:
+    # One user: signs up, goes online, then performs actions from `mix` at
+    # `rate` per second (exponential gaps) for `duration` seconds, starting
+    # once every client has finished setting up. Actions are methods named
+    # after the mix entries, so another delivery layer can be driven by
+    # overriding them.
+
+    def __init__(self, db, config, index, barrier):
+        self.db = db
+        self.config = config
+        self.index = index
+        self.barrier = barrier
+        self.rng = random.Random(config['seed'] * 100003 + index)
+        self.recorder = Recorder()
+        self.user_id = None
+        self.peers = []
+        self.groups = []
+
+    def email(self, index):
+        return f"{self.config['run']}-{index}@loadtest.example.com"
+
+    def run(self):
+        self.recorder.time('sign_up', self.sign_up)
+        self.barrier.wait()
+        self.recorder.time('setup', self.join_groups)
+        self.barrier.wait()
+        self.recorder.time('setup', self.find_contacts)
+        self.barrier.wait()
+        if self.user_id is None:
+            return self.recorder
+
+        mix = self.config['mix']
+        actions = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        rate = self.config['rate']
+        next_at = time.time()
+        deadline_at = next_at + self.config['duration']
+        while True:
+            next_at += self.rng.expovariate(rate)
+            if next_at >= deadline_at:
+                break
+            delay = next_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            action = self.rng.choices(actions, weights)[0]
+            self.recorder.time(action.__name__, action)
+        return self.recorder
+
+    def sign_up(self):
+        password = hash_password('password', self.config['hash_iterations'])
+        self.user_id = self.db.add_user('Load', f'Client {self.index}', self.email(self.index), password)
+        self.db.update_user_status(self.user_id, True)
+
+    def join_groups(self):
+        # The first client of every block of `group_size` creates a group with
+        # the rest of the block
+        group_size = self.config['group_size']
+        if self.user_id is None or group_size < 2 or self.index % group_size:
+            return
+        group_id = self.db.create_group(f"{self.config['run']} group {self.index}", self.user_id)
+        self.db.add_group_member(group_id, self.user_id)
+        last = min(self.index + group_size, self.config['clients'])
+        for index in range(self.index + 1, last):
+            member = self.db.get_user_by_email(self.email(index))
+            if member is not None:
+                self.db.add_group_member(group_id, member[0])
+
+    def find_contacts(self):
+        if self.user_id is None:
+            return
+        others = [index for index in range(self.config['clients']) if index != self.index]
+        for index in self.rng.sample(others, min(self.config['contacts'], len(others))):
+            peer = self.db.get_user_by_email(self.email(index))
+            if peer is not None:
+                self.peers.append(peer[0])
+        self.groups = [group[0] for group in self.db.get_user_groups(self.user_id)]
+
+    def content(self):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(2, 12)))
+
+    def send_direct(self):
+        if self.peers:
+            self.db.add_message(self.user_id, self.rng.choice(self.peers), content=self.content())
+
+    def send_group(self):
+        if self.groups:
+            self.db.add_message(self.user_id, group_id=self.rng.choice(self.groups), content=self.content())
+
+    def read_history(self):
+        if self.peers:
+            return self.db.get_messages_page(self.user_id, self.rng.choice(self.peers))
+
+    def read_group_history(self):
+        if self.groups:
+            return self.db.get_group_messages_page(self.rng.choice(self.groups))
+
+    def heartbeat(self):
+        self.db.presence.heartbeat(self.user_id)
+
+
+def run_presence(db, stop, flush_interval, sweep_interval):
+    # Stands in for the PresenceTracker timers, which need a Qt event loop
+    next_sweep = time.monotonic() + sweep_interval
+    while not stop.wait(flush_interval):
+        db.presence.flush()
+        if time.monotonic() >= next_sweep:
+            db.presence.sweep()
+            next_sweep += sweep_interval
+
+
+def run_worker(config, indexes, barrier):
+    # One application instance: a Database shared by a thread per client.
+    # Returns (recorder, pool write count, pool write wait seconds).
+    db = Database(config['db'], batch_writes=config['batch_writes'])
+    clients = [SimulatedClient(db, config, index, barrier) for index in indexes]
+    threads = [threading.Thread(target=client.run) for client in clients]
+    stop = threading.Event()
+    presence = threading.Thread(target=run_presence, args=(db, stop, 5.0, 10.0), daemon=True)
+    presence.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    presence.join()
+    db.close()
+    recorder = Recorder()
+    for client in clients:
+        recorder.merge(client.recorder)
+    return recorder, db.pool.write_count, db.pool.write_wait
+
+
+def process_main(config, indexes, barrier, results):
+    recorder, write_count, write_wait = run_worker(config, indexes, barrier)
+    results.put((recorder.latencies, recorder.errors, write_count, write_wait))
+
+
+def run_load(config):
+    # Clients are split evenly over `processes` processes (0: threads in this
+    # process)
+    clients = config['clients']
+    processes = config['processes']
+    recorder = Recorder()
+    write_count = 0
+    write_wait = 0.0
+    if processes == 0:
+        barrier = threading.Barrier(clients)
+        started = time.time()
+        worker_recorder, write_count, write_wait = run_worker(config, range(clients), barrier)
+        recorder.merge(worker_recorder)
+    else:
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(clients)
+        results = context.Queue()
+        started = time.time()
+        workers = [context.Process(target=process_main,
+                                   args=(config, range(i, clients, processes), barrier, results))
+                   for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            latencies, errors, count, wait = results.get()
+            worker_recorder = Recorder()
+            worker_recorder.latencies, worker_recorder.errors = latencies, errors
+            recorder.merge(worker_recorder)
+            write_count += count
+            write_wait += wait
+        for worker in workers:
+            worker.join()
+    return recorder, write_count, write_wait, time.time() - started
+
+
+def summarize(latencies, errors, duration):
+    latencies = sorted(latencies)
+    summary = {
+        'calls': len(latencies),
+        'errors': sum(errors.values()),
+        'locked_errors': errors.get('database is locked', 0),
+        'throughput_per_sec': len(latencies) / duration if duration else 0.0,
+    }
+    if latencies:
+        summary.update({
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': latencies[-1] * 1000,
+        })
+    return summary
+
+
+def build_report(config, recorder, write_count, write_wait, elapsed):
+    duration = config['duration']
+    actions = sorted(set(recorder.latencies) | set(recorder.errors))
+    results = {action: summarize(recorder.latencies.get(action, []), recorder.errors.get(action, {}), duration)
+               for action in actions if action not in ('sign_up', 'setup')}
+    all_latencies = [latency for action, latencies in recorder.latencies.items()
+                     if action not in ('sign_up', 'setup') for latency in latencies]
+    all_errors = {}
+    for action, errors in recorder.errors.items():
+        for kind, count in errors.items():
+            all_errors[kind] = all_errors.get(kind, 0) + count
+    return {
+        'config': {key: value for key, value in config.items() if key not in ('db', 'run')},
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'elapsed_seconds': elapsed,
+        'sign_up': summarize(recorder.latencies.get('sign_up', []), recorder.errors.get('sign_up', {}), 0),
+        'total': summarize(all_latencies, {}, duration),
+        'errors': all_errors,
+        'write_lock': {
+            'acquisitions': write_count,
+            'wait_seconds': write_wait,
+            'mean_wait_ms': write_wait / write_count * 1000 if write_count else 0.0,
+        },
+        'results': results,
+    }
+
+
+def format_report(report):
+    lines = [f"{'action':<20} {'calls':>8} {'/sec':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}"]
+    for action, entry in sorted(report['results'].items()) + [('total', report['total'])]:
+        lines.append(f"{action:<20} {entry['calls']:>8} {entry['throughput_per_sec']:>8.1f} "
+                     f"{entry.get('p50_ms', 0):>8.2f} {entry.get('p99_ms', 0):>8.2f} "
+                     f"{entry.get('max_ms', 0):>8.1f} {entry['errors']:>7}")
+    lock = report['write_lock']
+    lines.append(f"errors: {report['errors'] or 'none'}")
+    lines.append(f"write lock: {lock['acquisitions']} acquisitions, {lock['wait_seconds']:.2f}s waiting "
+                 f"({lock['mean_wait_ms']:.3f} ms mean)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drive the Database API from many simulated clients at once.')
+    parser.add_argument('--db', help='database file (default: a temporary file)')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--processes', type=int, default=4,
+                        help='application instances to spread clients over; 0 runs all clients as threads here')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load after setup')
+    parser.add_argument('--rate', type=float, default=2.0, help='actions per second per client')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='action weights, e.g. send_direct=5,read_history=3')
+    parser.add_argument('--contacts', type=int, default=5, help='direct chat partners per client')
+    parser.add_argument('--group-size', type=int, default=10)
+    parser.add_argument('--hash-iterations', type=int, default=1000,
+                        help='PBKDF2 work factor used at sign-up (the app default is far higher)')
+    parser.add_argument('--batch-writes', action='store_true', help='use the group-commit write queue')
+    parser.add_argument('--preload-users', type=int, default=0, help='synthetic users to create first')
+    parser.add_argument('--preload-messages', type=int, default=0, help='synthetic messages to create first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the full JSON report instead of a table')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args(argv)
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'messaging_app.db')
+    if args.preload_users or args.preload_messages:
+        db, _ = build_database(path, users=max(args.preload_users, 2), messages=args.preload_messages,
+                               seed=args.seed)
+    else:
+        db = Database(path)
+    db.close()
+
+    config = {
+        'db': path,
+        'run': f'load{int(time.time())}-{os.getpid()}',
+        'clients': args.clients,
+        'processes': min(args.processes, args.clients),
+        'duration': args.duration,
+        'rate': args.rate,
+        'mix': args.mix,
+        'contacts': args.contacts,
+        'group_size': args.group_size,
+        'hash_iterations': args.hash_iterations,
+        'batch_writes': args.batch_writes,
+        'seed': args.seed,
+    }
+    recorder, write_count, write_wait, elapsed = run_load(config)
+    report = build_report(config, recorder, write_count, write_wait, elapsed)
+    if directory is not None:
+        directory.cleanup()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
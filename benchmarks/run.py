@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import build_database
+from database import Database, conversation_key
+from query_stats import QueryStats, percentile
+
+
+def summarize(latencies, rows):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'ops_per_sec': len(latencies) / total if total else 0.0,
+        'rows_per_call': rows / len(latencies),
+    }
+
+
+def benchmark_cases(db, data, rng):
+    # name -> zero-argument callable performing one representative call
+    def pair():
+        return rng.choice(data.conversations)
+
+    def member():
+        group_id = rng.choice(data.group_ids)
+        return group_id, rng.choice(data.memberships[group_id])
+
+    def search_term():
+        return rng.choice(['ava', 'kh', 'user1', 'rahman', 'gr', 'smi'])
+
+    counter = iter(range(10 ** 9))
+
+    # Where to resume paging from, picked once up front (with their own
+    # generator, so the other cases keep their arguments) so that calls
+    # only time the page itself
+    picks = random.Random(0)
+    contact_pages = []  # (user_id, key of a row halfway down the contacts)
+    conversation_pages = []  # (user_id, key of a row halfway down the chats)
+    for user_id in picks.sample(data.user_ids, min(20, len(data.user_ids))):
+        contacts = db.get_user_contacts(user_id)
+        if contacts:
+            row = contacts[len(contacts) // 2]
+            contact_pages.append((user_id, (row[4], row[6], row[0])))
+        conversations = db.get_recent_conversations(user_id, limit=-1)
+        if conversations:
+            row = conversations[len(conversations) // 2]
+            conversation_pages.append((user_id, (row[5], row[0])))
+
+    # Per chat, a message id halfway through its hot history and the oldest
+    # hot one; paging back from the latter continues into the archives
+    conn = db.pool.reader()
+
+    def history_anchors(where, value):
+        ids = [row[0] for row in conn.execute(
+            f'SELECT id FROM messages WHERE {where} ORDER BY timestamp, id', (value,))]
+        return (ids[len(ids) // 2], ids[0]) if ids else None
+
+    direct_pages = [(pair, history_anchors('conversation = ?', conversation_key(*pair)))
+                    for pair in picks.sample(data.conversations, min(20, len(data.conversations)))]
+    direct_pages = [(pair, anchors) for pair, anchors in direct_pages if anchors]
+    group_pages = [(group_id, history_anchors('group_id = ?', group_id))
+                   for group_id in picks.sample(data.group_ids, min(20, len(data.group_ids)))]
+    group_pages = [(group_id, anchors) for group_id, anchors in group_pages if anchors]
+
+    def contacts_page():
+        user_id, after = rng.choice(contact_pages)
+        return db.get_user_contacts(user_id, limit=50, after=after)
+
+    def conversations_page():
+        user_id, after = rng.choice(conversation_pages)
+        return db.get_recent_conversations(user_id, after=after)
+
+    def direct_page(which):
+        pair, anchors = rng.choice(direct_pages)
+        return db.get_messages_page(*pair, before_id=anchors[which])
+
+    def group_page(which):
+        group_id, anchors = rng.choice(group_pages)
+        return db.get_group_messages_page(group_id, before_id=anchors[which])
+
+    cases = {
+        'get_user_by_email': lambda: db.get_user_by_email(f'user{rng.randrange(len(data.user_ids))}@example.com'),
+        'get_user_by_id': lambda: db.get_user_by_id(rng.choice(data.user_ids)),
+        'get_all_users': lambda: db.get_all_users(exclude_user_id=rng.choice(data.user_ids)),
+        'get_online_users': lambda: db.get_online_users(exclude_user_id=rng.choice(data.user_ids)),
+        'get_user_groups': lambda: db.get_user_groups(rng.choice(data.user_ids)),
+        'search_user_by_email_or_name': lambda: db.search_user_by_email_or_name(
+            search_term(), rng.choice(data.user_ids)),
+        'search_users': lambda: db.search_users(search_term(), rng.choice(data.user_ids)),
+        'search_messages': lambda: db.search_messages(rng.choice(data.user_ids), rng.choice(['lunch', 'dead', 'cof'])),
+        'get_messages': lambda: db.get_messages(*pair()),
+        'get_messages_page': lambda: db.get_messages_page(*pair()),
+        'get_user_contacts': lambda: db.get_user_contacts(rng.choice(data.user_ids), limit=50),
+        'get_user_contacts_online': lambda: db.get_user_contacts(rng.choice(data.user_ids), online_only=True,
+                                                                 limit=50),
+        'get_recent_conversations': lambda: db.get_recent_conversations(rng.choice(data.user_ids)),
+        'get_user_group_summaries': lambda: db.get_user_group_summaries(rng.choice(data.user_ids), limit=50),
+        'iter_messages': lambda: list(db.iter_messages(*pair())),
+        'iter_users': lambda: list(db.iter_users(exclude_user_id=rng.choice(data.user_ids))),
+        'add_message': lambda: db.add_message(*pair(), content='benchmark message'),
+        'update_user_status': lambda: db.update_user_status(rng.choice(data.user_ids), rng.random() < 0.5),
+        'create_group': lambda: db.create_group(f'Bench group {next(counter)}', rng.choice(data.user_ids)),
+        'add_group_member': lambda: db.add_group_member(rng.choice(data.group_ids), rng.choice(data.user_ids)),
+        'add_user': lambda: db.add_user('Bench', 'User', f'bench{next(counter)}@example.com', 'password'),
+        # Start-up cost of an existing, current database
+        'open_database': lambda: Database(db.pool.path).close(),
+    }
+    if contact_pages:
+        cases['get_user_contacts_deep'] = contacts_page
+    if conversation_pages:
+        cases['get_recent_conversations_deep'] = conversations_page
+    if direct_pages:
+        cases['get_messages_page_deep'] = lambda: direct_page(0)
+        cases['get_messages_page_archived'] = lambda: direct_page(1)
+    if group_pages:
+        cases['get_group_messages_page_deep'] = lambda: group_page(0)
+        cases['get_group_messages_page_archived'] = lambda: group_page(1)
+    if data.group_ids:
+        cases['get_group_messages'] = lambda: db.get_group_messages(member()[0])
+        cases['get_group_messages_page'] = lambda: db.get_group_messages_page(member()[0])
+        cases['iter_group_messages'] = lambda: list(db.iter_group_messages(member()[0]))
+
+        def add_group_message():
+            group_id, sender_id = member()
+            return db.add_message(sender_id, group_id=group_id, content='benchmark message')
+
+        cases['add_group_message'] = add_group_message
+    return cases
+
+
+def run_benchmarks(db, data, iterations=200, only=None, seed=0):
+    rng = random.Random(seed)
+    results = {}
+    for name, call in benchmark_cases(db, data, rng).items():
+        if only and name not in only:
+            continue
+        latencies = []
+        rows = 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = call()
+            latencies.append(time.perf_counter() - started)
+            if isinstance(result, list):
+                rows += len(result)
+            elif result is not None:
+                rows += 1
+        results[name] = summarize(latencies, rows)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every public Database method against synthetic data.')
+    parser.add_argument('--db', help='database file to build (default: a temporary file)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--members', type=int, default=20, help='members per group')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--contacts', type=int, default=10, help='direct conversations per user')
+    parser.add_argument('--archive-days', type=int, default=180,
+                        help='archive messages older than this many days (of the year generated) before timing')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--only', nargs='*', help='benchmark names to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--query-stats', action='store_true',
+                        help='instrument the database and add per-statement stats to the report')
+    args = parser.parse_args(argv)
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'messaging_app.db')
+
+    stats = QueryStats() if args.query_stats else None
+    started = time.perf_counter()
+    db, data = build_database(path, users=args.users, groups=args.groups, members_per_group=args.members,
+                              messages=args.messages, contacts_per_user=args.contacts, seed=args.seed,
+                              stats=stats)
+    archived = db.archive_messages(args.archive_days)
+    build_seconds = time.perf_counter() - started
+    if stats is not None:
+        stats.reset()
+
+    report = {
+        'config': {
+            'users': args.users,
+            'groups': args.groups,
+            'members_per_group': args.members,
+            'messages': args.messages,
+            'contacts_per_user': args.contacts,
+            'archive_days': args.archive_days,
+            'archived_messages': archived,
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'build_seconds': build_seconds,
+        'results': run_benchmarks(db, data, args.iterations, args.only, args.seed),
+    }
+    if stats is not None:
+        report['query_stats'] = stats.snapshot()
+    db.close()
+    if directory is not None:
+        directory.cleanup()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import argparse
+import base64
+import gzip
+import itertools
+import json
+import sys
+import time
+from operator import itemgetter
+
+from archive import ARCHIVE_COLUMNS
+from attachments import read_chunks
+from database import Database, conversation_key
+
+# Export order doubles as import order: rows only refer to earlier tables
+TABLES = {
+    'users': ('id', 'first_name', 'last_name', 'email', 'password', 'is_online', 'last_seen'),
+    'groups': ('id', 'name', 'created_by', 'created_at'),
+    'group_members': ('group_id', 'user_id', 'joined_at'),
+    'messages': tuple(ARCHIVE_COLUMNS.split(', ')),
+    'attachment_contents': ('id', 'sha256', 'size', 'stored_size', 'compression'),
+    # Not a table: the stored bytes of the preceding attachment_contents
+    # row, base64-encoded, one CHUNK_SIZE piece per record
+    'attachment_chunks': ('content_id', 'offset', 'data'),
+    'attachments': ('id', 'message_id', 'content_id', 'filename', 'mime_type', 'size'),
+}
+
+# Format: one JSON object per line, {"table": "<name>", "<column>": value, ...}
+
+CONTENT_INSERT = '''
+INSERT INTO attachment_contents (id, sha256, size, stored_size, compression, data)
+VALUES (?, ?, ?, ?, ?, zeroblob(?))
+'''
+
+
+def open_stream(path, mode):
+    if path == '-':
+        return sys.stdout if mode == 'w' else sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def export_rows(db, batch_size=10000):
+    # Yields (table, row) for every row, archived messages included, reading
+    # `batch_size` rows at a time
+    conn = db.pool.reader()
+    for table, columns in TABLES.items():
+        if table == 'attachment_chunks':
+            continue
+        if table == 'messages':
+            yield from ((table, row) for row in db.archive.iter_archived(
+                conn, f'SELECT {ARCHIVE_COLUMNS} FROM messages m', (), batch_size))
+        cursor = conn.cursor()
+        order = 'group_id, user_id' if table == 'group_members' else 'id'
+        cursor.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY {order}')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield table, row
+                if table == 'attachment_contents':
+                    yield from content_chunks(conn, row[0])
+
+
+def content_chunks(conn, content_id):
+    # Read through incremental BLOB I/O, so a file is never in memory whole
+    offset = 0
+    with conn.blobopen('attachment_contents', 'data', content_id, readonly=True) as blob:
+        for data in read_chunks(blob):
+            yield 'attachment_chunks', (content_id, offset, base64.b64encode(data).decode('ascii'))
+            offset += len(data)
+
+
+def export_ndjson(db, out, batch_size=10000):
+    counts = dict.fromkeys(TABLES, 0)
+    for table, row in export_rows(db, batch_size):
+        record = {'table': table}
+        record.update(zip(TABLES[table], row))
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write('\n')
+        counts[table] += 1
+    return counts
+
+
+# Foreign key columns and the table each refers to. Imported rows that get
+# a new id are rewritten through an old -> new map per table.
+REFERENCES = {
+    'groups': {'created_by': 'users'},
+    'group_members': {'group_id': 'groups', 'user_id': 'users'},
+    'messages': {'sender_id': 'users', 'receiver_id': 'users', 'group_id': 'groups'},
+    'attachments': {'message_id': 'messages', 'content_id': 'attachment_contents'},
+}
+
+# When merging into a database that already has data, an imported row is
+# the same as an existing one matching on these columns (after remapping)
+MATCHES = {
+    'users': ('email',),
+    'groups': ('name', 'created_by', 'created_at'),
+    'messages': ('conversation', 'group_id', 'timestamp', 'sender_id', 'content'),
+    'attachments': ('message_id', 'content_id', 'filename'),
+}
+
+
+def import_ndjson(db, lines, batch_size=10000, transaction_rows=200000, bulk=None, merge=None):
+    # Consecutive rows of a table go through executemany `batch_size` at a
+    # time, committed every `transaction_rows` rows, so memory stays bounded
+    # by one batch. Into an empty database rows keep their exported ids.
+    # Otherwise (`merge`, the default when there is data already) each row
+    # either matches an existing one by MATCHES and maps to it, or is
+    # inserted under a new id, and references to it are rewritten; so
+    # re-running an interrupted import is safe either way. Messages already
+    # archived in the target are not matched.
+    # With `bulk` (the default when there are no messages yet) message
+    # triggers are suspended and derived tables rebuilt once at the end.
+    # Returns the number of rows inserted per table.
+    reader = db.pool.reader()
+    if merge is None:
+        merge = reader.execute('''
+        SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM groups)
+            OR EXISTS (SELECT 1 FROM messages) OR EXISTS (SELECT 1 FROM message_archives)
+            OR EXISTS (SELECT 1 FROM attachment_contents)
+        ''').fetchone()[0]
+    if bulk is None:
+        bulk = reader.execute('SELECT NOT EXISTS (SELECT 1 FROM messages)').fetchone()[0]
+    if bulk:
+        with db.bulk_messages():
+            return import_ndjson(db, lines, batch_size, transaction_rows, bulk=False, merge=merge)
+
+    counts = dict.fromkeys(TABLES, 0)
+    ids = {table: {} for table in TABLES}  # exported id -> id here, where they differ
+    claimed = {table: set() for table in MATCHES}  # rows here matched or inserted by this import
+    fresh_contents = set()  # contents inserted by this import, whose chunks get written
+    statements = {
+        table: f'INSERT OR IGNORE INTO {table} ({", ".join(columns)}) '
+               f'VALUES ({", ".join("?" * len(columns))})'
+        for table, columns in TABLES.items()
+    }
+    pending = batches(parse_records(lines), batch_size)
+    batch = next(pending, None)
+    while batch is not None:
+        written = 0
+        with db.pool.write() as conn:
+            while batch is not None:
+                table, rows = batch
+                if table == 'attachment_contents':
+                    counts[table] += insert_contents(conn, rows, ids[table], fresh_contents)
+                elif table == 'attachment_chunks':
+                    counts[table] += write_chunks(conn, rows, ids['attachment_contents'], fresh_contents)
+                else:
+                    rows = remap(table, rows, ids)
+                    if merge and table in MATCHES:
+                        counts[table] += merge_rows(conn, table, rows, ids[table], claimed[table])
+                    else:
+                        counts[table] += conn.executemany(statements[table], rows).rowcount
+                written += len(rows)
+                batch = next(pending, None)
+                # A content row is committed together with all its chunks
+                if written >= transaction_rows and (batch is None or batch[0] != 'attachment_chunks'):
+                    break
+    return counts
+
+
+def remap(table, rows, ids):
+    references = REFERENCES.get(table, {})
+    positions = [(position, ids[references[column]]) for position, column in enumerate(TABLES[table])
+                 if column in references and ids[references[column]]]
+    if not positions:
+        return rows
+    remapped = []
+    for row in rows:
+        row = list(row)
+        for position, mapping in positions:
+            row[position] = mapping.get(row[position], row[position])
+        if table == 'messages' and row[2] is not None:
+            row[7] = conversation_key(row[1], row[2])
+        remapped.append(tuple(row))
+    return remapped
+
+
+def merge_rows(conn, table, rows, mapping, claimed):
+    # One at a time: a row matching one here that this import has not used
+    # yet maps to it (so identical rows in the export stay separate), the
+    # rest are inserted under new ids
+    columns = TABLES[table]
+    positions = [columns.index(column) for column in MATCHES[table]]
+    match = (f'SELECT id FROM {table} WHERE '
+             + ' AND '.join(f'{column} IS ?' for column in MATCHES[table]) + ' ORDER BY id')
+    insert = f'INSERT INTO {table} ({", ".join(columns[1:])}) VALUES ({", ".join("?" * (len(columns) - 1))})'
+    inserted = 0
+    for row in rows:
+        candidates = conn.execute(match, [row[position] for position in positions]).fetchall()
+        local_id = next((candidate for candidate, in candidates if candidate not in claimed), None)
+        if local_id is None:
+            local_id = conn.execute(insert, row[1:]).lastrowid
+            inserted += 1
+        claimed.add(local_id)
+        if local_id != row[0]:
+            mapping[row[0]] = local_id
+    return inserted
+
+
+def insert_contents(conn, rows, mapping, fresh_contents):
+    # One at a time: content already stored here (by hash) is reused and its
+    # chunks skipped; new content whose id is taken gets a fresh id
+    inserted = 0
+    for row in rows:
+        content_id, sha256, size, stored_size, compression = row
+        existing = conn.execute('SELECT id FROM attachment_contents WHERE sha256 = ?', (sha256,)).fetchone()
+        if existing is not None:
+            local_id = existing[0]
+        else:
+            if conn.execute('SELECT 1 FROM attachment_contents WHERE id = ?', (content_id,)).fetchone():
+                row = (None,) + row[1:]
+            local_id = conn.execute(CONTENT_INSERT, row + (stored_size,)).lastrowid
+            fresh_contents.add(local_id)
+            inserted += 1
+        if local_id != content_id:
+            mapping[content_id] = local_id
+    return inserted
+
+
+def write_chunks(conn, rows, mapping, fresh_contents):
+    written = 0
+    for content_id, offset, data in rows:
+        local_id = mapping.get(content_id, content_id)
+        if local_id in fresh_contents:
+            with conn.blobopen('attachment_contents', 'data', local_id) as blob:
+                blob.seek(offset)
+                blob.write(base64.b64decode(data))
+            written += 1
+    return written
+
+
+def parse_records(lines):
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            table = record['table']
+            columns = TABLES[table]
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(f'line {line_number}: invalid record ({error!r})') from None
+        if table == 'messages' and record.get('conversation') is None and record.get('receiver_id') is not None:
+            record['conversation'] = conversation_key(record['sender_id'], record['receiver_id'])
+        yield table, tuple(record.get(column) for column in columns)
+
+
+def batches(records, batch_size):
+    for table, group in itertools.groupby(records, key=itemgetter(0)):
+        # Content chunks are large; one at a time keeps memory bounded
+        size = 1 if table == 'attachment_chunks' else batch_size
+        while True:
+            rows = [row for _, row in itertools.islice(group, size)]
+            if not rows:
+                break
+            yield table, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export or import all data as NDJSON (gzip if the path ends in .gz).')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('path', help="file to write or read, '-' for stdout/stdin")
+    parser.add_argument('--db', default='messaging_app.db')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    started = time.perf_counter()
+    if args.command == 'export':
+        stream = open_stream(args.path, 'w')
+        try:
+            counts = export_ndjson(db, stream, args.batch_size)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+    else:
+        stream = open_stream(args.path, 'r')
+        try:
+            counts = import_ndjson(db, stream, args.batch_size)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    db.close()
+    summary = ', '.join(f'{count} {table}' for table, count in counts.items())
+    print(f'{args.command}ed {summary} in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
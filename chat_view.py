@@ -0,0 +1,174 @@
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QPersistentModelIndex, QPoint, QRect, QSize
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter
+from PyQt6.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate
+
+MESSAGE_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+class MessageListModel(QAbstractListModel):
+    # Rows are (message_id, sender, content, timestamp, is_me), oldest first
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self.messages[index.row()]
+        if role == MESSAGE_ROLE:
+            return message
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message[2]
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = []
+        self.endResetModel()
+
+    def append_messages(self, messages):
+        if not messages:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.messages), len(self.messages) + len(messages) - 1)
+        self.messages.extend(messages)
+        self.endInsertRows()
+
+    def prepend_messages(self, messages):
+        if not messages:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(messages) - 1)
+        self.messages[:0] = messages
+        self.endInsertRows()
+
+
+class MessageBubbleDelegate(QStyledItemDelegate):
+    # Lays out a chat bubble once per message and viewport width and keeps the
+    # result, so scrolling only paints cached geometry for visible rows. The
+    # view lays out every loaded row whenever rows are added, so the cache
+    # holds at least one layout per loaded row (otherwise each scroll-back
+    # would re-measure them all), and at least CACHE_SIZE; ChatView.clear
+    # empties it.
+    MARGIN = 5
+    PADDING = 8
+    SPACING = 4
+    MAX_WIDTH_RATIO = 0.7
+    TEXT_FLAGS = Qt.TextFlag.TextWordWrap | Qt.TextFlag.TextWrapAnywhere
+    CACHE_SIZE = 2000
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self._layouts = OrderedDict()
+        self._layout_width = None
+        self._header_font = None
+        self._header_base = None
+
+    def bubble_layout(self, option, message):
+        width = self.view.viewport().width()
+        if width != self._layout_width:
+            self._layouts.clear()
+            self._layout_width = width
+        layout = self._layouts.get(message[0])
+        if layout is None:
+            layout = self._layouts[message[0]] = self.compute_layout(option, message, width)
+            if len(self._layouts) > max(self.CACHE_SIZE, self.view.model().rowCount()):
+                self._layouts.popitem(last=False)
+        else:
+            self._layouts.move_to_end(message[0])
+        return layout
+
+    def clear_layouts(self):
+        self._layouts.clear()
+
+    def header_font(self, option):
+        if self._header_font is None or self._header_base != option.font:
+            font = QFont(option.font)
+            # Style sheets may size the font in pixels rather than points
+            if font.pixelSize() > 0:
+                font.setPixelSize(max(round(font.pixelSize() * 0.85), 1))
+            else:
+                font.setPointSizeF(font.pointSizeF() * 0.85)
+            font.setBold(True)
+            self._header_base = QFont(option.font)
+            self._header_font = font
+        return self._header_font
+
+    def compute_layout(self, option, message, width):
+        message_id, sender, content, timestamp, is_me = message
+        text_width = max(int(width * self.MAX_WIDTH_RATIO) - 2 * self.PADDING, 1)
+        bounds = QRect(0, 0, text_width, 1 << 20)
+        header = QFontMetrics(self.header_font(option)).boundingRect(
+            bounds, self.TEXT_FLAGS, f"{sender} - {timestamp}")
+        body = QFontMetrics(option.font).boundingRect(bounds, self.TEXT_FLAGS, content)
+        bubble = QSize(min(max(header.width(), body.width()), text_width) + 2 * self.PADDING,
+                       header.height() + self.SPACING + body.height() + 2 * self.PADDING)
+        return bubble, header.height(), body.height()
+
+    def sizeHint(self, option, index):
+        bubble, _, _ = self.bubble_layout(option, index.data(MESSAGE_ROLE))
+        return QSize(self._layout_width, bubble.height() + 2 * self.MARGIN)
+
+    def paint(self, painter, option, index):
+        message = index.data(MESSAGE_ROLE)
+        message_id, sender, content, timestamp, is_me = message
+        bubble, header_height, body_height = self.bubble_layout(option, message)
+
+        left = option.rect.right() - self.MARGIN - bubble.width() if is_me else option.rect.left() + self.MARGIN
+        bubble_rect = QRect(QPoint(left, option.rect.top() + self.MARGIN), bubble)
+        text_rect = bubble_rect.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING)
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor("#DCF8C6") if is_me else QColor("#ECECEC"))
+        painter.drawRoundedRect(bubble_rect, 8, 8)
+
+        painter.setPen(QColor("#333333"))
+        painter.setFont(self.header_font(option))
+        painter.drawText(QRect(text_rect.left(), text_rect.top(), text_rect.width(), header_height),
+                         self.TEXT_FLAGS, f"{sender} - {timestamp}")
+        painter.setFont(option.font)
+        painter.setPen(QColor("black"))
+        painter.drawText(QRect(text_rect.left(), text_rect.top() + header_height + self.SPACING,
+                               text_rect.width(), body_height),
+                         self.TEXT_FLAGS, content)
+        painter.restore()
+
+
+class ChatView(QListView):
+    # Transcript view: a list of messages painted by MessageBubbleDelegate.
+    # Only rows intersecting the viewport are painted.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.chat_model = MessageListModel(self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(MessageBubbleDelegate(self))
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+
+    def clear(self):
+        self.chat_model.clear()
+        self.itemDelegate().clear_layouts()
+
+    def append_messages(self, messages):
+        self.chat_model.append_messages(messages)
+
+    def prepend_messages(self, messages):
+        # Keep the row at the top of the viewport where it is on screen
+        anchor = QPersistentModelIndex(self.indexAt(QPoint(0, 0)))
+        offset = self.visualRect(QModelIndex(anchor)).top() if anchor.isValid() else 0
+        self.chat_model.prepend_messages(messages)
+        self.doItemsLayout()
+        if anchor.isValid():
+            self.scrollTo(QModelIndex(anchor), QAbstractItemView.ScrollHint.PositionAtTop)
+            scrollbar = self.verticalScrollBar()
+            scrollbar.setValue(scrollbar.value() - offset)
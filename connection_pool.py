@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+
+class _ThreadToken:
+    # Lives in a thread's locals only, so it is collected when the thread exits
+    pass
+
+
+class ConnectionPool:
+    # One connection per reading thread plus a single writer connection that is
+    # only ever used under the write lock. In WAL mode readers never block the
+    # writer and the writer never blocks readers. A reading thread's
+    # connection is closed when the thread exits, e.g. when QThreadPool
+    # retires an idle worker.
+
+    def __init__(self, path, busy_timeout=5.0, cache_size_kib=64000, mmap_size=256 * 1024 * 1024,
+                 factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self.busy_timeout = busy_timeout
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Time spent waiting for the write lock in this process; waits on
+        # other processes happen inside SQLite and show up as write latency
+        self.write_count = 0
+        self.write_wait = 0.0
+
+        self.writer = self._connect()
+        self.writer.execute('PRAGMA journal_mode=WAL')
+
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                               factory=self.factory)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{self.cache_size_kib}')
+        conn.execute(f'PRAGMA mmap_size={self.mmap_size}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if read_only:
+            conn.execute('PRAGMA query_only=ON')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(read_only=True)
+            self._local.token = token = _ThreadToken()
+            weakref.finalize(token, self._release, conn)
+        return conn
+
+    def _release(self, conn):
+        with self._connections_lock:
+            if conn not in self._connections:
+                return  # already closed by close()
+            self._connections.remove(conn)
+        conn.close()
+
+    def open_connections(self):
+        with self._connections_lock:
+            return len(self._connections)
+
+    @contextmanager
+    def write(self):
+        # Serializes writers inside this process; busy_timeout covers writers
+        # in other processes sharing the same file.
+        started = time.perf_counter()
+        with self._write_lock:
+            self.write_count += 1
+            self.write_wait += time.perf_counter() - started
+            try:
+                yield self.writer
+            except BaseException:
+                self.writer.rollback()
+                raise
+            else:
+                self.writer.commit()
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = 600000
+SALT_BYTES = 16
+
+
+# Hashes are stored as "pbkdf2_sha256$<iterations>$<salt>$<digest>" with
+# base64 salt and digest. Anything else in the password column is a legacy
+# plaintext password from before hashing was introduced.
+
+def encode_hash(iterations, salt, digest):
+    return '$'.join([ALGORITHM, str(iterations),
+                     base64.b64encode(salt).decode('ascii'),
+                     base64.b64encode(digest).decode('ascii')])
+
+
+def parse_hash(stored):
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != ALGORITHM:
+        return None
+    try:
+        return int(parts[1]), base64.b64decode(parts[2]), base64.b64decode(parts[3])
+    except ValueError:
+        return None
+
+
+def hash_password(password, iterations=DEFAULT_ITERATIONS):
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return encode_hash(iterations, salt, digest)
+
+
+def check_password(password, stored, iterations=DEFAULT_ITERATIONS):
+    # Returns (matches, new_hash). new_hash is set when the password matched
+    # but `stored` is plaintext or uses a different work factor.
+    parsed = parse_hash(stored)
+    if parsed is None:
+        matches = hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+        return matches, hash_password(password, iterations) if matches else None
+
+    stored_iterations, salt, digest = parsed
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, stored_iterations)
+    if not hmac.compare_digest(candidate, digest):
+        return False, None
+    if stored_iterations != iterations:
+        return True, hash_password(password, iterations)
+    return True, None
+
+
+class CredentialService:
+    # Runs password hashing in worker processes so the KDF cost never blocks
+    # the GUI thread. Methods return concurrent.futures.Future objects.
+
+    def __init__(self, iterations=DEFAULT_ITERATIONS, max_workers=None):
+        self.iterations = iterations
+        self.max_workers = max_workers
+        self._executor = None
+
+    def executor(self):
+        # Started on first use; spawn avoids forking a process that runs Qt threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def hash(self, password):
+        return self.executor().submit(hash_password, password, self.iterations)
+
+    def verify(self, password, stored):
+        return self.executor().submit(check_password, password, stored, self.iterations)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
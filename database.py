@@ -1,17 +1,125 @@
-import sqlite3
-from datetime import datetime
-from PyQt6.QtCore import QObject, pyqtSignal
+import mimetypes
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from concurrent.futures import Future
+from connection_pool import ConnectionPool
+from write_queue import WriteQueue
+from archive import MessageArchive
+from attachments import AttachmentStore, format_size
+from user_cache import UserCache
+from presence import PresenceTracker
+from models import User, Message, Group
+
+CHANGE_LOG_SIZE = 10000
+
+# Dropped during Database.bulk_messages and recreated at its end
+MESSAGE_INSERT_TRIGGERS = ('messages_fts_insert', 'summaries_direct_insert', 'summaries_group_insert')
+
+# Database methods run in order by create_tables, each once per database;
+# PRAGMA user_version counts those applied. Only ever append.
+MIGRATIONS = ('create_schema', 'create_attachment_tables', 'create_contact_indexes', 'rebuild_message_search')
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Who can see a message, as FTS5 tokens: 'u<id>' for both users of a direct
+# message, 'g<id>' for a group message
+MESSAGE_SCOPE = ("CASE WHEN {0}.group_id IS NOT NULL THEN 'g' || {0}.group_id "
+                 "ELSE 'u' || {0}.sender_id || ' u' || {0}.receiver_id END")
+
+MESSAGE_COLUMNS = 'id, sender_id, receiver_id, group_id, content, timestamp, is_read'
+
+DIRECT_HISTORY_QUERY = f'''
+SELECT {MESSAGE_COLUMNS} FROM messages m
+WHERE m.conversation = ?
+'''
+
+# Sender names are added from the user cache, see with_sender_names
+GROUP_HISTORY_QUERY = f'''
+SELECT {MESSAGE_COLUMNS} FROM messages m
+WHERE m.group_id = ?
+'''
+
+
+def conversation_key(user1_id, user2_id):
+    # Direct conversations are keyed by the ordered pair of participants so both
+    # directions of a chat share one index range.
+    low, high = sorted((user1_id, user2_id))
+    return f"{low}:{high}"
+
+
+def record_factory(record_type):
+    # row_factory that builds `record_type` from the selected columns in order
+    def build(cursor, row):
+        return record_type(*row)
+    return build
+
+
+USER_RECORD = record_factory(User)
+MESSAGE_RECORD = record_factory(Message)
+GROUP_RECORD = record_factory(Group)
+
+
+def fts_query(search_term):
+    # Turn free text into an FTS5 query that prefix-matches every word. Words
+    # are quoted so user input can never be parsed as FTS5 syntax.
+    words = [word.replace('"', '""') for word in search_term.split() if any(c.isalnum() for c in word)]
+    return ' '.join(f'"{word}"*' for word in words)
+
 
 class Database(QObject):
     user_status_changed = pyqtSignal(int, bool)  # user_id, is_online
+    # Emitted by poll_changes for commits from any connection or process
+    new_message = pyqtSignal(list)  # Message records, oldest first
+    user_updated = pyqtSignal(list)  # (id, first_name, last_name, email, is_online, last_seen)
+    group_changed = pyqtSignal(list)  # (group_id, name, created_by, created_at, new_member_id)
+    # The watcher fell further behind than change_log reaches: reload
+    changes_lost = pyqtSignal()
     
-    def __init__(self):
+    def __init__(self, path='messaging_app.db', batch_writes=False, stats=None, user_cache_size=10000):
         super().__init__()
-        self.conn = sqlite3.connect('messaging_app.db', check_same_thread=False)
+        # With a QueryStats, every statement and public method is timed
+        self.stats = stats
+        if stats is not None:
+            self.pool = ConnectionPool(path, factory=stats.connection_factory())
+        else:
+            self.pool = ConnectionPool(path)
+        self._change_timer = None
+        self._watched_user = None
+        # Users rows by id, dropped on local writes and, while watch_changes
+        # runs, on changes committed by other processes
+        self.users = UserCache(user_cache_size)
+        self.archive = MessageArchive(self.pool)
+        self.attachments = AttachmentStore()
+        self.presence = PresenceTracker(self)
+        self.user_status_changed.connect(self.presence.note)
         self.create_tables()
+        # With batch_writes, writes from all threads are group-committed by a
+        # background WriteQueue instead of committing one row at a time.
+        self.write_queue = WriteQueue(self.pool) if batch_writes else None
+        if stats is not None:
+            stats.instrument(self)
     
     def create_tables(self):
-        cursor = self.conn.cursor()
+        # Only two reads when the schema is current; otherwise applies the
+        # missing migrations in one transaction.
+        reader = self.pool.reader()
+        if reader.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            if self.message_triggers_missing(reader):
+                self.restore_message_triggers()
+            return
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            # Another process may have migrated in the meantime
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                getattr(self, migration)(cursor)
+            cursor.execute(f'PRAGMA user_version = {max(version, SCHEMA_VERSION)}')
+    
+    def create_schema(self, cursor):
+        # Migration 1. Every statement is conditional, so it also upgrades
+        # databases created before schema versioning.
         
         # Users table
         cursor.execute('''
@@ -25,7 +133,7 @@ class Database(QObject):
             last_seen TIMESTAMP
         )
         ''')
-        
+    
         # Messages table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS messages (
@@ -36,6 +144,7 @@ class Database(QObject):
             content TEXT NOT NULL,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             is_read BOOLEAN DEFAULT FALSE,
+            conversation TEXT,
             FOREIGN KEY (sender_id) REFERENCES users(id),
             FOREIGN KEY (receiver_id) REFERENCES users(id),
             FOREIGN KEY (group_id) REFERENCES groups(id),
@@ -43,7 +152,7 @@ class Database(QObject):
                    (receiver_id IS NULL AND group_id IS NOT NULL))
         )
         ''')
-        
+    
         # Groups table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS groups (
@@ -54,7 +163,7 @@ class Database(QObject):
             FOREIGN KEY (created_by) REFERENCES users(id)
         )
         ''')
-        
+    
         # Group members table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS group_members (
@@ -66,36 +175,482 @@ class Database(QObject):
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
         ''')
+    
+        self.migrate_conversation_column(cursor)
+    
+        # History lookups are index range scans already in display order
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation
+        ON messages (conversation, timestamp, id)
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_group
+        ON messages (group_id, timestamp, id)
+        ''')
+        
+        self.create_search_tables(cursor)
+        self.create_summary_tables(cursor)
+        self.create_change_log(cursor)
+        self.archive.create_tables(cursor)
+        self.presence.create_tables(cursor)
+
+    def create_attachment_tables(self, cursor):
+        # Migration 2
+        self.attachments.create_tables(cursor)
+
+    def create_contact_indexes(self, cursor):
+        # Migration 3: users by status in id order, for contacts never talked to
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_status
+        ON users (is_online)
+        ''')
+    
+    def rebuild_message_search(self, cursor):
+        # Migration 4: messages_fts gains the scope column
+        for trigger in ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE IF EXISTS messages_fts')
+        self.create_search_tables(cursor)
+    
+    def migrate_conversation_column(self, cursor):
+        # Databases created before the conversation key existed get the column
+        # added and backfilled, in the migration's transaction.
+        cursor.execute('PRAGMA table_info(messages)')
+        if any(column[1] == 'conversation' for column in cursor.fetchall()):
+            return
+        cursor.execute('ALTER TABLE messages ADD COLUMN conversation TEXT')
+        cursor.execute('''
+        UPDATE messages
+        SET conversation = min(sender_id, receiver_id) || ':' || max(sender_id, receiver_id)
+        WHERE receiver_id IS NOT NULL
+        ''')
+    
+    def submit_write(self, sql, params=(), callback=None):
+        # Returns a Future resolving to the statement's lastrowid; `callback`
+        # is called with that future once the write is committed.
+        if self.write_queue is not None:
+            future = self.write_queue.submit(sql, params)
+        else:
+            future = Future()
+            try:
+                with self.pool.write() as conn:
+                    future.set_result(conn.execute(sql, params).lastrowid)
+            except Exception as error:
+                future.set_exception(error)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+    
+    def create_search_tables(self, cursor):
+        # External-content FTS5 indexes over users and messages, kept in sync by
+        # triggers. Status updates don't touch the indexed columns and so never
+        # fire the user triggers.
+        cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('users_fts', 'messages_fts')")
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            first_name, last_name, email,
+            content='users', content_rowid='id', prefix='2 3'
+        )
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, first_name, last_name, email)
+            VALUES (new.id, new.first_name, new.last_name, new.email);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, last_name, email)
+            VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update
+        AFTER UPDATE OF first_name, last_name, email ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, last_name, email)
+            VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+            INSERT INTO users_fts (rowid, first_name, last_name, email)
+            VALUES (new.id, new.first_name, new.last_name, new.email);
+        END
+        ''')
         
-        self.conn.commit()
+        # Messages are indexed with their scope, so a search can be limited
+        # to what one user may see inside the match. The scope column does
+        # not count towards rank.
+        cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS messages_search AS
+        SELECT id, content, {MESSAGE_SCOPE.format('messages')} AS scope FROM messages
+        ''')
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, scope,
+            content='messages_search', content_rowid='id', prefix='2 3'
+        )
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, scope)
+            VALUES (new.id, new.content, {MESSAGE_SCOPE.format('new')});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, scope)
+            VALUES ('delete', old.id, old.content, {MESSAGE_SCOPE.format('old')});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, scope)
+            VALUES ('delete', old.id, old.content, {MESSAGE_SCOPE.format('old')});
+            INSERT INTO messages_fts (rowid, content, scope)
+            VALUES (new.id, new.content, {MESSAGE_SCOPE.format('new')});
+        END
+        ''')
+        
+        # Index rows that predate the search tables
+        if 'users_fts' not in existing:
+            cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+        if 'messages_fts' not in existing:
+            cursor.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    
+    def create_summary_tables(self, cursor):
+        # One row per (user, conversation) with the unread count and latest
+        # message, maintained by triggers in the same transaction as the insert.
+        # Direct chats use the messages.conversation key, groups use 'g:<id>'.
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversation_summaries'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            user_id INTEGER NOT NULL,
+            conversation TEXT NOT NULL,
+            peer_id INTEGER,
+            group_id INTEGER,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER,
+            last_activity TIMESTAMP,
+            PRIMARY KEY (user_id, conversation),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_summaries_activity
+        ON conversation_summaries (user_id, last_activity)
+        ''')
+        
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS summaries_direct_insert
+        AFTER INSERT ON messages WHEN new.receiver_id IS NOT NULL BEGIN
+            INSERT INTO conversation_summaries
+                (user_id, conversation, peer_id, unread_count, last_message_id, last_activity)
+            VALUES (new.sender_id, new.conversation, new.receiver_id, 0, new.id, new.timestamp),
+                   (new.receiver_id, new.conversation, new.sender_id,
+                    new.sender_id != new.receiver_id AND NOT new.is_read, new.id, new.timestamp)
+            ON CONFLICT (user_id, conversation) DO UPDATE SET
+                unread_count = unread_count + excluded.unread_count,
+                last_message_id = CASE WHEN excluded.last_activity >= last_activity OR last_activity IS NULL
+                                       THEN excluded.last_message_id ELSE last_message_id END,
+                last_activity = max(coalesce(last_activity, excluded.last_activity), excluded.last_activity);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS summaries_group_insert
+        AFTER INSERT ON messages WHEN new.group_id IS NOT NULL BEGIN
+            INSERT INTO conversation_summaries
+                (user_id, conversation, group_id, unread_count, last_message_id, last_activity)
+            SELECT user_id, 'g:' || new.group_id, new.group_id, user_id != new.sender_id,
+                   new.id, new.timestamp
+            FROM group_members WHERE group_id = new.group_id
+            ON CONFLICT (user_id, conversation) DO UPDATE SET
+                unread_count = unread_count + excluded.unread_count,
+                last_message_id = CASE WHEN excluded.last_activity >= last_activity OR last_activity IS NULL
+                                       THEN excluded.last_message_id ELSE last_message_id END,
+                last_activity = max(coalesce(last_activity, excluded.last_activity), excluded.last_activity);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS summaries_member_insert
+        AFTER INSERT ON group_members BEGIN
+            INSERT OR IGNORE INTO conversation_summaries
+                (user_id, conversation, group_id, last_activity)
+            VALUES (new.user_id, 'g:' || new.group_id, new.group_id, new.joined_at);
+        END
+        ''')
+        # Lets mark_conversation_read find unread rows without walking the chat
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_unread
+        ON messages (conversation, receiver_id) WHERE is_read = FALSE
+        ''')
+        
+        if not exists:
+            self.backfill_summaries(cursor)
+    
+    def backfill_summaries(self, cursor):
+        # Summaries recomputed from the messages table in one pass. Existing
+        # group messages count as read since there is no per-member read state.
+        # The last message is the newest by (timestamp, id), as in the triggers,
+        # which for groups only see messages from after the member joined.
+        cursor.execute('DELETE FROM conversation_summaries')
+        cursor.execute('''
+        WITH direct AS (
+            SELECT sender_id AS user_id, receiver_id AS peer_id, conversation, id, timestamp,
+                   0 AS unread
+            FROM messages WHERE receiver_id IS NOT NULL
+            UNION ALL
+            SELECT receiver_id, sender_id, conversation, id, timestamp,
+                   sender_id != receiver_id AND NOT is_read
+            FROM messages WHERE receiver_id IS NOT NULL
+        ),
+        ranked AS (
+            SELECT user_id, conversation, peer_id, id, timestamp,
+                   sum(unread) OVER (PARTITION BY user_id, conversation) AS unread_count,
+                   row_number() OVER (PARTITION BY user_id, conversation
+                                      ORDER BY timestamp DESC, id DESC) AS position
+            FROM direct
+        )
+        INSERT INTO conversation_summaries
+            (user_id, conversation, peer_id, unread_count, last_message_id, last_activity)
+        SELECT user_id, conversation, peer_id, unread_count, id, timestamp
+        FROM ranked WHERE position = 1
+        ''')
+        cursor.execute('''
+        INSERT INTO conversation_summaries
+            (user_id, conversation, group_id, unread_count, last_message_id, last_activity)
+        SELECT gm.user_id, 'g:' || gm.group_id, gm.group_id, 0, latest.id,
+               coalesce(latest.timestamp, gm.joined_at)
+        FROM group_members gm
+        LEFT JOIN (
+            SELECT group_id, id, timestamp FROM (
+                SELECT group_id, id, timestamp,
+                       row_number() OVER (PARTITION BY group_id ORDER BY timestamp DESC, id DESC) AS position
+                FROM messages WHERE group_id IS NOT NULL
+            ) WHERE position = 1
+        ) latest ON latest.group_id = gm.group_id
+                AND (gm.joined_at IS NULL OR latest.timestamp >= gm.joined_at)
+        ''')
+    
+    @contextmanager
+    def bulk_messages(self):
+        # For loading many messages at once: the per-row insert triggers on
+        # messages are dropped meanwhile, and the search index and summaries
+        # are rebuilt in one pass at the end. Nothing else should write
+        # messages until the block exits. If the process dies first, the next
+        # Database opened on the file does the rebuild.
+        with self.pool.write() as conn:
+            for trigger in MESSAGE_INSERT_TRIGGERS:
+                conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        try:
+            yield
+        finally:
+            self.restore_message_triggers()
+    
+    def message_triggers_missing(self, conn):
+        cursor = conn.execute(f'''
+        SELECT count(*) FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({', '.join('?' * len(MESSAGE_INSERT_TRIGGERS))})
+        ''', MESSAGE_INSERT_TRIGGERS)
+        return cursor.fetchone()[0] < len(MESSAGE_INSERT_TRIGGERS)
+    
+    def restore_message_triggers(self):
+        # Recreates the triggers dropped by bulk_messages and rebuilds what
+        # they maintain from the messages table
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            self.create_search_tables(cursor)
+            self.create_summary_tables(cursor)
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            self.backfill_summaries(cursor)
+    
+    def create_change_log(self, cursor):
+        # Rows touched since a reader last looked, for changes that do not
+        # show up as a new id. Messages are append-only and need no log. Only
+        # the newest CHANGE_LOG_SIZE entries are kept.
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            row_id INTEGER NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS changes_user_insert
+        AFTER INSERT ON users BEGIN
+            INSERT INTO change_log (kind, row_id) VALUES ('user', new.id);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS changes_user_update
+        AFTER UPDATE OF first_name, last_name, email, is_online ON users BEGIN
+            INSERT INTO change_log (kind, row_id) VALUES ('user', new.id);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS changes_member_insert
+        AFTER INSERT ON group_members BEGIN
+            INSERT INTO change_log (kind, row_id) VALUES ('member', new.rowid);
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS change_log_trim
+        AFTER INSERT ON change_log BEGIN
+            DELETE FROM change_log WHERE id <= new.id - {CHANGE_LOG_SIZE};
+        END
+        ''')
+    
+    def watch_changes(self, interval=250, user_id=None):
+        # Polls PRAGMA data_version, which only moves when another connection
+        # (or process) commits, so an idle check costs one pragma. Must be
+        # called from the thread that owns this object's event loop. With
+        # `user_id`, new_message only carries messages that user can see.
+        self._watched_user = user_id
+        if self._change_timer is None:
+            cursor = self.pool.reader().cursor()
+            self._data_version = cursor.execute('PRAGMA data_version').fetchone()[0]
+            self._message_mark = cursor.execute('SELECT coalesce(max(id), 0) FROM messages').fetchone()[0]
+            self._change_mark = cursor.execute('SELECT coalesce(max(id), 0) FROM change_log').fetchone()[0]
+            self._change_timer = QTimer(self)
+            self._change_timer.timeout.connect(self.poll_changes)
+        self._change_timer.start(interval)
+    
+    def stop_watching(self):
+        # A later watch_changes starts again from the rows committed by then
+        if self._change_timer is not None:
+            self._change_timer.stop()
+            self._change_timer.deleteLater()
+            self._change_timer = None
+    
+    def poll_changes(self, batch_size=1000):
+        # Emits the rows committed since the last call. Can be called early,
+        # e.g. when another client announces a write.
+        if self._change_timer is None:
+            return
+        cursor = self.pool.reader().cursor()
+        data_version = cursor.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return
+        
+        # Other users' messages are skipped in SQL, so the rows built here
+        # follow the watched user's traffic rather than everyone's
+        newest = cursor.execute('SELECT coalesce(max(id), 0) FROM messages').fetchone()[0]
+        query = f'SELECT {MESSAGE_COLUMNS} FROM messages WHERE id > ? AND id <= ?'
+        params = (self._message_mark, newest)
+        if self._watched_user is not None:
+            query += '''
+            AND (sender_id = ? OR receiver_id = ? OR group_id IN (
+                SELECT group_id FROM conversation_summaries WHERE user_id = ? AND group_id IS NOT NULL))
+            '''
+            params += (self._watched_user,) * 3
+        message_cursor = self.pool.reader().cursor()
+        message_cursor.row_factory = MESSAGE_RECORD
+        message_cursor.execute(query + ' ORDER BY id LIMIT ?', params + (batch_size,))
+        messages = message_cursor.fetchall()
+        
+        lost = False
+        oldest = cursor.execute('SELECT min(id) FROM change_log').fetchone()[0]
+        if oldest is not None and oldest > self._change_mark + 1:
+            # Entries after the mark were trimmed: skip to the end of the log
+            lost = True
+            self._change_mark = cursor.execute('SELECT max(id) FROM change_log').fetchone()[0]
+        cursor.execute('''
+        SELECT id, kind, row_id FROM change_log WHERE id > ? ORDER BY id LIMIT ?
+        ''', (self._change_mark, batch_size))
+        changes = cursor.fetchall()
+        # A larger backlog is picked up on the following polls
+        if len(messages) < batch_size and len(changes) < batch_size:
+            self._data_version = data_version
+        self._message_mark = messages[-1].id if len(messages) == batch_size else newest
+        if lost:
+            self.changes_lost.emit()
+        
+        users = []
+        groups = []
+        if changes:
+            self._change_mark = changes[-1][0]
+            user_ids = list({row_id for _, kind, row_id in changes if kind == 'user'})
+            for user_id in user_ids:
+                self.users.invalidate(user_id)
+            member_rowids = list({row_id for _, kind, row_id in changes if kind == 'member'})
+            if user_ids:
+                cursor.execute(f'''
+                SELECT id, first_name, last_name, email, is_online, last_seen
+                FROM users WHERE id IN ({', '.join('?' * len(user_ids))})
+                ''', user_ids)
+                users = cursor.fetchall()
+            if member_rowids:
+                cursor.execute(f'''
+                SELECT g.id, g.name, g.created_by, g.created_at, gm.user_id
+                FROM group_members gm
+                JOIN groups g ON g.id = gm.group_id
+                WHERE gm.rowid IN ({', '.join('?' * len(member_rowids))})
+                ''', member_rowids)
+                groups = cursor.fetchall()
+        
+        # Users and memberships first, so receivers already know the rows
+        # that new messages refer to
+        if users:
+            self.user_updated.emit(users)
+        if groups:
+            self.group_changed.emit(groups)
+        if messages:
+            self.new_message.emit(messages)
     
     # User related methods
     def add_user(self, first_name, last_name, email, password):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        return self.submit_write('''
         INSERT INTO users (first_name, last_name, email, password)
         VALUES (?, ?, ?, ?)
-        ''', (first_name, last_name, email, password))
-        self.conn.commit()
-        return cursor.lastrowid
+        ''', (first_name, last_name, email, password)).result()
     
-    def get_user_by_email(self, email):
-        cursor = self.conn.cursor()
+    def update_user_password(self, user_id, password_hash):
+        self.submit_write('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id)).result()
+        self.users.invalidate(user_id)
+
+    def get_user_by_email(self, email, cached=True):
+        # cached=False always reads the committed row, e.g. to check a
+        # password that another process may just have changed
+        if cached:
+            row = self.users.get_by_email(email)
+            if row is not None:
+                return row
+        token = self.users.token()
+        cursor = self.pool.reader().cursor()
         cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        return cursor.fetchone()
+        row = cursor.fetchone()
+        if row is not None:
+            self.users.put(row, token)
+        return row
     
     def update_user_status(self, user_id, is_online):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        self.update_user_status_async(user_id, is_online).result()
+    
+    def update_user_status_async(self, user_id, is_online, callback=None):
+        # Immediate status change, e.g. at signup or logout; running clients
+        # stay online through presence.heartbeat
+        if not is_online:
+            self.presence.discard(user_id)
+        future = self.submit_write('''
         UPDATE users 
         SET is_online = ?, last_seen = ?
         WHERE id = ?
         ''', (is_online, datetime.now(), user_id))
-        self.conn.commit()
-        self.user_status_changed.emit(user_id, is_online)
+        
+        def notify(done):
+            if done.exception() is None:
+                self.users.invalidate(user_id)
+                self.user_status_changed.emit(user_id, is_online)
+        
+        future.add_done_callback(notify)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
     
     def get_online_users(self, exclude_user_id=None):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         if exclude_user_id:
             cursor.execute('''
             SELECT id, first_name, last_name, email 
@@ -112,56 +667,216 @@ class Database(QObject):
     
     # Message related methods
     def add_message(self, sender_id, receiver_id=None, group_id=None, content=""):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        INSERT INTO messages (sender_id, receiver_id, group_id, content)
-        VALUES (?, ?, ?, ?)
-        ''', (sender_id, receiver_id, group_id, content))
-        self.conn.commit()
-        return cursor.lastrowid
+        return self.add_message_async(sender_id, receiver_id, group_id, content).result()
+    
+    def add_message_async(self, sender_id, receiver_id=None, group_id=None, content="", callback=None):
+        conversation = conversation_key(sender_id, receiver_id) if receiver_id is not None else None
+        return self.submit_write('''
+        INSERT INTO messages (sender_id, receiver_id, group_id, content, conversation)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (sender_id, receiver_id, group_id, content, conversation), callback)
+    
+    def add_attachment_message(self, sender_id, receiver_id=None, group_id=None, path=None, caption="",
+                               compress=None):
+        # Sends the file at `path` as a message whose content describes it
+        # (and is searchable by file name). Identical files are stored once.
+        # Hashing happens before the write lock is taken; the content, message
+        # and link are then written in one transaction.
+        filename = os.path.basename(path)
+        with open(path, 'rb') as source:
+            prepared = self.attachments.prepare(source, compress)
+            content = f"📎 {filename} ({format_size(prepared.size)})"
+            if caption:
+                content += "\n" + caption
+            conversation = conversation_key(sender_id, receiver_id) if receiver_id is not None else None
+            with self.pool.write() as conn:
+                content_id = self.attachments.store(conn, prepared)
+                message_id = conn.execute('''
+                INSERT INTO messages (sender_id, receiver_id, group_id, content, conversation)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (sender_id, receiver_id, group_id, content, conversation)).lastrowid
+                self.attachments.attach(conn, message_id, content_id, filename,
+                                        mimetypes.guess_type(filename)[0], prepared.size)
+        return message_id
+    
+    def get_message_attachments(self, message_ids):
+        # Metadata only: (id, message_id, filename, mime_type, size)
+        return self.attachments.for_messages(self.pool.reader(), list(message_ids))
+    
+    def iter_attachment(self, attachment_id, chunk_size=256 * 1024):
+        # The file's bytes in chunks; consume on the thread that created it
+        return self.attachments.iter_content(self.pool.reader(), attachment_id, chunk_size)
+    
+    def save_attachment(self, attachment_id, path):
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in self.iter_attachment(attachment_id):
+                f.write(chunk)
+                written += len(chunk)
+        return written
     
     def get_messages(self, user1_id, user2_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT * FROM messages
-        WHERE (sender_id = ? AND receiver_id = ?) OR 
-              (sender_id = ? AND receiver_id = ?)
-        ORDER BY timestamp
-        ''', (user1_id, user2_id, user2_id, user1_id))
+        cursor = self.pool.reader().cursor()
+        cursor.execute(DIRECT_HISTORY_QUERY + ' ORDER BY m.timestamp, m.id',
+                       (conversation_key(user1_id, user2_id),))
         return cursor.fetchall()
     
     def get_group_messages(self, group_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT m.*, u.first_name, u.last_name 
-        FROM messages m
-        JOIN users u ON m.sender_id = u.id
-        WHERE m.group_id = ?
-        ORDER BY m.timestamp
-        ''', (group_id,))
-        return cursor.fetchall()
+        cursor = self.pool.reader().cursor()
+        cursor.execute(GROUP_HISTORY_QUERY + ' ORDER BY m.timestamp, m.id', (group_id,))
+        return self.with_sender_names(cursor.fetchall())
+    
+    def get_messages_page(self, user1_id, user2_id, before_id=None, limit=50):
+        # Latest `limit` messages of a direct chat older than `before_id`, as
+        # Message records, oldest first.
+        return self._message_page(DIRECT_HISTORY_QUERY, (conversation_key(user1_id, user2_id),),
+                                  before_id=before_id, limit=limit)
+    
+    def get_group_messages_page(self, group_id, before_id=None, limit=50):
+        return self._message_page(GROUP_HISTORY_QUERY, (group_id,), before_id=before_id, limit=limit)
+    
+    def get_messages_after(self, user1_id, user2_id, after_id, limit=50):
+        # Messages of a direct chat newer than `after_id`, oldest first.
+        return self._message_page(DIRECT_HISTORY_QUERY, (conversation_key(user1_id, user2_id),),
+                                  after_id=after_id, limit=limit)
+    
+    def get_group_messages_after(self, group_id, after_id, limit=50):
+        return self._message_page(GROUP_HISTORY_QUERY, (group_id,), after_id=after_id, limit=limit)
+    
+    def with_sender_names(self, rows):
+        # Message rows extended with the sender's first and last name
+        users = self.get_users(list({row[1] for row in rows}))
+        names = {user_id: (user[1], user[2]) for user_id, user in users.items()}
+        return [row + names.get(row[1], ('', '')) for row in rows]
+    
+    def get_user_names(self, user_ids):
+        # {id: "first last"}, from the user cache where possible
+        return {user_id: f"{user[1]} {user[2]}" for user_id, user in self.get_users(list(user_ids)).items()}
+    
+    def _message_page(self, query, params, before_id=None, after_id=None, limit=50):
+        # Keyset pagination on (timestamp, id) so every page is a bounded range
+        # scan of the history index, however deep the user has scrolled.
+        # Archived messages are only ever older than the hot ones, so only
+        # pages going backwards can reach them.
+        base_query, base_params = query, params
+        if after_id is not None:
+            query += '''
+            AND (m.timestamp, m.id) > (SELECT timestamp, id FROM messages WHERE id = ?)
+            ORDER BY m.timestamp, m.id LIMIT ?
+            '''
+            params += (after_id,)
+        elif before_id is not None:
+            query += '''
+            AND (m.timestamp, m.id) < (SELECT timestamp, id FROM messages WHERE id = ?)
+            ORDER BY m.timestamp DESC, m.id DESC LIMIT ?
+            '''
+            params += (before_id,)
+        else:
+            query += ' ORDER BY m.timestamp DESC, m.id DESC LIMIT ?'
+        conn = self.pool.reader()
+        cursor = conn.cursor()
+        cursor.row_factory = MESSAGE_RECORD
+        cursor.execute(query, params + (limit,))
+        messages = cursor.fetchall()
+        if after_id is None:
+            if len(messages) < limit:
+                messages += self._archived_page(conn, base_query, base_params, before_id, messages, limit)
+            messages.reverse()
+        return messages
+    
+    def _archived_page(self, conn, query, params, before_id, rows, limit):
+        # The hot table ran out before the page filled up: continue from the
+        # archives, attaching only the ones this page reaches
+        cursor = conn.cursor()
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM message_archives)')
+        if not cursor.fetchone()[0]:
+            return []
+        if rows:
+            anchor = (rows[-1].timestamp, rows[-1].id)
+        elif before_id is not None:
+            cursor.execute('SELECT timestamp, id FROM messages WHERE id = ?', (before_id,))
+            anchor = cursor.fetchone() or self.archive.find_message(conn, before_id)
+            if anchor is None:
+                return []
+        else:
+            anchor = None
+        return [Message(*row) for row in self.archive.page_before(conn, query, params, anchor, limit - len(rows))]
+    
+    # Streaming variants: generators yielding model records, fetched
+    # `batch_size` rows at a time. They read through the calling thread's
+    # connection, so consume them on the thread that created them.
+    def _stream(self, query, params, row_factory, batch_size):
+        cursor = self.pool.reader().cursor()
+        cursor.row_factory = row_factory
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    
+    def _stream_history(self, query, params, batch_size):
+        # Archived messages first, then the hot table
+        for row in self.archive.iter_archived(self.pool.reader(), query, params, batch_size):
+            yield Message(*row)
+        yield from self._stream(query + ' ORDER BY m.timestamp, m.id', params, MESSAGE_RECORD, batch_size)
+    
+    def iter_messages(self, user1_id, user2_id, batch_size=500):
+        # Whole direct chat as Message records, oldest first
+        return self._stream_history(DIRECT_HISTORY_QUERY, (conversation_key(user1_id, user2_id),), batch_size)
+    
+    def iter_group_messages(self, group_id, batch_size=500):
+        return self._stream_history(GROUP_HISTORY_QUERY, (group_id,), batch_size)
+    
+    def archive_messages(self, max_age_days=180, batch_size=5000):
+        # Moves messages older than `max_age_days` into per-month archive
+        # files; see archive.py. Archived messages drop out of search.
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+        return self.archive.archive_before(cutoff, batch_size)
+    
+    def iter_users(self, exclude_user_id=None, batch_size=500):
+        return self._stream('SELECT * FROM users WHERE id IS NOT ? ORDER BY id',
+                            (exclude_user_id,), USER_RECORD, batch_size)
+    
+    def iter_user_groups(self, user_id, batch_size=500):
+        return self._stream('''
+        SELECT g.* FROM groups g
+        JOIN group_members gm ON g.id = gm.group_id
+        WHERE gm.user_id = ?
+        ''', (user_id,), GROUP_RECORD, batch_size)
+    
+    def mark_conversation_read(self, user_id, peer_id=None, group_id=None):
+        # Clears the unread badge for one conversation of `user_id`; direct
+        # messages addressed to them are flagged read in the same transaction.
+        with self.pool.write() as conn:
+            if group_id is not None:
+                conversation = f"g:{group_id}"
+            else:
+                conversation = conversation_key(user_id, peer_id)
+                conn.execute('''
+                UPDATE messages SET is_read = TRUE
+                WHERE conversation = ? AND receiver_id = ? AND is_read = FALSE
+                ''', (conversation, user_id))
+            conn.execute('''
+            UPDATE conversation_summaries SET unread_count = 0
+            WHERE user_id = ? AND conversation = ?
+            ''', (user_id, conversation))
     
     # Group related methods
     def create_group(self, name, created_by):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        return self.submit_write('''
         INSERT INTO groups (name, created_by)
         VALUES (?, ?)
-        ''', (name, created_by))
-        group_id = cursor.lastrowid
-        self.conn.commit()
-        return group_id
+        ''', (name, created_by)).result()
     
     def add_group_member(self, group_id, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        self.submit_write('''
         INSERT OR IGNORE INTO group_members (group_id, user_id)
         VALUES (?, ?)
-        ''', (group_id, user_id))
-        self.conn.commit()
+        ''', (group_id, user_id)).result()
     
     def get_user_groups(self, user_id):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('''
         SELECT g.* FROM groups g
         JOIN group_members gm ON g.id = gm.group_id
@@ -169,37 +884,217 @@ class Database(QObject):
         ''', (user_id,))
         return cursor.fetchall()
     
+    def get_user_group_summaries(self, user_id, limit=-1, after=None):
+        # The user's groups with unread count and last activity, most recent
+        # first. `after` is (last_activity, group_id) of the last row of the
+        # previous page.
+        cursor = self.pool.reader().cursor()
+        bound = ''
+        params = (user_id,)
+        if after is not None:
+            bound = 'AND (s.last_activity, s.conversation) < (?, ?)'
+            params += (after[0], f"g:{after[1]}")
+        cursor.execute(f'''
+        SELECT g.id, g.name, g.created_by, g.created_at, s.unread_count, s.last_activity
+        FROM conversation_summaries s
+        JOIN groups g ON g.id = s.group_id
+        WHERE s.user_id = ? AND s.group_id IS NOT NULL {bound}
+        ORDER BY s.last_activity DESC, s.conversation DESC
+        LIMIT ?
+        ''', params + (limit,))
+        return cursor.fetchall()
+    
+    def get_recent_conversations(self, user_id, limit=50, after=None):
+        # The user's direct chats and groups, most recent first, with the last
+        # message. One range scan of the summaries index plus primary key
+        # lookups per row, so the cost follows the page size rather than the
+        # histories. `after` is (last_activity, conversation) of the last row
+        # of the previous page. Rows: (conversation, peer_id, group_id, title,
+        # unread_count, last_activity, message_id, sender_id, preview,
+        # sender_first_name, sender_last_name); the message columns are None
+        # for groups without messages and for archived last messages.
+        cursor = self.pool.reader().cursor()
+        bound = ''
+        params = (user_id,)
+        if after is not None:
+            bound = 'AND (s.last_activity, s.conversation) < (?, ?)'
+            params += tuple(after)
+        cursor.execute(f'''
+        SELECT s.conversation, s.peer_id, s.group_id,
+               coalesce(g.name, p.first_name || ' ' || p.last_name),
+               s.unread_count, s.last_activity, m.id, m.sender_id, substr(m.content, 1, 120)
+        FROM conversation_summaries s
+        LEFT JOIN users p ON p.id = s.peer_id
+        LEFT JOIN groups g ON g.id = s.group_id
+        LEFT JOIN messages m ON m.id = s.last_message_id
+        WHERE s.user_id = ? {bound}
+        ORDER BY s.last_activity DESC, s.conversation DESC
+        LIMIT ?
+        ''', params + (limit,))
+        rows = cursor.fetchall()
+        senders = self.get_users(list({row[7] for row in rows if row[7] is not None}))
+        return [row + (senders[row[7]][1:3] if row[7] in senders else (None, None)) for row in rows]
+    
     def close(self):
-        self.conn.close()
+        self.stop_watching()
+        self.presence.stop()
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.pool.close()
     
 
     # database.py ফাইলে
-    def search_user_by_email_or_name(self, search_term, exclude_user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT id, first_name, last_name, email, is_online 
-        FROM users 
-        WHERE (email LIKE ? OR first_name LIKE ? OR last_name LIKE ?) 
-        AND id != ?
-        ''', (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", exclude_user_id))
+    def search_user_by_email_or_name(self, search_term, exclude_user_id, limit=50, offset=0):
+        # One page of search_users without the snippet; page on with `offset`
+        return [row[:5] for row in self.search_users(search_term, exclude_user_id, limit, offset)]
+
+    def search_users(self, search_term, exclude_user_id=None, limit=20, offset=0):
+        # Ranked prefix search over names and email. The last column is a
+        # snippet of the best matching field with matches wrapped in <b>.
+        query = fts_query(search_term)
+        if not query:
+            return []
+        cursor = self.pool.reader().cursor()
+        cursor.execute('''
+        SELECT u.id, u.first_name, u.last_name, u.email, u.is_online,
+               snippet(users_fts, -1, '<b>', '</b>', '…', 8)
+        FROM users_fts
+        JOIN users u ON u.id = users_fts.rowid
+        WHERE users_fts MATCH ? AND u.id IS NOT ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        ''', (query, exclude_user_id, limit, offset))
+        return cursor.fetchall()
+
+    def search_messages(self, user_id, search_term, limit=20, offset=0):
+        # Ranked search over the messages `user_id` can see: their direct chats
+        # and the groups they belong to. The match itself is restricted to
+        # those scopes, so other users' messages are never matched or ranked.
+        query = fts_query(search_term)
+        if not query:
+            return []
+        cursor = self.pool.reader().cursor()
+        cursor.execute('''
+        SELECT group_id FROM conversation_summaries WHERE user_id = ? AND group_id IS NOT NULL
+        ''', (user_id,))
+        scope = ' OR '.join([f'u{user_id}'] + [f'g{group_id}' for group_id, in cursor.fetchall()])
+        cursor.execute('''
+        SELECT m.id, m.sender_id, m.receiver_id, m.group_id, m.content,
+               m.timestamp, m.is_read,
+               snippet(messages_fts, 0, '<b>', '</b>', '…', 12)
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        ''', (f'content : ({query}) AND scope : ({scope})', limit, offset))
         return cursor.fetchall()
 
     def get_user_by_id(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        return cursor.fetchone()
+        row = self.users.get(user_id)
+        if row is None:
+            row = self.get_users([user_id]).get(user_id)
+        return row
+    
+    def get_users(self, user_ids):
+        # {id: users row} for the ids that exist, reading only the ones the
+        # cache doesn't hold, in one query
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            row = self.users.get(user_id)
+            if row is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = row
+        if missing:
+            token = self.users.token()
+            cursor = self.pool.reader().cursor()
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                cursor.execute(f'SELECT * FROM users WHERE id IN ({", ".join("?" * len(chunk))})', chunk)
+                for row in cursor.fetchall():
+                    self.users.put(row, token)
+                    found[row[0]] = row
+        return found
     
     def get_all_users(self, exclude_user_id=None):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         if exclude_user_id:
             cursor.execute('''
-            SELECT id, first_name, last_name, email 
+            SELECT id, first_name, last_name, email, is_online
             FROM users 
             WHERE id != ?
             ''', (exclude_user_id,))
         else:
             cursor.execute('''
-            SELECT id, first_name, last_name, email 
+            SELECT id, first_name, last_name, email, is_online
             FROM users
             ''')
         return cursor.fetchall()
+    
+    def get_user_contacts(self, user_id, online_only=False, limit=-1, after=None):
+        # Every other user with the unread count and last activity of their
+        # direct chat with `user_id`: online users first, then offline ones;
+        # within each, chats by most recent activity, then users never talked
+        # to by id. `after` is (is_online, last_activity, id) of the last row
+        # of the previous page. Each of those parts is a range scan of an
+        # index already in that order, so a page costs the same at any depth.
+        parts = [(is_online, talked) for is_online in (True, False) for talked in (True, False)]
+        if online_only:
+            parts = parts[:2]
+        first = 0
+        if after is not None:
+            part = (bool(after[0]), after[1] is not None)
+            if part not in parts:
+                return []
+            first = parts.index(part)
+        rows = []
+        for position in range(first, len(parts)):
+            remaining = limit - len(rows) if limit >= 0 else -1
+            if remaining == 0:
+                break
+            is_online, talked = parts[position]
+            bound = after if position == first else None
+            if talked:
+                rows += self._talked_contacts(user_id, is_online, bound, remaining)
+            else:
+                rows += self._other_contacts(user_id, is_online, bound, remaining)
+        return rows
+    
+    def _talked_contacts(self, user_id, is_online, after, limit):
+        # Conversation partners, in idx_summaries_activity order
+        bound = ''
+        params = (user_id, user_id, is_online)
+        if after is not None:
+            bound = 'AND (s.last_activity, s.conversation) < (?, ?)'
+            params += (after[1], conversation_key(user_id, after[2]))
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'''
+        SELECT u.id, u.first_name, u.last_name, u.email, u.is_online, s.unread_count, s.last_activity
+        FROM conversation_summaries s
+        JOIN users u ON u.id = s.peer_id
+        WHERE s.user_id = ? AND s.peer_id != ? AND u.is_online = ? {bound}
+        ORDER BY s.last_activity DESC, s.conversation DESC
+        LIMIT ?
+        ''', params + (limit,))
+        return cursor.fetchall()
+    
+    def _other_contacts(self, user_id, is_online, after, limit):
+        # Users without a conversation, in idx_users_status order
+        bound = ''
+        params = (is_online, user_id)
+        if after is not None:
+            bound = 'AND u.id > ?'
+            params += (after[2],)
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'''
+        SELECT u.id, u.first_name, u.last_name, u.email, u.is_online, 0, NULL
+        FROM users u
+        WHERE u.is_online = ? AND u.id != ? {bound}
+          AND NOT EXISTS (SELECT 1 FROM conversation_summaries s
+                          WHERE s.user_id = ? AND s.conversation = min(u.id, ?) || ':' || max(u.id, ?))
+        ORDER BY u.id
+        LIMIT ?
+        ''', params + (user_id, user_id, user_id, limit))
+        return cursor.fetchall()
@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import json
+import sys
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Wire format: one JSON object per line. Clients send
+#   {"type": "hello", "user_id": 1, "groups": [3, 4]}
+#   {"type": "subscribe", "groups": [5]}
+#   {"type": "message", "message_id": 9, "sender_id": 1, "receiver_id": 2, "group_id": null}
+#   {"type": "presence", "user_id": 1, "is_online": true}
+#   {"type": "typing", "user_id": 1, "receiver_id": 2, "group_id": null}
+# and receive the same message/presence/typing events from other clients,
+# plus {"type": "resync"} when events had to be dropped. Events only carry
+# ids; clients read the rows themselves from the shared database.
+
+
+class Client:
+    def __init__(self, writer, max_queue):
+        self.writer = writer
+        self.queue = asyncio.Queue(max_queue)
+        self.user_id = None
+        self.groups = set()
+        self.overflowed = False
+
+    def send(self, event):
+        # Never blocks the hub. A client that stops reading loses its queued
+        # events and is told to resync instead; typing events are just dropped.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if event['type'] == 'typing':
+                return
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+
+
+class DeliveryHub:
+    def __init__(self, max_queue=1000, max_batch=200):
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.clients = set()
+        self.users = {}  # user_id -> set of Client
+        self.group_members = {}  # group_id -> set of Client
+
+    async def handle_connection(self, reader, writer):
+        client = Client(writer, self.max_queue)
+        self.clients.add(client)
+        sender = asyncio.create_task(self.send_loop(client))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    self.dispatch(client, event)
+        except ConnectionError:
+            pass
+        finally:
+            self.disconnect(client)
+            sender.cancel()
+            writer.close()
+
+    async def send_loop(self, client):
+        # Writes everything queued so far in one batch, then waits for the
+        # socket buffer to drain before taking more
+        try:
+            while True:
+                batch = [await client.queue.get()]
+                while len(batch) < self.max_batch and not client.queue.empty():
+                    batch.append(client.queue.get_nowait())
+                client.overflowed = False
+                client.writer.write(b''.join(json.dumps(event).encode() + b'\n' for event in batch))
+                await client.writer.drain()
+        except ConnectionError:
+            pass
+
+    def dispatch(self, client, event):
+        kind = event.get('type')
+        if kind == 'hello':
+            self.register(client, event.get('user_id'), event.get('groups', ()))
+        elif client.user_id is None:
+            return
+        elif kind == 'subscribe':
+            self.subscribe(client, event.get('groups', ()))
+        elif kind == 'message':
+            self.route(client, event, include_sender=True)
+        elif kind == 'typing':
+            self.route(client, event, include_sender=False)
+        elif kind == 'presence':
+            self.broadcast(client, event)
+
+    def register(self, client, user_id, groups):
+        if client.user_id is not None or not isinstance(user_id, int):
+            return
+        client.user_id = user_id
+        first_session = user_id not in self.users
+        self.users.setdefault(user_id, set()).add(client)
+        self.subscribe(client, groups)
+        # Who is already connected
+        for other_id in self.users:
+            if other_id != user_id:
+                client.send({'type': 'presence', 'user_id': other_id, 'is_online': True})
+        if first_session:
+            self.broadcast(client, {'type': 'presence', 'user_id': user_id, 'is_online': True})
+
+    def subscribe(self, client, groups):
+        for group_id in groups:
+            client.groups.add(group_id)
+            self.group_members.setdefault(group_id, set()).add(client)
+
+    def disconnect(self, client):
+        self.clients.discard(client)
+        for group_id in client.groups:
+            members = self.group_members.get(group_id)
+            if members is not None:
+                members.discard(client)
+                if not members:
+                    del self.group_members[group_id]
+        sessions = self.users.get(client.user_id)
+        if sessions is not None:
+            sessions.discard(client)
+            if not sessions:
+                del self.users[client.user_id]
+                self.broadcast(client, {'type': 'presence', 'user_id': client.user_id, 'is_online': False})
+
+    def route(self, origin, event, include_sender):
+        if event.get('group_id') is not None:
+            targets = self.group_members.get(event['group_id'], ())
+        else:
+            targets = set(self.users.get(event.get('receiver_id'), ()))
+            if include_sender:
+                # The sender's other sessions
+                targets |= self.users.get(origin.user_id, set())
+        for client in targets:
+            if client is not origin:
+                client.send(event)
+
+    def broadcast(self, origin, event):
+        for client in self.clients:
+            if client is not origin and client.user_id is not None:
+                client.send(event)
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fan out chat events between running clients.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--max-queue', type=int, default=1000, help='events buffered per client')
+    args = parser.parse_args(argv)
+
+    hub = DeliveryHub(max_queue=args.max_queue)
+    try:
+        asyncio.run(hub.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import json
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtNetwork import QAbstractSocket, QLocalSocket, QTcpSocket
+
+from delivery_hub import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_HUB_ADDRESS = f'{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+
+class HubClient(QObject):
+    # Connection to the delivery hub (delivery_hub.py) on the GUI thread.
+    # `address` is "host:port" or a Unix socket path. Events published while
+    # disconnected are dropped; the hub is optional and the app keeps working
+    # from the database alone, reconnecting in the background.
+    message_received = pyqtSignal(dict)
+    presence_changed = pyqtSignal(int, bool)
+    typing_received = pyqtSignal(dict)
+    resync_requested = pyqtSignal()  # events were missed
+    RECONNECT_DELAYS = (500, 1000, 2000, 5000, 10000)  # ms
+
+    def __init__(self, address=DEFAULT_HUB_ADDRESS, parent=None):
+        super().__init__(parent)
+        self.address = address
+        self.user_id = None
+        self.groups = set()
+        self.attempt = 0
+        self.closing = False
+        self.connected_before = False
+        self.buffer = b''
+
+        if ':' in address and not address.startswith('/'):
+            self.socket = QTcpSocket(self)
+        else:
+            self.socket = QLocalSocket(self)
+        self.socket.connected.connect(self.on_connected)
+        self.socket.disconnected.connect(self.schedule_reconnect)
+        self.socket.readyRead.connect(self.on_ready_read)
+        self.socket.errorOccurred.connect(self.on_error)
+
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self.open_socket)
+
+    def start(self, user_id, groups=()):
+        self.user_id = user_id
+        self.groups = set(groups)
+        self.closing = False
+        self.open_socket()
+
+    def open_socket(self):
+        if isinstance(self.socket, QTcpSocket):
+            host, port = self.address.rsplit(':', 1)
+            self.socket.connectToHost(host, int(port))
+        else:
+            self.socket.connectToServer(self.address)
+
+    def close(self):
+        self.closing = True
+        self.reconnect_timer.stop()
+        if isinstance(self.socket, QTcpSocket):
+            self.socket.disconnectFromHost()
+        else:
+            self.socket.disconnectFromServer()
+
+    def is_connected(self):
+        if isinstance(self.socket, QTcpSocket):
+            return self.socket.state() == QAbstractSocket.SocketState.ConnectedState
+        return self.socket.state() == QLocalSocket.LocalSocketState.ConnectedState
+
+    def on_connected(self):
+        self.attempt = 0
+        self.buffer = b''
+        self.send({'type': 'hello', 'user_id': self.user_id, 'groups': sorted(self.groups)})
+        if self.connected_before:
+            # Anything sent while we were away has to be picked up from the database
+            self.resync_requested.emit()
+        self.connected_before = True
+
+    def on_error(self, error):
+        # A failed connect attempt does not emit disconnected
+        if not self.is_connected():
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        if self.closing or self.reconnect_timer.isActive():
+            return
+        delay = self.RECONNECT_DELAYS[min(self.attempt, len(self.RECONNECT_DELAYS) - 1)]
+        self.attempt += 1
+        self.reconnect_timer.start(delay)
+
+    def send(self, event):
+        if self.is_connected():
+            self.socket.write(json.dumps(event).encode() + b'\n')
+
+    def subscribe(self, groups):
+        new_groups = set(groups) - self.groups
+        if new_groups:
+            self.groups |= new_groups
+            self.send({'type': 'subscribe', 'groups': sorted(new_groups)})
+
+    def publish_message(self, message_id, sender_id, receiver_id=None, group_id=None):
+        self.send({'type': 'message', 'message_id': message_id, 'sender_id': sender_id,
+                   'receiver_id': receiver_id, 'group_id': group_id})
+
+    def publish_presence(self, user_id, is_online):
+        self.send({'type': 'presence', 'user_id': user_id, 'is_online': bool(is_online)})
+
+    def publish_typing(self, user_id, receiver_id=None, group_id=None):
+        self.send({'type': 'typing', 'user_id': user_id, 'receiver_id': receiver_id, 'group_id': group_id})
+
+    def on_ready_read(self):
+        # The hub writes events in batches; split complete lines and keep the rest
+        self.buffer += bytes(self.socket.readAll())
+        *lines, self.buffer = self.buffer.split(b'\n')
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            kind = event.get('type')
+            if kind == 'message':
+                self.message_received.emit(event)
+            elif kind == 'presence':
+                self.presence_changed.emit(event['user_id'], event['is_online'])
+            elif kind == 'typing':
+                self.typing_received.emit(event)
+            elif kind == 'resync':
+                self.resync_requested.emit()
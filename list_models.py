@@ -0,0 +1,370 @@
+import abc
+import itertools
+from collections import deque
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRectF, QSize
+from PyQt6.QtGui import QColor, QPainter
+from PyQt6.QtWidgets import QStyle, QStyledItemDelegate
+
+NAME_ROLE = Qt.ItemDataRole.UserRole + 1
+ONLINE_ROLE = Qt.ItemDataRole.UserRole + 2
+UNREAD_ROLE = Qt.ItemDataRole.UserRole + 3
+PREVIEW_ROLE = Qt.ItemDataRole.UserRole + 4
+
+
+class ListModelMeta(type(QAbstractListModel), abc.ABCMeta):
+    pass
+
+
+class PagedListModel(QAbstractListModel, metaclass=ListModelMeta):
+    # List model that pulls rows from the database a page at a time, on a
+    # worker thread, as the view scrolls (canFetchMore/fetchMore). Pages are
+    # keyset-paginated: each query starts after the key of the last row
+    # fetched. Rows are lists whose first element is the id.
+    # Rows live in a deque and `positions` maps each id to its position
+    # minus `shift`, so finding a row by id is O(1), and so is inserting or
+    # removing one at either end; elsewhere only the rows between it and
+    # the nearer end are renumbered.
+
+    def __init__(self, async_db, page_size=100, parent=None):
+        super().__init__(parent)
+        self.async_db = async_db
+        self.db = async_db.db
+        self.page_size = page_size
+        self.rows = deque()
+        self.positions = {}
+        self.shift = 0
+        self.after = None
+        self.exhausted = False
+        self.fetching = False
+        self.generation = 0
+
+    @abc.abstractmethod
+    def query_page(self, after, limit):
+        # Runs on a worker thread; returns raw database rows following the
+        # row whose page_key is `after` (None for the first page)
+        pass
+
+    @abc.abstractmethod
+    def page_key(self, db_row):
+        pass
+
+    @abc.abstractmethod
+    def make_row(self, db_row):
+        pass
+
+    def reload(self):
+        self.generation += 1
+        self.beginResetModel()
+        self.rows = deque()
+        self.positions = {}
+        self.shift = 0
+        self.after = None
+        self.exhausted = False
+        self.fetching = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.exhausted and not self.fetching
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        self.fetching = True
+        generation = self.generation
+        self.async_db.run(self.query_page, self.after, self.page_size,
+                          on_result=lambda rows: self.append_page(generation, rows))
+
+    def append_page(self, generation, db_rows):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if db_rows:
+            self.after = self.page_key(db_rows[-1])
+        self.exhausted = len(db_rows) < self.page_size
+        # Rows inserted locally since the last page may show up again
+        new_rows = [self.make_row(db_row) for db_row in db_rows if db_row[0] not in self.positions]
+        if not new_rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+        self.rows.extend(new_rows)
+        for position, row in enumerate(new_rows, first - self.shift):
+            self.positions[row[0]] = position
+        self.endInsertRows()
+
+    def find_row(self, row_id):
+        position = self.positions.get(row_id)
+        return None if position is None else position + self.shift
+
+    def renumber(self, position, delta):
+        # Moves every row from `position` on by `delta`, by moving the rows
+        # before it the other way when those are fewer
+        count = len(self.rows)
+        if position < count - position:
+            self.shift += delta
+            for row in itertools.islice(self.rows, position):
+                self.positions[row[0]] -= delta
+        else:
+            for row in itertools.islice(reversed(self.rows), count - position):
+                self.positions[row[0]] += delta
+
+    def insert_row(self, position, row):
+        self.beginInsertRows(QModelIndex(), position, position)
+        self.renumber(position, 1)
+        self.rows.insert(position, row)
+        self.positions[row[0]] = position - self.shift
+        self.endInsertRows()
+
+    def remove_row(self, position):
+        self.beginRemoveRows(QModelIndex(), position, position)
+        row = self.rows[position]
+        del self.rows[position]
+        del self.positions[row[0]]
+        self.renumber(position, -1)
+        self.endRemoveRows()
+        return row
+
+    def set_unread(self, position, count):
+        self.rows[position][-1] = count
+        index = self.index(position)
+        self.dataChanged.emit(index, index, [UNREAD_ROLE])
+
+    def increment_unread(self, row_id):
+        position = self.find_row(row_id)
+        if position is not None:
+            self.set_unread(position, self.rows[position][-1] + 1)
+
+
+class ContactListModel(PagedListModel):
+    # Rows: [user_id, name, is_online, unread_count]. Online contacts occupy
+    # rows [0, online_count) as returned by get_user_contacts.
+
+    def __init__(self, async_db, current_user_id, page_size=100, parent=None):
+        super().__init__(async_db, page_size, parent)
+        self.current_user_id = current_user_id
+        self.online_only = True
+        self.online_count = 0
+
+    def set_online_only(self, online_only):
+        self.online_only = online_only
+        self.reload()
+
+    def reload(self):
+        self.online_count = 0
+        super().reload()
+
+    def query_page(self, after, limit):
+        return self.db.get_user_contacts(self.current_user_id, self.online_only, limit, after)
+
+    def page_key(self, db_row):
+        return db_row[4], db_row[6], db_row[0]
+
+    def make_row(self, db_row):
+        user_id, first_name, last_name, email, is_online, unread_count, last_activity = db_row
+        if is_online:
+            self.online_count += 1
+        return [user_id, f"{first_name} {last_name}", bool(is_online), unread_count]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        user_id, name, is_online, unread_count = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, NAME_ROLE):
+            return name
+        if role == Qt.ItemDataRole.UserRole:
+            return (user_id, False)
+        if role == ONLINE_ROLE:
+            return is_online
+        if role == UNREAD_ROLE:
+            return unread_count
+        return None
+
+    def apply_presence_changes(self, changes, reload_threshold=50):
+        # A burst of changes (e.g. many users connecting at once) is one
+        # reload instead of a row move or fetch per user
+        if len(changes) > reload_threshold:
+            self.reload()
+            return
+        for user_id, is_online in changes:
+            self.apply_presence(user_id, is_online)
+
+    def apply_presence(self, user_id, is_online):
+        # Moves, inserts or removes only the affected row
+        if user_id == self.current_user_id:
+            return
+        is_online = bool(is_online)
+        position = self.find_row(user_id)
+        if position is None:
+            if is_online or not self.online_only:
+                self.async_db.run(self.db.get_user_by_id, user_id,
+                                  on_result=lambda user_data: self.add_user(user_data, is_online))
+            return
+        if self.rows[position][2] == is_online:
+            return
+
+        row = self.remove_row(position)
+        if row[2]:
+            self.online_count -= 1
+        if is_online or not self.online_only:
+            row[2] = is_online
+            self.place_row(row)
+
+    def add_user(self, user_data, is_online):
+        # Contact that wasn't loaded yet, fetched after a presence change. The
+        # change itself is authoritative; the row may predate it.
+        if not user_data or user_data[0] in self.positions:
+            return
+        user_id, first_name, last_name, email, password, _, last_seen = user_data
+        if is_online or not self.online_only:
+            self.place_row([user_id, f"{first_name} {last_name}", bool(is_online), 0])
+
+    def place_row(self, row):
+        if row[2]:
+            self.insert_row(0, row)
+            self.online_count += 1
+        else:
+            self.insert_row(self.online_count, row)
+
+
+class GroupListModel(PagedListModel):
+    # Rows: [group_id, name, unread_count], most recently active first
+
+    def __init__(self, async_db, current_user_id, page_size=100, parent=None):
+        super().__init__(async_db, page_size, parent)
+        self.current_user_id = current_user_id
+
+    def query_page(self, after, limit):
+        return self.db.get_user_group_summaries(self.current_user_id, limit, after)
+
+    def page_key(self, db_row):
+        return db_row[5], db_row[0]
+
+    def make_row(self, db_row):
+        group_id, name, created_by, created_at, unread_count, last_activity = db_row
+        return [group_id, name, unread_count]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        group_id, name, unread_count = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, NAME_ROLE):
+            return name
+        if role == Qt.ItemDataRole.UserRole:
+            return (group_id, True)
+        if role == UNREAD_ROLE:
+            return unread_count
+        return None
+
+
+class ConversationListModel(PagedListModel):
+    # Rows: [conversation, title, preview, chat_id, is_group, unread_count],
+    # most recent first; see Database.get_recent_conversations
+
+    def __init__(self, async_db, current_user_id, page_size=50, parent=None):
+        super().__init__(async_db, page_size, parent)
+        self.current_user_id = current_user_id
+
+    def query_page(self, after, limit):
+        return self.db.get_recent_conversations(self.current_user_id, limit, after)
+
+    def page_key(self, db_row):
+        return db_row[5], db_row[0]
+
+    def make_row(self, db_row):
+        (conversation, peer_id, group_id, title, unread_count, last_activity,
+         message_id, sender_id, preview, sender_first_name, sender_last_name) = db_row
+        if preview is None:
+            preview = ""
+        elif sender_id == self.current_user_id:
+            preview = f"You: {preview}"
+        elif group_id is not None:
+            preview = f"{sender_first_name}: {preview}"
+        is_group = group_id is not None
+        return [conversation, title, " ".join(preview.split()), group_id if is_group else peer_id,
+                is_group, unread_count]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        conversation, title, preview, chat_id, is_group, unread_count = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, NAME_ROLE):
+            return title
+        if role == Qt.ItemDataRole.UserRole:
+            return (chat_id, is_group)
+        if role == PREVIEW_ROLE:
+            return preview
+        if role == UNREAD_ROLE:
+            return unread_count
+        return None
+
+
+class ListItemDelegate(QStyledItemDelegate):
+    # Paints a contact, group or conversation row: presence dot (contacts
+    # only), name, last message (conversations only) and unread badge. Every
+    # row has the same height so the view can use uniform item sizes and
+    # only lay out what is visible.
+    ROW_HEIGHT = 36
+
+    def sizeHint(self, option, index):
+        return QSize(0, self.ROW_HEIGHT)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = option.rect
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(rect, option.palette.highlight())
+        elif option.state & QStyle.StateFlag.State_MouseOver:
+            painter.fillRect(rect, QColor("#f0f0f0"))
+
+        left = rect.left() + 10
+        is_online = index.data(ONLINE_ROLE)
+        if is_online is not None:
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor("#2ecc71") if is_online else QColor("#c8c8c8"))
+            painter.drawEllipse(QRectF(left, rect.center().y() - 5, 10, 10))
+            left += 20
+
+        unread_count = index.data(UNREAD_ROLE)
+        right = rect.right() - 10
+        if unread_count:
+            badge = str(unread_count)
+            width = max(22, option.fontMetrics.horizontalAdvance(badge) + 12)
+            badge_rect = QRectF(right - width, rect.center().y() - 10, width, 20)
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor("#0078d7"))
+            painter.drawRoundedRect(badge_rect, 10, 10)
+            painter.setPen(QColor("white"))
+            painter.drawText(badge_rect, Qt.AlignmentFlag.AlignCenter, badge)
+            right -= width + 8
+
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        else:
+            painter.setPen(option.palette.text().color())
+        text_rect = QRectF(left, rect.top(), right - left, rect.height())
+        preview = index.data(PREVIEW_ROLE)
+        if preview is not None:
+            # Name on the upper half, last message below it
+            text_rect.setHeight(rect.height() / 2)
+            preview_rect = text_rect.translated(0, rect.height() / 2 - 4)
+            text_rect.translate(0, 4)
+        name = option.fontMetrics.elidedText(index.data(NAME_ROLE), Qt.TextElideMode.ElideRight,
+                                             int(text_rect.width()))
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, name)
+        if preview:
+            painter.setPen(QColor("#808080"))
+            preview = option.fontMetrics.elidedText(preview, Qt.TextElideMode.ElideRight,
+                                                    int(preview_rect.width()))
+            painter.drawText(preview_rect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, preview)
+        painter.restore()
+
+
+class ConversationItemDelegate(ListItemDelegate):
+    # Two lines per row: name and last message preview
+    ROW_HEIGHT = 52
@@ -1,25 +1,60 @@
+from startup import StartupTimer
+STARTUP = StartupTimer()
+
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication
-from Login_signup import  Login_signup
-from main_window import MainWindow
-from database import Database
 import sys
 
 class MessagingApp:
     def __init__(self):
-        self.db = Database()
-
+        STARTUP.mark('imports')
         self.app = QApplication(sys.argv)
-        self.login_signup = Login_signup(self.db,self.on_login_success)
+        STARTUP.mark('qapplication')
+
+        # Only what the login screen needs is imported before it is shown;
+        # the main window is imported and built after login.
+        from database import Database
+        from credentials import CredentialService
+        from app_paths import enabled
+        # Opt-in with MESSAGING_APP_QUERY_STATS=1; inspect with `python -m query_stats`
+        self.query_stats = None
+        if enabled('MESSAGING_APP_QUERY_STATS'):
+            from query_stats import QueryStats
+            self.query_stats = QueryStats()
+        self.db = Database(stats=self.query_stats)
+        self.credentials = CredentialService()
+        STARTUP.mark('database')
+
+        from Login_signup import Login_signup
+        self.login_signup = Login_signup(self.db,self.on_login_success,self.credentials)
         self.login_signup.show()
-        sys.exit(self.app.exec())
-    
+        STARTUP.mark('login_window')
+        # First pass of the event loop: the window is up and taking input
+        QTimer.singleShot(0, self.on_started)
+        status = self.app.exec()
+        self.credentials.close()
+        if self.query_stats is not None:
+            from app_paths import data_path
+            from query_stats import STATS_FILE
+            self.query_stats.save(data_path(STATS_FILE))
+        sys.exit(status)
+
+    def on_started(self):
+        STARTUP.mark('interactive')
+        # Opt-in with MESSAGING_APP_STARTUP_TIMES=1; inspect with `python -m startup`
+        from app_paths import data_path, enabled
+        if enabled('MESSAGING_APP_STARTUP_TIMES'):
+            from startup import TIMES_FILE
+            STARTUP.save(data_path(TIMES_FILE))
+
     def on_login_success(self, user):
+        from main_window import MainWindow
         self.login_signup.hide()
         self.mainwindow = MainWindow(self.db, user)
         self.mainwindow.Login_Signup = self.login_signup
         self.mainwindow.show()
-        
-        
+
+
 
 if __name__ == "__main__" :
     MessagingApp()
\ No newline at end of file
@@ -1,32 +1,87 @@
 from PyQt6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QLabel, QListWidget, QTextEdit, QMessageBox,
-    QLineEdit, QPushButton, QListWidgetItem, QHBoxLayout, QStackedWidget
+    QMainWindow, QWidget, QVBoxLayout, QLabel, QListView, QMessageBox,
+    QLineEdit, QPushButton, QHBoxLayout, QStackedWidget, QFileDialog
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QPropertyAnimation, QEasingCurve, QPoint
+from PyQt6.QtCore import Qt, pyqtSignal, QPropertyAnimation, QEasingCurve, QPoint, QTimer
 from PyQt6.QtGui import QColor, QPalette
-from models import User, Message, Group
 from database import Database
+from async_db import AsyncDatabase
+from chat_view import ChatView, MESSAGE_ROLE
+from list_models import (
+    ContactListModel, GroupListModel, ConversationListModel, ListItemDelegate, ConversationItemDelegate,
+    NAME_ROLE, UNREAD_ROLE
+)
+from hub_client import HubClient, DEFAULT_HUB_ADDRESS
+from presence import HEARTBEAT_INTERVAL
+import time
 
 class MainWindow(QMainWindow):
-    def __init__(self, db, current_user):
+    def __init__(self, db, current_user, hub_address=DEFAULT_HUB_ADDRESS):
         super().__init__()
         self.db = db
         self.current_user = current_user
         self.current_chat = None
         self.is_group_chat = False
         self.show_all_users = False  # Default: Show only online users
+        self.page_size = 50
+        self.oldest_message_id = None
+        self.newest_message_id = None
+        self.has_older_messages = False
+        self.loading_older = False
+        self.syncing_tail = False
+        self.tail_dirty = False
+        self.expected_message_ids = set()
+        self.chat_generation = 0
+        self.async_db = AsyncDatabase(db)
+        self.contacts_model = ContactListModel(self.async_db, current_user.id, parent=self)
+        self.groups_model = GroupListModel(self.async_db, current_user.id, parent=self)
+        self.conversations_model = ConversationListModel(self.async_db, current_user.id, parent=self)
+        self.conversations_dirty = False
+        self.group_ids = None  # the user's groups, once loaded
+        self.last_typing_sent = 0.0
+
+        # Push channel to other running clients; see delivery_hub.py
+        self.hub = HubClient(hub_address, self)
+        self.hub.message_received.connect(self.on_hub_message)
+        self.hub.presence_changed.connect(self.db.presence.note)
+        self.hub.typing_received.connect(self.on_hub_typing)
+        self.hub.resync_requested.connect(self.on_hub_resync)
 
         self.init_ui()
-        self.db.user_status_changed.connect(self.on_user_status_changed)
+        # Presence from the hub, the database and the sweeper arrives here
+        # coalesced into one list. Undone in closeEvent, since the database
+        # outlives the window across logins.
+        self.db_connections = [
+            (self.db.presence.presence_changed, self.contacts_model.apply_presence_changes),
+            (self.db.user_status_changed, self.hub.publish_presence),
+            (self.db.new_message, self.on_new_messages),
+            (self.db.user_updated, self.on_users_updated),
+            (self.db.group_changed, self.on_group_changed),
+            (self.db.changes_lost, self.on_hub_resync),
+        ]
+        for signal, slot in self.db_connections:
+            signal.connect(slot)
+        self.db.watch_changes(user_id=self.current_user.id)
+        self.db.presence.start()
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.timeout.connect(self.send_heartbeat)
+        self.heartbeat_timer.start(HEARTBEAT_INTERVAL * 1000)
+        self.send_heartbeat()
         self.load_users()
         self.load_groups()
+        self.conversations_dirty = True
+        self.async_db.run(self.db.get_user_groups, current_user.id, on_result=self.on_groups_loaded)
+
+    def on_groups_loaded(self, groups):
+        self.group_ids = {group[0] for group in groups}
+        self.hub.start(self.current_user.id, self.group_ids)
 
     def init_ui(self):
         self.setWindowTitle(f"Messaging App - {self.current_user.first_name}")
         self.setGeometry(100, 100, 900, 600)
 
         self.setStyleSheet("""
-            QListWidget {
+            QListView {
                 font-size: 14px;
                 padding: 5px;
                 border: none;
@@ -52,7 +107,7 @@ class MainWindow(QMainWindow):
                 border: 1px solid #ddd;
                 border-radius: 6px;
             }
-            QTextEdit {
+            ChatView {
                 font-size: 14px;
                 background-color: #f9f9f9;
                 border-radius: 6px;
@@ -83,6 +138,10 @@ class MainWindow(QMainWindow):
         self.groups_btn.setCheckable(True)
         self.groups_btn.clicked.connect(self.show_groups_view)
         
+        self.chats_btn = QPushButton("Chats")
+        self.chats_btn.setCheckable(True)
+        self.chats_btn.clicked.connect(self.show_chats_view)
+        
         self.logout_btn = QPushButton("Logout")
         self.logout_btn.setStyleSheet("""
             QPushButton {
@@ -98,6 +157,7 @@ class MainWindow(QMainWindow):
         
         header_layout.addWidget(self.users_btn)
         header_layout.addWidget(self.groups_btn)
+        header_layout.addWidget(self.chats_btn)
         header_layout.addStretch()
         header_layout.addWidget(self.logout_btn)
         header.setLayout(header_layout)
@@ -120,8 +180,7 @@ class MainWindow(QMainWindow):
         users_top_bar.addWidget(self.toggle_button)
         users_layout.addLayout(users_top_bar)
         
-        self.contacts_list = QListWidget()
-        self.contacts_list.itemClicked.connect(self.open_chat)
+        self.contacts_list = self.create_list_view(self.contacts_model)
         users_layout.addWidget(self.contacts_list)
         
         self.users_widget.setLayout(users_layout)
@@ -141,8 +200,7 @@ class MainWindow(QMainWindow):
         groups_top_bar.addWidget(self.create_group_btn)
         groups_layout.addLayout(groups_top_bar)
         
-        self.groups_list = QListWidget()
-        self.groups_list.itemClicked.connect(self.open_chat)
+        self.groups_list = self.create_list_view(self.groups_model)
         groups_layout.addWidget(self.groups_list)
         
         self.groups_widget.setLayout(groups_layout)
@@ -157,30 +215,51 @@ class MainWindow(QMainWindow):
         self.back_btn = QPushButton("Back")
         self.back_btn.clicked.connect(self.show_previous_view)
         
+        self.typing_label = QLabel()
+        self.typing_label.setStyleSheet("color: gray; font-style: italic;")
+        self.typing_timer = QTimer(self)
+        self.typing_timer.setSingleShot(True)
+        self.typing_timer.timeout.connect(self.typing_label.clear)
+        
         chat_header.addWidget(self.back_btn)
         chat_header.addWidget(self.chat_header)
+        chat_header.addWidget(self.typing_label)
         chat_header.addStretch()
         chat_layout.addLayout(chat_header)
         
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
-        chat_layout.addWidget(self.chat_display)
+        self.chat_view = ChatView()
+        self.chat_view.verticalScrollBar().valueChanged.connect(self.on_chat_scrolled)
+        self.chat_view.doubleClicked.connect(self.on_message_activated)
+        chat_layout.addWidget(self.chat_view)
         
         input_layout = QHBoxLayout()
         self.message_input = QLineEdit()
         self.message_input.setPlaceholderText("Type your message here...")
         self.message_input.returnPressed.connect(self.send_message)
+        self.message_input.textEdited.connect(self.on_message_edited)
         
         self.send_btn = QPushButton("Send")
         self.send_btn.clicked.connect(self.send_message)
+        self.attach_btn = QPushButton("Attach")
+        self.attach_btn.clicked.connect(self.send_attachment)
         
         input_layout.addWidget(self.message_input)
+        input_layout.addWidget(self.attach_btn)
         input_layout.addWidget(self.send_btn)
         chat_layout.addLayout(input_layout)
         
         self.chat_widget.setLayout(chat_layout)
         self.stacked_widget.addWidget(self.chat_widget)
 
+        # Recent conversations view
+        self.chats_widget = QWidget()
+        chats_layout = QVBoxLayout()
+        chats_layout.addWidget(QLabel("Recent Chats"))
+        self.chats_list = self.create_list_view(self.conversations_model, ConversationItemDelegate)
+        chats_layout.addWidget(self.chats_list)
+        self.chats_widget.setLayout(chats_layout)
+        self.stacked_widget.addWidget(self.chats_widget)
+
         main_layout.addWidget(self.stacked_widget)
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
@@ -189,6 +268,17 @@ class MainWindow(QMainWindow):
         self.current_view = "users"
         self.previous_view = "users"
 
+    def create_list_view(self, model, delegate_class=ListItemDelegate):
+        # Rows are fetched page by page and painted by the delegate, so cost
+        # follows the visible rows rather than the size of the directory
+        view = QListView()
+        view.setModel(model)
+        view.setItemDelegate(delegate_class(view))
+        view.setUniformItemSizes(True)
+        view.setMouseTracking(True)
+        view.clicked.connect(self.open_chat)
+        return view
+
     def toggle_user_view(self):
         self.show_all_users = not self.show_all_users
         if self.show_all_users:
@@ -200,23 +290,24 @@ class MainWindow(QMainWindow):
         self.load_users()
 
     def show_users_view(self):
-        self.users_btn.setChecked(True)
-        self.groups_btn.setChecked(False)
-        self.switch_view("users")
+        self.show_list_view("users")
 
     def show_groups_view(self):
-        self.users_btn.setChecked(False)
-        self.groups_btn.setChecked(True)
-        self.switch_view("groups")
+        self.show_list_view("groups")
+
+    def show_chats_view(self):
+        self.show_list_view("chats")
 
     def show_previous_view(self):
-        self.switch_view(self.previous_view)
-        if self.previous_view == "users":
-            self.users_btn.setChecked(True)
-            self.groups_btn.setChecked(False)
-        else:
-            self.users_btn.setChecked(False)
-            self.groups_btn.setChecked(True)
+        self.show_list_view(self.previous_view)
+
+    def show_list_view(self, view_name):
+        self.users_btn.setChecked(view_name == "users")
+        self.groups_btn.setChecked(view_name == "groups")
+        self.chats_btn.setChecked(view_name == "chats")
+        if view_name == "chats" and self.conversations_dirty:
+            self.load_conversations()
+        self.switch_view(view_name)
 
     def switch_view(self, view_name):
         self.previous_view = self.current_view
@@ -226,6 +317,8 @@ class MainWindow(QMainWindow):
             target_index = 0
         elif view_name == "groups":
             target_index = 1
+        elif view_name == "chats":
+            target_index = 3
         else:  # chat
             target_index = 2
         
@@ -252,36 +345,42 @@ class MainWindow(QMainWindow):
         animation.start()
 
     def load_users(self):
-        self.contacts_list.clear()
-        users = self.db.get_all_users(exclude_user_id=self.current_user.id)
-
-        sorted_users = sorted(users, key=lambda x: x[4], reverse=True)
-        if not self.show_all_users:
-            sorted_users = [u for u in sorted_users if u[4]]
-
-        for user in sorted_users:
-            user_id, first_name, last_name, email, is_online = user
-            item = QListWidgetItem(f"{first_name} {last_name} {'🟢' if is_online else '⚪'}")
-            item.setData(Qt.ItemDataRole.UserRole, (user_id, False))
-            self.contacts_list.addItem(item)
+        # Already ordered online first, then by most recent conversation
+        self.contacts_model.set_online_only(not self.show_all_users)
 
     def load_groups(self):
-        self.groups_list.clear()
-        groups = self.db.get_user_groups(self.current_user.id)
-        
-        for group in groups:
-            group_id, name, description = group
-            item = QListWidgetItem(f"{name} - {description}")
-            item.setData(Qt.ItemDataRole.UserRole, (group_id, True))
-            self.groups_list.addItem(item)
-
-    def open_chat(self, item):
-        self.current_chat, self.is_group_chat = item.data(Qt.ItemDataRole.UserRole)
+        # Most recently active first
+        self.groups_model.reload()
+
+    def load_conversations(self):
+        # Re-read in one query; changes while the view is hidden only mark
+        # it for a reload when shown
+        self.conversations_dirty = False
+        self.conversations_model.reload()
+
+    def conversations_changed(self):
+        if self.current_view == "chats":
+            self.load_conversations()
+        else:
+            self.conversations_dirty = True
+
+    def open_chat(self, index):
+        self.current_chat, self.is_group_chat = index.data(Qt.ItemDataRole.UserRole)
+        name = index.data(NAME_ROLE)
         
         if self.is_group_chat:
-            self.chat_header.setText(f"Group: {item.text()}")
+            self.chat_header.setText(f"Group: {name}")
         else:
-            self.chat_header.setText(f"Chat with {item.text()}")
+            self.chat_header.setText(f"Chat with {name}")
+        
+        if index.data(UNREAD_ROLE):
+            index.model().set_unread(index.row(), 0)
+            if self.is_group_chat:
+                self.async_db.run(self.db.mark_conversation_read, self.current_user.id,
+                                  group_id=self.current_chat)
+            else:
+                self.async_db.run(self.db.mark_conversation_read, self.current_user.id,
+                                  peer_id=self.current_chat)
         
         self.load_messages()
         self.switch_view("chat")
@@ -290,75 +389,297 @@ class MainWindow(QMainWindow):
         message_text = self.message_input.text().strip()
         if not message_text or not self.current_chat:
             return
-            
+        self.submit_message(self.db.add_message, content=message_text)
+        self.message_input.clear()
+        self.last_typing_sent = 0.0
+
+    def send_attachment(self):
+        if not self.current_chat:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Send file")
+        if not path:
+            return
+        # Hashed and stored on a worker thread, a chunk at a time
+        self.submit_message(self.db.add_attachment_message, path=path,
+                            caption=self.message_input.text().strip(),
+                            on_error=lambda error: QMessageBox.warning(self, "Error", f"Could not send file: {error}"))
+        self.message_input.clear()
+
+    def submit_message(self, add, on_error=None, **kwargs):
+        # Runs `add` for the current chat; the message is appended once stored
         if self.is_group_chat:
-            self.db.add_message(
-                sender_id=self.current_user.id,
-                group_id=self.current_chat,
-                content=message_text
-            )
+            receiver_id, group_id = None, self.current_chat
         else:
-            self.db.add_message(
-                sender_id=self.current_user.id,
-                receiver_id=self.current_chat,
-                content=message_text
-            )
-        
-        self.message_input.clear()
-        self.load_messages()
+            receiver_id, group_id = self.current_chat, None
+        generation = self.chat_generation
+
+        def sent(message_id):
+            self.hub.publish_message(message_id, self.current_user.id, receiver_id, group_id)
+            if generation == self.chat_generation:
+                self.append_new_messages(message_id)
+
+        self.async_db.run(add, sender_id=self.current_user.id, receiver_id=receiver_id,
+                          group_id=group_id, on_result=sent, on_error=on_error, **kwargs)
+
+    def on_message_activated(self, index):
+        # Attachment bytes are only read when the user asks to save them
+        message = index.data(MESSAGE_ROLE)
+        if message is not None:
+            self.async_db.run(self.db.get_message_attachments, [message[0]], on_result=self.offer_download)
+
+    def offer_download(self, attachments):
+        if not attachments:
+            return
+        attachment_id, message_id, filename, mime_type, size = attachments[0]
+        path, _ = QFileDialog.getSaveFileName(self, "Save file", filename)
+        if path:
+            self.async_db.run(self.db.save_attachment, attachment_id, path,
+                              on_error=lambda error: QMessageBox.warning(self, "Error", f"Could not save file: {error}"))
+
+    def append_new_messages(self, message_id=None):
+        # Append whatever landed after the newest rendered message, which is
+        # normally just `message_id`. Only one tail fetch runs at a time; sends
+        # that complete meanwhile are picked up by a follow-up fetch.
+        if message_id is not None:
+            self.expected_message_ids.add(message_id)
+        if self.newest_message_id is None:
+            self.load_messages()
+            return
+        if self.syncing_tail:
+            self.tail_dirty = True
+            return
+
+        self.syncing_tail = True
+        self.fetch_messages_after(self.newest_message_id, self.apply_new_messages)
+
+    def apply_new_messages(self, messages, names):
+        self.syncing_tail = False
+        if len(messages) == self.page_size:
+            # Too far behind to patch in; rebuild from the newest page
+            self.load_messages()
+            return
+
+        self.chat_view.append_messages([self.chat_row(message, names) for message in messages])
+        self.expected_message_ids.difference_update(message.id for message in messages)
+        if messages:
+            self.newest_message_id = messages[-1].id
+        self.chat_view.scrollToBottom()
+
+        if self.tail_dirty:
+            self.tail_dirty = False
+            self.append_new_messages()
+        elif self.expected_message_ids:
+            # A sent message sorted before the rendered tail, so the view is
+            # out of sync
+            self.load_messages()
+
+    def run_chat_query(self, fn, *args, on_result, **kwargs):
+        # Results are dropped if the user has switched chats in the meantime
+        generation = self.chat_generation
+
+        def deliver(result):
+            if generation == self.chat_generation:
+                on_result(result)
+
+        self.async_db.run(fn, *args, on_result=deliver, **kwargs)
+
+    def run_page_query(self, fetch, *args, on_result):
+        # `on_result` gets the page's Message records and, in group chats,
+        # {sender_id: name} for them, both looked up on the worker thread
+        with_names = self.is_group_chat
+
+        def query():
+            messages = fetch(*args)
+            names = self.db.get_user_names({message.sender_id for message in messages}) if with_names else {}
+            return messages, names
+
+        self.run_chat_query(query, on_result=lambda page: on_result(*page))
+
+    def fetch_message_page(self, before_id, on_result):
+        if self.is_group_chat:
+            self.run_page_query(self.db.get_group_messages_page, self.current_chat,
+                                before_id, self.page_size, on_result=on_result)
+        else:
+            self.run_page_query(self.db.get_messages_page, self.current_user.id, self.current_chat,
+                                before_id, self.page_size, on_result=on_result)
+
+    def fetch_messages_after(self, after_id, on_result):
+        if self.is_group_chat:
+            self.run_page_query(self.db.get_group_messages_after, self.current_chat,
+                                after_id, self.page_size, on_result=on_result)
+        else:
+            self.run_page_query(self.db.get_messages_after, self.current_user.id, self.current_chat,
+                                after_id, self.page_size, on_result=on_result)
+
+    def update_page_state(self, messages):
+        if messages:
+            self.oldest_message_id = messages[0].id
+        self.has_older_messages = len(messages) == self.page_size
 
     def load_messages(self):
-        self.chat_display.clear()
+        # Only the newest page is rendered; older pages are fetched on scroll-back
+        self.chat_generation += 1
+        self.oldest_message_id = None
+        self.newest_message_id = None
+        self.has_older_messages = False
+        self.loading_older = False
+        self.syncing_tail = False
+        self.tail_dirty = False
+        self.expected_message_ids = set()
+        self.chat_view.clear()
+        self.fetch_message_page(None, self.show_latest_page)
+
+    def show_latest_page(self, messages, names):
+        self.update_page_state(messages)
+        if messages:
+            self.newest_message_id = messages[-1].id
+        self.chat_view.append_messages([self.chat_row(message, names) for message in messages])
+        self.expected_message_ids.difference_update(message.id for message in messages)
+        self.chat_view.scrollToBottom()
+
+    def load_older_messages(self):
+        if self.loading_older:
+            return
+        self.loading_older = True
+        self.fetch_message_page(self.oldest_message_id, self.prepend_messages)
+
+    def prepend_messages(self, messages, names):
+        self.loading_older = False
+        self.update_page_state(messages)
+        self.chat_view.prepend_messages([self.chat_row(message, names) for message in messages])
 
+    def on_chat_scrolled(self, value):
+        scrollbar = self.chat_view.verticalScrollBar()
+        if value == scrollbar.minimum() and self.has_older_messages and self.current_view == "chat":
+            self.load_older_messages()
+
+    def chat_row(self, message, names):
+        is_me = message.sender_id == self.current_user.id
         if self.is_group_chat:
-            messages = self.db.get_group_messages(self.current_chat)
-            for msg_data in messages:
-                msg = Message(*msg_data[:7])
-                sender_name = f"{msg_data[7]} {msg_data[8]}"
-                self.append_message(sender_name, msg.content, msg.timestamp, msg.sender_id == self.current_user.id)
+            sender_name = names.get(message.sender_id, "")
         else:
-            messages = self.db.get_messages(self.current_user.id, self.current_chat)
-            for msg_data in messages:
-                msg = Message(*msg_data)
-                sender_name = "You" if msg.sender_id == self.current_user.id else "Them"
-                self.append_message(sender_name, msg.content, msg.timestamp, msg.sender_id == self.current_user.id)
-
-        self.chat_display.verticalScrollBar().setValue(
-            self.chat_display.verticalScrollBar().maximum()
-        )
-
-    def append_message(self, sender, content, timestamp, is_me):
-        alignment = "right" if is_me else "left"
-        color = "#DCF8C6" if is_me else "#ECECEC"
-
-        html = f"""
-        <div style='margin: 5px; text-align: {alignment};'>
-            <div style='background: {color}; padding: 8px; border-radius: 8px; 
-                        display: inline-block; max-width: 70%; word-wrap: break-word;'>
-                <small><b>{sender}</b> - {timestamp}</small><br>
-                {content}
-            </div>
-        </div>
-        """
-        self.chat_display.append(html)
+            sender_name = "You" if is_me else "Them"
+        return message.id, sender_name, message.content, message.timestamp, is_me
 
     def create_group(self):
         # Implement group creation dialog
         pass
 
-    def on_user_status_changed(self, user_id, is_online):
-        if not self.show_all_users:
-            self.load_users()
+    def send_heartbeat(self):
+        self.db.presence.heartbeat(self.current_user.id)
+
+    def is_current_chat(self, sender_id, receiver_id=None, group_id=None):
+        if self.current_view != "chat" or self.current_chat is None:
+            return False
+        if self.is_group_chat:
+            return group_id == self.current_chat
+        if group_id is not None:
+            return False
+        # Incoming from the peer, or sent from another session of ours
+        if sender_id == self.current_user.id:
+            return receiver_id == self.current_chat
+        return sender_id == self.current_chat and receiver_id == self.current_user.id
+
+    def on_hub_message(self, event):
+        # The hub only says that something was written; the rows come from
+        # the change watcher
+        self.db.poll_changes()
+
+    def on_new_messages(self, messages):
+        # The watcher only reports messages in this user's chats and groups
+        self.conversations_changed()
+        refresh_chat = False
+        mark_read = False
+        for msg in messages:
+            if self.is_current_chat(msg.sender_id, msg.receiver_id, msg.group_id):
+                refresh_chat = True
+                mark_read = mark_read or msg.sender_id != self.current_user.id
+            elif msg.sender_id == self.current_user.id:
+                continue
+            elif msg.group_id is not None:
+                self.groups_model.increment_unread(msg.group_id)
+            elif msg.receiver_id == self.current_user.id:
+                self.contacts_model.increment_unread(msg.sender_id)
+        if not refresh_chat:
+            return
+        self.typing_label.clear()
+        self.append_new_messages()
+        if mark_read:
+            if self.is_group_chat:
+                self.async_db.run(self.db.mark_conversation_read, self.current_user.id,
+                                  group_id=self.current_chat)
+            else:
+                self.async_db.run(self.db.mark_conversation_read, self.current_user.id,
+                                  peer_id=self.current_chat)
+
+    def on_users_updated(self, users):
+        for user_id, first_name, last_name, email, is_online, last_seen in users:
+            self.db.presence.note(user_id, is_online)
+
+    def on_group_changed(self, memberships):
+        joined = [row for row in memberships if row[4] == self.current_user.id]
+        for group_id, name, created_by, created_at, member_id in joined:
+            if self.group_ids is not None:
+                self.group_ids.add(group_id)
+            if self.groups_model.find_row(group_id) is None:
+                self.groups_model.insert_row(0, [group_id, name, 0])
+        self.hub.subscribe(row[0] for row in joined)
+        if joined:
+            self.conversations_changed()
+
+    def on_hub_typing(self, event):
+        if event['user_id'] == self.current_user.id:
+            return
+        if self.is_current_chat(event['user_id'], event.get('receiver_id'), event.get('group_id')):
+            self.typing_label.setText("typing...")
+            self.typing_timer.start(4000)
+
+    def on_hub_resync(self):
+        # The hub reconnected or either it or the change watcher fell behind:
+        # re-read what could not be delivered
+        self.load_users()
+        self.load_groups()
+        self.conversations_changed()
+        if self.current_view == "chat" and self.current_chat is not None:
+            self.append_new_messages()
+
+    def on_message_edited(self, text):
+        # At most one typing event every few seconds
+        now = time.monotonic()
+        if not text or self.current_chat is None or now - self.last_typing_sent < 3:
+            return
+        self.last_typing_sent = now
+        if self.is_group_chat:
+            self.hub.publish_typing(self.current_user.id, group_id=self.current_chat)
+        else:
+            self.hub.publish_typing(self.current_user.id, receiver_id=self.current_chat)
 
     def handle_logout(self):
         confirm = QMessageBox.question(self, "Logout", "Are you sure you want to logout?",
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if confirm == QMessageBox.StandardButton.Yes:
+            self.heartbeat_timer.stop()
             self.db.update_user_status(self.current_user.id, False)
             self.close()
+            self.deleteLater()
 
             if hasattr(self,"Login_signup"):
                 self.Login_signup.login_email.clear()
                 self.Login_signup.login_password.clear()
-                self.Login_signup.show()
\ No newline at end of file
+                self.Login_signup.show()
+
+    def closeEvent(self, event):
+        # Stops everything that would keep acting for this user once the
+        # window is gone
+        if self.db_connections:
+            for signal, slot in self.db_connections:
+                signal.disconnect(slot)
+            self.db_connections = []
+            self.heartbeat_timer.stop()
+            self.typing_timer.stop()
+            self.db.stop_watching()
+            self.db.presence.stop()
+            self.hub.close()
+            self.async_db.close()
+        super().closeEvent(event)
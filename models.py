@@ -1,7 +1,9 @@
 from dataclasses import dataclass
 from datetime import datetime
 
-@dataclass
+# Slotted so large result sets streamed from Database stay compact
+
+@dataclass(slots=True)
 class User:
     id: int
     first_name: str
@@ -11,7 +13,7 @@ class User:
     is_online: bool
     last_seen: datetime
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     id: int
     sender_id: int
@@ -21,7 +23,7 @@ class Message:
     timestamp: datetime = None
     is_read: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class Group:
     id: int
     name: str
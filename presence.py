@@ -0,0 +1,173 @@
+import threading
+from datetime import datetime, timedelta
+
+from PyQt6.QtCore import QObject, QThreadPool, QTimer, pyqtSignal
+
+from async_db import AsyncDatabase
+
+HEARTBEAT_INTERVAL = 10  # seconds between heartbeats of a running client
+
+
+class PresenceTracker(QObject):
+    # Clients call heartbeat() every HEARTBEAT_INTERVAL seconds. Heartbeats
+    # only update a dict; flush() writes them to users.last_seen in one
+    # transaction, and sets is_online only for users that were offline, so an
+    # ongoing session causes no change_log traffic. sweep() marks users whose
+    # last_seen is older than `timeout` offline in the database, which also
+    # expires sessions of crashed clients in other processes.
+    # On the timers, flushes and sweeps run on one worker thread, in order, so
+    # a writer in another process holding the lock never stalls the GUI;
+    # flush() and sweep() do the same synchronously.
+    # Presence changes from any source are passed to note() and emitted
+    # together once `coalesce_window` ms have passed since the first one.
+    # start(), stop() and note() must be called from the thread that owns
+    # this object; heartbeat() and discard() from any thread.
+    presence_changed = pyqtSignal(list)  # (user_id, is_online), one per user
+
+    def __init__(self, db, timeout=3 * HEARTBEAT_INTERVAL, flush_interval=5000,
+                 sweep_interval=10000, coalesce_window=200):
+        super().__init__()
+        self.db = db
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.coalesce_window = coalesce_window
+        self._beats = {}  # user_id -> time of the latest heartbeat
+        self._discarded = {}  # user_id -> time of logout
+        self._lock = threading.Lock()
+        self._changes = {}
+        self._timers = None
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.async_db = AsyncDatabase(db, self.thread_pool)
+
+    def create_tables(self, cursor):
+        # Online users by last_seen, for the sweeper and online-only lists
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_online
+        ON users (last_seen) WHERE is_online = TRUE
+        ''')
+
+    def start(self):
+        if self._timers is not None:
+            return
+        flush_timer = QTimer(self)
+        flush_timer.timeout.connect(self.flush_later)
+        flush_timer.start(self.flush_interval)
+        sweep_timer = QTimer(self)
+        sweep_timer.timeout.connect(self.sweep_later)
+        sweep_timer.start(self.sweep_interval)
+        coalesce_timer = QTimer(self)
+        coalesce_timer.setSingleShot(True)
+        coalesce_timer.timeout.connect(self.emit_changes)
+        self._timers = (flush_timer, sweep_timer, coalesce_timer)
+
+    def stop(self):
+        if self._timers is not None:
+            for timer in self._timers:
+                timer.stop()
+            self._timers = None
+        self.thread_pool.waitForDone()
+        self.flush()
+
+    def heartbeat(self, user_id):
+        with self._lock:
+            self._beats[user_id] = datetime.now()
+
+    def discard(self, user_id):
+        # Logged out: a pending heartbeat, or one already handed to the
+        # worker, must not bring the user back online
+        with self._lock:
+            self._beats.pop(user_id, None)
+            self._discarded[user_id] = datetime.now()
+
+    def take_beats(self):
+        with self._lock:
+            beats, self._beats = self._beats, {}
+        return beats
+
+    def flush(self):
+        beats = self.take_beats()
+        self.note_all(self.write_beats(beats), True)
+        return len(beats)
+
+    def sweep(self):
+        # Pending heartbeats go first so they are not mistaken for expired
+        came_online, expired = self.write_sweep(self.take_beats())
+        self.note_all(came_online, True)
+        self.note_all(expired, False)
+        return len(expired)
+
+    def flush_later(self):
+        beats = self.take_beats()
+        if beats:
+            self.async_db.run(self.write_beats, beats,
+                              on_result=lambda came_online: self.note_all(came_online, True))
+
+    def sweep_later(self):
+        self.async_db.run(self.write_sweep, self.take_beats(), on_result=self.apply_sweep)
+
+    def apply_sweep(self, result):
+        came_online, expired = result
+        self.note_all(came_online, True)
+        self.note_all(expired, False)
+
+    def write_beats(self, beats):
+        # Writes heartbeats to users.last_seen; returns the ids of users that
+        # were offline until now
+        if not beats:
+            return []
+        came_online = []
+        with self.db.pool.write() as conn:
+            # Checked under the write lock, so a logout's status write lands
+            # either after this transaction or before its heartbeats are dropped
+            with self._lock:
+                beats = {user_id: seen for user_id, seen in beats.items()
+                         if user_id not in self._discarded or self._discarded[user_id] < seen}
+            user_ids = list(beats)
+            conn.executemany('UPDATE users SET last_seen = ? WHERE id = ?',
+                             ((seen.isoformat(' '), user_id) for user_id, seen in beats.items()))
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                came_online += [row[0] for row in conn.execute(f'''
+                UPDATE users SET is_online = TRUE
+                WHERE is_online IS NOT TRUE AND id IN ({', '.join('?' * len(chunk))})
+                RETURNING id
+                ''', chunk)]
+        for user_id in user_ids:
+            self.db.users.invalidate(user_id)
+        return came_online
+
+    def write_sweep(self, beats):
+        # (came online, expired) user ids
+        came_online = self.write_beats(beats)
+        cutoff = datetime.now() - timedelta(seconds=self.timeout)
+        with self._lock:
+            # Heartbeats older than that can no longer be in flight
+            self._discarded = {user_id: at for user_id, at in self._discarded.items() if at >= cutoff}
+        with self.db.pool.write() as conn:
+            expired = [row[0] for row in conn.execute('''
+            UPDATE users SET is_online = FALSE
+            WHERE is_online = TRUE AND (last_seen IS NULL OR last_seen < ?)
+            RETURNING id
+            ''', (cutoff.isoformat(' '),))]
+        for user_id in expired:
+            self.db.users.invalidate(user_id)
+        return came_online, expired
+
+    def note_all(self, user_ids, is_online):
+        for user_id in user_ids:
+            self.note(user_id, is_online)
+
+    def note(self, user_id, is_online):
+        if self._timers is None:
+            return
+        self._changes[user_id] = bool(is_online)
+        coalesce_timer = self._timers[2]
+        if not coalesce_timer.isActive():
+            coalesce_timer.start(self.coalesce_window)
+
+    def emit_changes(self):
+        changes, self._changes = list(self._changes.items()), {}
+        if changes:
+            self.presence_changed.emit(changes)
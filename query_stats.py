@@ -0,0 +1,291 @@
+import argparse
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from app_paths import data_path
+
+STATS_FILE = 'query_stats.json'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class QueryStats:
+    # Call counts, latencies and row counts per Database method and per SQL
+    # statement, plus a log of statements slower than `slow_threshold`
+    # seconds with their query plans. Recording a call is a dictionary lookup
+    # and a few additions under a lock; percentiles are computed from the
+    # last `samples` latencies only when a snapshot is taken.
+
+    def __init__(self, slow_threshold=0.1, samples=1000, slow_log_size=100):
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._statements = {}
+        self._normalized = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._statements.clear()
+            self.slow_queries.clear()
+
+    def normalize(self, sql):
+        # Statements differ only in whitespace between call sites
+        key = self._normalized.get(sql)
+        if key is None:
+            key = ' '.join(sql.split())
+            if len(self._normalized) < 10000:
+                self._normalized[sql] = key
+        return key
+
+    def _record(self, table, key, elapsed, rows):
+        with self._lock:
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [0, 0.0, 0, deque(maxlen=self.samples)]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += rows
+            entry[3].append(elapsed)
+
+    def record_method(self, name, elapsed, rows):
+        self._record(self._methods, name, elapsed, rows)
+
+    def record_statement(self, conn, sql, params, elapsed, rows):
+        key = self.normalize(sql)
+        self._record(self._statements, key, elapsed, rows)
+        if elapsed >= self.slow_threshold:
+            self.slow_queries.append({
+                'time': time.time(),
+                'elapsed_ms': elapsed * 1000,
+                'sql': key,
+                'plan': self.query_plan(conn, sql, params),
+            })
+
+    def query_plan(self, conn, sql, params):
+        # Uses the base class so the EXPLAIN is not itself recorded
+        try:
+            rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error:
+            return []
+        return [row[3] for row in rows]
+
+    def summarize(self, entry):
+        calls, total, rows, latencies = entry
+        latencies = sorted(latencies)
+        return {
+            'calls': calls,
+            'total_ms': total * 1000,
+            'mean_ms': total / calls * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_recent_ms': latencies[-1] * 1000,
+            'rows': rows,
+        }
+
+    def snapshot(self):
+        with self._lock:
+            methods = {name: list(entry) for name, entry in self._methods.items()}
+            statements = {sql: list(entry) for sql, entry in self._statements.items()}
+            slow_queries = list(self.slow_queries)
+        return {
+            'methods': {name: self.summarize(entry) for name, entry in methods.items()},
+            'statements': {sql: self.summarize(entry) for sql, entry in statements.items()},
+            'slow_queries': slow_queries,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def connection_factory(self):
+        # sqlite3.Connection subclass whose statements are recorded here
+        cursor_class = type('Cursor', (InstrumentedCursor,), {'stats': self})
+        return type('Connection', (InstrumentedConnection,), {'stats': self, 'cursor_class': cursor_class})
+
+    def instrument(self, obj):
+        # Replaces the public methods of `obj` with timed wrappers on the
+        # instance. Generators are timed over their whole iteration.
+        for name, attr in inspect.getmembers(type(obj), inspect.isfunction):
+            if not name.startswith('_'):
+                setattr(obj, name, self.timed(name, getattr(obj, name)))
+
+    def timed(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = method(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            if inspect.isgenerator(result):
+                return self.timed_iteration(name, result, elapsed)
+            self.record_method(name, elapsed, result_rows(result))
+            return result
+        return wrapper
+
+    def timed_iteration(self, name, generator, elapsed):
+        rows = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                self.record_method(name, elapsed + time.perf_counter() - started, rows)
+                return
+            elapsed += time.perf_counter() - started
+            rows += 1
+            yield item
+
+
+def result_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # A statement is recorded once its rows are exhausted (or the cursor is
+    # reused or closed), so the time spent stepping through results in the
+    # fetch calls counts towards it.
+    stats = None
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - started, 0]
+        if self.description is None:
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, (), time.perf_counter() - started, max(self.rowcount, 0)]
+        self._finish()
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetched(self, started, rows, exhausted):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            sql, parameters, elapsed, rows = pending
+            self.stats.record_statement(self.connection, sql, parameters, elapsed, rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    stats = None
+    cursor_class = InstrumentedCursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        self.stats.record_statement(self, 'COMMIT', (), time.perf_counter() - started, 0)
+
+
+def format_report(report, sort='total_ms', limit=20):
+    lines = []
+    for section in ('methods', 'statements'):
+        entries = sorted(report[section].items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+        lines.append(f"{section.upper()} (by {sort})")
+        lines.append(f"{'calls':>8} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8} {'rows':>9}  name")
+        for name, entry in entries:
+            lines.append(f"{entry['calls']:>8} {entry['total_ms']:>10.1f} {entry['p50_ms']:>8.2f} "
+                         f"{entry['p99_ms']:>8.2f} {entry['rows']:>9}  {name[:100]}")
+        lines.append('')
+    lines.append(f"SLOW QUERIES ({len(report['slow_queries'])})")
+    for entry in report['slow_queries']:
+        lines.append(f"{entry['elapsed_ms']:.1f} ms  {entry['sql'][:200]}")
+        for step in entry['plan']:
+            lines.append(f"    {step}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print query statistics saved by QueryStats.save.')
+    parser.add_argument('path', nargs='?', default=data_path(STATS_FILE))
+    parser.add_argument('--sort', default='total_ms', choices=['total_ms', 'calls', 'mean_ms', 'p99_ms', 'rows'])
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        report = json.load(f)
+    print(format_report(report, args.sort, args.limit))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
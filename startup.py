@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+TIMES_FILE = 'startup_times.jsonl'
+MAX_RUNS = 200  # older runs are dropped from the file
+
+
+def process_age():
+    # Seconds since this process was created, from /proc (Linux only)
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+
+
+class StartupTimer:
+    # Named marks from process start to the first window taking input. Create
+    # it before the heavy imports; where /proc is available the interpreter's
+    # own start-up is included as the first phase.
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []
+        age = process_age()
+        if age is not None:
+            self.started -= age
+            self.marks.append(('interpreter', age))
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.started))
+
+    def report(self):
+        phases = []
+        previous = 0.0
+        for name, at in self.marks:
+            phases.append({'name': name, 'at_ms': at * 1000, 'ms': (at - previous) * 1000})
+            previous = at
+        return {'time': time.time(), 'total_ms': previous * 1000, 'phases': phases}
+
+    def save(self, path, max_runs=MAX_RUNS):
+        # One JSON line per launch, so runs can be compared over time; only
+        # the latest `max_runs` are kept
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        try:
+            with open(path) as f:
+                lines = [line for line in f if line.strip()]
+        except FileNotFoundError:
+            lines = []
+        lines = lines[-(max_runs - 1):] if max_runs > 1 else []
+        lines.append(json.dumps(self.report()) + '\n')
+        with open(path + '.tmp', 'w') as f:
+            f.writelines(lines)
+        os.replace(path + '.tmp', path)
+
+
+def load_runs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_report(runs):
+    # Median of each phase over `runs`, in the order of the latest run
+    lines = [f"{len(runs)} runs, median time to interactive {statistics.median(run['total_ms'] for run in runs):.0f} ms"]
+    lines.append(f"{'median ms':>10} {'last ms':>8}  phase")
+    for phase in runs[-1]['phases']:
+        values = [p['ms'] for run in runs for p in run['phases'] if p['name'] == phase['name']]
+        lines.append(f"{statistics.median(values):>10.1f} {phase['ms']:>8.1f}  {phase['name']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from app_paths import data_path
+
+    parser = argparse.ArgumentParser(description='Summarize start-up timings saved by StartupTimer.save.')
+    parser.add_argument('path', nargs='?', default=data_path(TIMES_FILE))
+    parser.add_argument('--last', type=int, default=20, help='number of recent runs to include')
+    args = parser.parse_args(argv)
+
+    runs = load_runs(args.path)[-args.last:]
+    if not runs:
+        print('no runs recorded', file=sys.stderr)
+        return 1
+    print(format_report(runs))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pytest
+from PyQt6.QtCore import QCoreApplication
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, conversation_key  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def app():
+    # Database is a QObject and owns timers and a thread pool
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'messaging_app.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def users(db):
+    return [db.add_user(f'First{i}', f'Last{i}', f'user{i}@example.com', 'password') for i in range(8)]
+
+
+@pytest.fixture
+def insert_messages(db):
+    # Inserts (sender_id, receiver_id, group_id, content, timestamp) rows as
+    # they are, so tests control timestamps; returns the new ids
+    def insert(rows):
+        ids = []
+        with db.pool.write() as conn:
+            for sender_id, receiver_id, group_id, content, timestamp in rows:
+                conversation = conversation_key(sender_id, receiver_id) if receiver_id is not None else None
+                ids.append(conn.execute('''
+                INSERT INTO messages (sender_id, receiver_id, group_id, content, timestamp, conversation)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (sender_id, receiver_id, group_id, content, timestamp, conversation)).lastrowid)
+        return ids
+    return insert
+
+
+@pytest.fixture
+def walk_history():
+    # Pages back from the latest message with `fetch(before_id=, limit=)`;
+    # returns the whole history oldest first
+    def walk(fetch, limit):
+        messages = []
+        before_id = None
+        while True:
+            page = fetch(before_id=before_id, limit=limit)
+            assert len(page) <= limit
+            if not page:
+                return messages
+            messages[:0] = page
+            before_id = page[0].id
+    return walk
+
+
+@pytest.fixture
+def walk_pages():
+    # Follows `fetch(limit=, after=)` from page to page, continuing after
+    # `page_key(last row)`; returns every row
+    def walk(fetch, page_key, limit):
+        rows = []
+        after = None
+        while True:
+            page = fetch(limit=limit, after=after)
+            assert len(page) <= limit
+            if not page:
+                return rows
+            rows += page
+            after = page_key(page[-1])
+    return walk
+
+
+@pytest.fixture
+def chats(db, users, insert_messages):
+    # users[0] chats with five users, some online, with ties on timestamp,
+    # and is in three groups, one with a message; returns (me, group ids)
+    me = users[0]
+    for user_id in users[3:6]:
+        db.update_user_status(user_id, True)
+    insert_messages([
+        (me, users[1], None, 'a', '2026-01-01 12:00:00'),
+        (users[2], me, None, 'b', '2026-01-01 12:00:00'),
+        (me, users[3], None, 'c', '2026-01-01 12:00:00'),
+        (users[4], me, None, 'd', '2026-01-01 13:00:00'),
+        (me, users[6], None, 'e', '2026-01-01 09:00:00'),
+    ])
+    groups = []
+    for name in ('One', 'Two', 'Three'):
+        group_id = db.create_group(name, me)
+        db.add_group_member(group_id, me)
+        groups.append(group_id)
+    insert_messages([(me, None, groups[1], 'hi', '2030-01-01 00:00:00')])
+    return me, groups
@@ -0,0 +1,74 @@
+import pytest
+
+
+@pytest.fixture
+def history(db, users, insert_messages):
+    # Three direct and two group messages in each of six old months and one
+    # recent one
+    a, b, c = users[:3]
+    group_id = db.create_group('Team', a)
+    for user_id in (a, b, c):
+        db.add_group_member(group_id, user_id)
+    rows = []
+    for timestamp in [f'2025-{month:02d}-15 10:00:00' for month in range(1, 7)] + ['2999-01-01 10:00:00']:
+        rows += [(a, b, None, f'direct {timestamp} {i}', timestamp) for i in range(3)]
+        rows += [(c, None, group_id, f'group {timestamp} {i}', timestamp) for i in range(2)]
+    insert_messages(rows)
+    return list(db.iter_messages(a, b)), list(db.iter_group_messages(group_id)), group_id
+
+
+def hot_count(db):
+    return db.pool.reader().execute('SELECT count(*) FROM messages').fetchone()[0]
+
+
+def archived_count(db):
+    return db.pool.reader().execute('SELECT sum(message_count) FROM message_archives').fetchone()[0]
+
+
+@pytest.mark.parametrize('limit', [1, 7, 50])
+def test_message_pages_continue_into_archives(db, users, history, walk_history, limit):
+    a, b = users[:2]
+    direct, group, group_id = history
+    assert db.archive_messages(max_age_days=180) == 30
+    assert hot_count(db) == 5
+    assert list(db.iter_messages(a, b)) == direct
+    assert walk_history(lambda **page: db.get_messages_page(a, b, **page), limit) == direct
+    assert walk_history(lambda **page: db.get_group_messages_page(group_id, **page), limit) == group
+    # Starting from an archived message
+    assert db.get_messages_page(a, b, before_id=direct[5].id, limit=limit) == direct[max(5 - limit, 0):5]
+
+
+class CrashBeforeDelete:
+    # Pool whose second write (the one deleting from main) fails once, as if
+    # the process died between the two commits of a batch
+    def __init__(self, pool):
+        self.pool = pool
+        self.writes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def write(self):
+        self.writes += 1
+        if self.writes == 2:
+            raise RuntimeError('crash')
+        return self.pool.write()
+
+
+def test_crash_between_copy_and_delete_loses_nothing(db, users, history, monkeypatch):
+    a, b = users[:2]
+    direct, group, group_id = history
+    monkeypatch.setattr(db.archive, 'pool', CrashBeforeDelete(db.pool))
+    with pytest.raises(RuntimeError):
+        db.archive_messages(max_age_days=180)
+    # Copied to the archives, still in main, not yet registered
+    assert hot_count(db) == 35
+    assert archived_count(db) is None
+    assert list(db.iter_messages(a, b)) == direct
+
+    monkeypatch.undo()
+    assert db.archive_messages(max_age_days=180) == 30
+    assert hot_count(db) == 5
+    assert archived_count(db) == 30
+    assert list(db.iter_messages(a, b)) == direct
+    assert list(db.iter_group_messages(group_id)) == group
@@ -0,0 +1,58 @@
+import io
+import os
+
+import pytest
+
+from attachments import AttachmentStore
+
+
+def content_rows(db):
+    return db.pool.reader().execute(
+        'SELECT size, stored_size, compression FROM attachment_contents ORDER BY id').fetchall()
+
+
+@pytest.mark.parametrize('data, compression', [
+    (os.urandom(600 * 1024), None),
+    (b'compressible ' * 50000, 'zlib'),
+    (b'', None),
+])
+def test_round_trip(db, users, tmp_path, data, compression):
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+    message_id = db.add_attachment_message(users[0], receiver_id=users[1], path=str(path), caption='see this')
+
+    (attachment_id, attached_to, filename, mime_type, size), = db.get_message_attachments([message_id])
+    assert (attached_to, filename, size) == (message_id, 'file.bin', len(data))
+    assert content_rows(db)[0][2] == compression
+    chunks = list(db.iter_attachment(attachment_id, chunk_size=64 * 1024))
+    assert all(len(chunk) <= 64 * 1024 for chunk in chunks)
+    assert b''.join(chunks) == data
+
+    db.save_attachment(attachment_id, str(tmp_path / 'saved.bin'))
+    assert (tmp_path / 'saved.bin').read_bytes() == data
+
+
+def test_identical_files_are_stored_once(db, users, tmp_path):
+    data = os.urandom(100 * 1024)
+    for name in ('one.bin', 'two.bin'):
+        (tmp_path / name).write_bytes(data)
+    first = db.add_attachment_message(users[0], receiver_id=users[1], path=str(tmp_path / 'one.bin'))
+    group_id = db.create_group('Team', users[1])
+    second = db.add_attachment_message(users[1], group_id=group_id, path=str(tmp_path / 'two.bin'))
+
+    assert content_rows(db) == [(len(data), len(data), None)]
+    attachments = db.get_message_attachments([first, second])
+    assert [row[2] for row in attachments] == ['one.bin', 'two.bin']
+    assert [b''.join(db.iter_attachment(row[0])) for row in attachments] == [data, data]
+
+
+def test_source_changed_before_store(db):
+    store = AttachmentStore()
+    source = io.BytesIO(b'a' * 1000)
+    prepared = store.prepare(source, compress=False)
+    source.seek(0)
+    source.write(b'b' * 1000)
+    with pytest.raises(ValueError):
+        with db.pool.write() as conn:
+            store.store(conn, prepared)
+    assert content_rows(db) == []
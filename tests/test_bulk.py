@@ -0,0 +1,172 @@
+import io
+import os
+from collections import Counter
+
+import pytest
+
+import bulk
+from database import Database
+
+NOON = '2026-01-01 12:00:00'
+
+
+def export(db):
+    out = io.StringIO()
+    counts = bulk.export_ndjson(db, out, batch_size=3)
+    return out.getvalue(), counts
+
+
+def snapshot(db):
+    # Contents independent of ids: messages, memberships and attachments by
+    # user email and group name
+    rows = [(table, row) for table, row in bulk.export_rows(db) if table != 'attachment_chunks']
+    emails = {row[0]: row[3] for table, row in rows if table == 'users'}
+    groups = {row[0]: row[1] for table, row in rows if table == 'groups'}
+    contents = {row[0]: row[4] for table, row in rows if table == 'messages'}
+    return {
+        'users': Counter(emails.values()),
+        'messages': Counter((emails[row[1]], emails.get(row[2]), groups.get(row[3]), row[4], row[5])
+                            for table, row in rows if table == 'messages'),
+        'members': Counter((groups[row[0]], emails[row[1]]) for table, row in rows if table == 'group_members'),
+        'attachments': Counter((contents[row[1]], row[3], b''.join(db.iter_attachment(row[0])))
+                               for table, row in rows if table == 'attachments'),
+    }
+
+
+@pytest.fixture
+def source(db, users, insert_messages, tmp_path):
+    a, b, c = users[:3]
+    group_id = db.create_group('Team', a)
+    for user_id in (a, b, c):
+        db.add_group_member(group_id, user_id)
+    insert_messages([(a, b, None, f'old {month}', f'2025-{month:02d}-01 10:00:00') for month in range(1, 4)])
+    db.archive_messages(max_age_days=180)
+    insert_messages([
+        (b, a, None, 'recent', '2999-01-01 10:00:00'),
+        # Identical messages stay two messages
+        (a, b, None, 'ok', '2999-01-01 10:30:00'),
+        (a, b, None, 'ok', '2999-01-01 10:30:00'),
+        (c, None, group_id, 'to the group', '2999-01-01 11:00:00'),
+    ])
+    (tmp_path / 'large.bin').write_bytes(os.urandom(600 * 1024))
+    (tmp_path / 'notes.txt').write_bytes(b'notes ' * 10000)
+    db.add_attachment_message(a, receiver_id=b, path=str(tmp_path / 'large.bin'))
+    db.add_attachment_message(b, group_id=group_id, path=str(tmp_path / 'notes.txt'))
+    db.add_attachment_message(c, receiver_id=a, path=str(tmp_path / 'large.bin'))
+    return db
+
+
+@pytest.fixture
+def target(tmp_path):
+    db = Database(str(tmp_path / 'target.db'))
+    yield db
+    db.close()
+
+
+def test_round_trip(source, target):
+    text, counts = export(source)
+    assert counts['messages'] == 10
+    assert counts['attachment_contents'] == 2
+    assert counts['attachments'] == 3
+    assert counts['attachment_chunks'] == 4
+
+    assert bulk.import_ndjson(target, text.splitlines(), batch_size=2, transaction_rows=3) == counts
+    assert export(target)[0] == text
+    assert snapshot(target) == snapshot(source)
+    # Archived messages come back into the hot table
+    assert target.get_messages_page(1, 2) == source.get_messages_page(1, 2)
+    assert len(target.search_messages(2, 'recent')) == 1
+    assert not target.message_triggers_missing(target.pool.reader())
+
+
+def test_import_again_skips_existing_rows(source, target):
+    text, counts = export(source)
+    bulk.import_ndjson(target, text.splitlines())
+    assert set(bulk.import_ndjson(target, text.splitlines()).values()) == {0}
+    assert export(target)[0] == text
+
+
+def test_import_into_database_with_data(source, target, tmp_path):
+    # Ids 1 and 2 are taken by other users, one user is in both by email,
+    # and one file is already stored
+    zed = target.add_user('Zed', 'Z', 'zed@example.com', 'password')
+    yan = target.add_user('Yan', 'Y', 'yan@example.com', 'password')
+    target.add_user('First1', 'Last1', 'user1@example.com', 'password')
+    target.add_message(zed, yan, content='hi yan')
+    group_id = target.create_group('Team', zed)
+    target.add_group_member(group_id, yan)
+    target.add_attachment_message(yan, receiver_id=zed, path=str(tmp_path / 'notes.txt'))
+    before = snapshot(target)
+    chat = target.get_messages_page(zed, yan)
+    expected = snapshot(source)
+
+    text, counts = export(source)
+    inserted = bulk.import_ndjson(target, text.splitlines(), batch_size=2, transaction_rows=3)
+    assert inserted['users'] == counts['users'] - 1
+    assert inserted['attachment_contents'] == 1
+    after = snapshot(target)
+    assert after['users'] == before['users'] | expected['users']
+    for key in ('messages', 'members', 'attachments'):
+        assert after[key] == before[key] + expected[key]
+    assert target.get_messages_page(zed, yan) == chat
+    alice = target.get_user_by_email('user0@example.com', cached=False)
+    assert [message.content for message in target.iter_messages(alice[0], zed)] == []
+    assert not target.message_triggers_missing(target.pool.reader())
+
+    assert set(bulk.import_ndjson(target, text.splitlines()).values()) == {0}
+    assert snapshot(target) == after
+
+
+def test_invalid_record_stops_import_and_restores_triggers(source, target):
+    text, _ = export(source)
+    lines = text.splitlines()
+    lines.insert(len(lines) - 1, '{"table": "nope"}')
+    with pytest.raises(ValueError, match=f'line {len(lines) - 1}'):
+        bulk.import_ndjson(target, lines, batch_size=1, transaction_rows=1)
+    assert not target.message_triggers_missing(target.pool.reader())
+    assert target.pool.reader().execute('SELECT count(*) FROM users').fetchone()[0] > 0
+
+    # Running the import again completes it
+    bulk.import_ndjson(target, text.splitlines())
+    assert snapshot(target) == snapshot(source)
+
+
+def summaries(db):
+    return db.pool.reader().execute('''
+    SELECT user_id, conversation, last_message_id FROM conversation_summaries ORDER BY user_id, conversation
+    ''').fetchall()
+
+
+def test_bulk_messages_rebuilds_summaries_and_search(db, users, insert_messages):
+    a, b = users[:2]
+    with db.bulk_messages():
+        assert db.message_triggers_missing(db.pool.reader())
+        ids = insert_messages([(a, b, None, 'bulk loaded lunch', NOON)])
+    assert not db.message_triggers_missing(db.pool.reader())
+    assert [row[2] for row in summaries(db)] == ids * 2
+    assert [row[0] for row in db.search_messages(b, 'lunch')] == ids
+
+    later = db.add_message(b, a, content='after the load')
+    assert [row[2] for row in summaries(db)] == [later] * 2
+
+
+def test_interrupted_bulk_load_is_repaired_on_open(tmp_path):
+    path = str(tmp_path / 'interrupted.db')
+    db = Database(path)
+    a = db.add_user('A', 'A', 'a@example.com', 'password')
+    b = db.add_user('B', 'B', 'b@example.com', 'password')
+    # The process dies inside the block: triggers dropped, never restored
+    db.bulk_messages().__enter__()
+    with db.pool.write() as conn:
+        conn.execute('''
+        INSERT INTO messages (sender_id, receiver_id, content, conversation) VALUES (?, ?, ?, ?)
+        ''', (a, b, 'lost dinner plans', f'{a}:{b}'))
+    db.close()
+
+    db = Database(path)
+    try:
+        assert not db.message_triggers_missing(db.pool.reader())
+        assert len(summaries(db)) == 2
+        assert len(db.search_messages(a, 'dinner')) == 1
+    finally:
+        db.close()
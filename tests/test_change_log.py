@@ -0,0 +1,94 @@
+import pytest
+
+from database import CHANGE_LOG_SIZE, Database
+
+
+@pytest.fixture
+def other(db):
+    # Another client on the same file: its commits move data_version
+    other = Database(db.pool.path)
+    yield other
+    other.close()
+
+
+@pytest.fixture
+def events(db):
+    events = {'messages': [], 'users': [], 'groups': [], 'lost': 0}
+    db.new_message.connect(events['messages'].extend)
+    db.user_updated.connect(events['users'].extend)
+    db.group_changed.connect(events['groups'].extend)
+
+    def lost():
+        events['lost'] += 1
+
+    db.changes_lost.connect(lost)
+    return events
+
+
+def test_only_the_watched_users_messages_are_reported(db, other, users, events):
+    a, b, c, d = users[:4]
+    mine = other.create_group('Mine', b)
+    other.add_group_member(mine, a)
+    theirs = other.create_group('Theirs', c)
+    other.add_group_member(theirs, c)
+    db.watch_changes(user_id=a)
+
+    expected = [
+        other.add_message(a, b, content='to b'),
+        other.add_message(b, a, content='from b'),
+    ]
+    other.add_message(c, d, content='not mine')
+    expected.append(other.add_message(b, group_id=mine, content='group'))
+    other.add_message(c, group_id=theirs, content='other group')
+    db.poll_changes()
+    assert [message.id for message in events['messages']] == expected
+
+    # Skipped rows are not looked at again
+    events['messages'].clear()
+    other.add_message(d, c, content='still not mine')
+    db.poll_changes()
+    assert events['messages'] == []
+    latest = other.add_message(c, a, content='hello')
+    db.poll_changes()
+    assert [message.id for message in events['messages']] == [latest]
+
+
+def test_backlog_is_read_over_several_polls(db, other, users, events):
+    a, b = users[:2]
+    db.watch_changes(user_id=a)
+    ids = [other.add_message(a, b, content=str(i)) for i in range(25)]
+    for _ in range(3):
+        db.poll_changes(batch_size=10)
+    assert [message.id for message in events['messages']] == ids
+
+
+def test_user_and_member_changes(db, other, users, events):
+    a, b = users[:2]
+    db.watch_changes(user_id=a)
+    assert db.get_user_by_id(b)[5] in (0, False)
+    other.update_user_status(b, True)
+    group_id = other.create_group('Team', b)
+    other.add_group_member(group_id, a)
+    db.poll_changes()
+    assert [(row[0], row[4]) for row in events['users']] == [(b, 1)]
+    # The cached row was dropped
+    assert db.get_user_by_id(b)[5] == 1
+    assert [(row[0], row[4]) for row in events['groups']] == [(group_id, a)]
+    assert events['lost'] == 0
+
+
+def test_falling_behind_the_trimmed_log_asks_for_a_reload(db, other, users, events):
+    a, b = users[:2]
+    db.watch_changes(user_id=a)
+    with other.pool.write() as conn:
+        conn.executemany('UPDATE users SET is_online = NOT is_online WHERE id = ?',
+                         [(b,)] * (CHANGE_LOG_SIZE + 5))
+    db.poll_changes()
+    assert events['lost'] == 1
+    assert events['users'] == []
+
+    # Back in range afterwards
+    other.update_user_status(a, True)
+    db.poll_changes()
+    assert events['lost'] == 1
+    assert [row[0] for row in events['users']] == [a]
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from credentials import CredentialService, check_password, hash_password, parse_hash
+from Login_signup import Login_signup
+
+ITERATIONS = 1000
+
+
+def test_hash_and_check():
+    stored = hash_password('secret', ITERATIONS)
+    assert stored.startswith(f'pbkdf2_sha256${ITERATIONS}$')
+    assert stored != hash_password('secret', ITERATIONS)
+    assert check_password('secret', stored, ITERATIONS) == (True, None)
+    assert check_password('wrong', stored, ITERATIONS) == (False, None)
+
+
+@pytest.mark.parametrize('stored', ['secret', lambda: hash_password('secret', ITERATIONS // 2)])
+def test_outdated_password_is_rehashed(stored):
+    stored = stored() if callable(stored) else stored
+    matches, new_hash = check_password('secret', stored, ITERATIONS)
+    assert matches
+    assert parse_hash(new_hash)[0] == ITERATIONS
+    assert check_password('secret', new_hash, ITERATIONS) == (True, None)
+    # No upgrade without the right password
+    assert check_password('wrong', stored, ITERATIONS) == (False, None)
+
+
+@pytest.fixture
+def credentials():
+    credentials = CredentialService(iterations=ITERATIONS, max_workers=1)
+    yield credentials
+    credentials.close()
+
+
+def test_login_upgrades_a_plaintext_password(db, credentials):
+    user_id = db.add_user('A', 'A', 'a@example.com', 'secret')
+    # check_login runs on a worker thread and touches no widgets
+    login = SimpleNamespace(db=db, credentials=credentials)
+
+    user_data, matches = Login_signup.check_login(login, 'a@example.com', 'wrong')
+    assert not matches
+    assert db.get_user_by_email('a@example.com', cached=False)[4] == 'secret'
+
+    user_data, matches = Login_signup.check_login(login, 'a@example.com', 'secret')
+    stored = db.get_user_by_email('a@example.com', cached=False)[4]
+    assert matches and user_data[0] == user_id
+    assert user_data[4] == stored
+    assert parse_hash(stored)[0] == ITERATIONS
+
+    # Logging in again keeps the upgraded hash
+    user_data, matches = Login_signup.check_login(login, 'a@example.com', 'secret')
+    assert matches
+    assert db.get_user_by_email('a@example.com', cached=False)[4] == stored
+    assert Login_signup.check_login(login, 'nobody@example.com', 'secret') == (None, False)
+
+
+def test_service_hashes_in_worker_processes(credentials):
+    stored = credentials.hash('secret').result(timeout=30)
+    assert credentials.verify('secret', stored).result(timeout=30) == (True, None)
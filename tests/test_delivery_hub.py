@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+
+from delivery_hub import Client, DeliveryHub
+from hub_client import HubClient
+
+
+def received(client):
+    events = []
+    while not client.queue.empty():
+        events.append(client.queue.get_nowait())
+    return events
+
+
+@pytest.fixture
+def hub():
+    return DeliveryHub(max_queue=5)
+
+
+def connect(hub, user_id, groups=()):
+    client = Client(None, hub.max_queue)
+    hub.clients.add(client)
+    hub.dispatch(client, {'type': 'hello', 'user_id': user_id, 'groups': list(groups)})
+    return client
+
+
+def test_events_reach_only_their_recipients(hub):
+    a, a_phone, b, c = connect(hub, 1, [10]), connect(hub, 1), connect(hub, 2, [10]), connect(hub, 3)
+    for client in (a, a_phone, b, c):
+        received(client)
+
+    direct = {'type': 'message', 'message_id': 1, 'sender_id': 1, 'receiver_id': 2, 'group_id': None}
+    hub.dispatch(a, direct)
+    group = {'type': 'message', 'message_id': 2, 'sender_id': 2, 'receiver_id': None, 'group_id': 10}
+    hub.dispatch(b, group)
+    typing = {'type': 'typing', 'user_id': 1, 'receiver_id': 2, 'group_id': None}
+    hub.dispatch(a, typing)
+    # The sender's other sessions see its messages, not its typing
+    assert received(a) == [group]
+    assert received(a_phone) == [direct]
+    assert received(b) == [direct, typing]
+    assert received(c) == []
+
+    hub.dispatch(c, {'type': 'subscribe', 'groups': [10]})
+    hub.dispatch(a, group)
+    assert received(c) == [group]
+
+
+def test_presence_follows_first_and_last_session(hub):
+    a = connect(hub, 1)
+    b = connect(hub, 2)
+    assert received(a) == [{'type': 'presence', 'user_id': 2, 'is_online': True}]
+    assert received(b) == [{'type': 'presence', 'user_id': 1, 'is_online': True}]
+
+    second = connect(hub, 2)
+    assert received(a) == []
+    hub.disconnect(b)
+    assert received(a) == []
+    hub.disconnect(second)
+    assert received(a) == [{'type': 'presence', 'user_id': 2, 'is_online': False}]
+    assert hub.users.keys() == {1}
+
+
+def test_events_before_hello_are_ignored(hub):
+    anonymous = Client(None, hub.max_queue)
+    hub.clients.add(anonymous)
+    b = connect(hub, 2)
+    hub.dispatch(anonymous, {'type': 'message', 'message_id': 1, 'sender_id': 1, 'receiver_id': 2})
+    assert received(b) == []
+
+
+def test_slow_client_is_told_to_resync(hub):
+    a, b = connect(hub, 1), connect(hub, 2)
+    received(b)
+    for i in range(hub.max_queue):
+        hub.dispatch(a, {'type': 'message', 'message_id': i, 'sender_id': 1, 'receiver_id': 2})
+    # Typing is dropped rather than overflowing the queue
+    hub.dispatch(a, {'type': 'typing', 'user_id': 1, 'receiver_id': 2})
+    assert b.queue.qsize() == hub.max_queue and not b.overflowed
+
+    hub.dispatch(a, {'type': 'message', 'message_id': 99, 'sender_id': 1, 'receiver_id': 2})
+    hub.dispatch(a, {'type': 'message', 'message_id': 100, 'sender_id': 1, 'receiver_id': 2})
+    assert received(b) == [{'type': 'resync'}]
+
+
+def test_round_trip_over_a_socket(hub):
+    async def run():
+        server = await asyncio.start_server(hub.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        streams = [await asyncio.open_connection('127.0.0.1', port) for _ in range(2)]
+        for user_id, (_, writer) in enumerate(streams, 1):
+            writer.write(json.dumps({'type': 'hello', 'user_id': user_id}).encode() + b'\n')
+            await writer.drain()
+        (reader_a, writer_a), (reader_b, writer_b) = streams
+        presence = json.loads(await asyncio.wait_for(reader_a.readline(), 5))
+        writer_a.write(b'not json\n' + json.dumps({'type': 'message', 'message_id': 7, 'sender_id': 1,
+                                                   'receiver_id': 2, 'group_id': None}).encode() + b'\n')
+        events = [json.loads(await asyncio.wait_for(reader_b.readline(), 5)) for _ in range(2)]
+        writer_b.close()
+        gone = json.loads(await asyncio.wait_for(reader_a.readline(), 5))
+        writer_a.close()
+        server.close()
+        await server.wait_closed()
+        return presence, events, gone
+
+    presence, events, gone = asyncio.run(run())
+    assert presence == {'type': 'presence', 'user_id': 2, 'is_online': True}
+    assert [event['type'] for event in events] == ['presence', 'message']
+    assert events[1]['message_id'] == 7
+    assert gone == {'type': 'presence', 'user_id': 2, 'is_online': False}
+
+
+class FakeSocket:
+    def __init__(self):
+        self.data = b''
+
+    def readAll(self):
+        data, self.data = self.data, b''
+        return data
+
+
+def test_client_splits_batches_and_requests_resync():
+    client = HubClient('127.0.0.1:0')
+    client.socket = FakeSocket()
+    messages, presence, resyncs = [], [], []
+    client.message_received.connect(messages.append)
+    client.presence_changed.connect(lambda user_id, online: presence.append((user_id, online)))
+    client.resync_requested.connect(lambda: resyncs.append(True))
+
+    message = {'type': 'message', 'message_id': 3, 'sender_id': 1, 'receiver_id': 2, 'group_id': None}
+    text = json.dumps(message).encode() + b'\n' + json.dumps({'type': 'presence', 'user_id': 4,
+                                                              'is_online': False}).encode()
+    client.socket.data = text[:10]
+    client.on_ready_read()
+    assert messages == []
+    client.socket.data = text[10:] + b'\n{"type": "resync"}\n'
+    client.on_ready_read()
+    assert messages == [message]
+    assert presence == [(4, False)]
+    assert resyncs == [True]
+    assert client.buffer == b''
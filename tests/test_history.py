@@ -0,0 +1,31 @@
+import pytest
+
+NOON = '2026-01-01 12:00:00'
+
+
+@pytest.mark.parametrize('limit', [1, 4, 50])
+def test_message_pages_cover_history(db, users, insert_messages, walk_history, limit):
+    a, b = users[:2]
+    insert_messages([(a, b, None, f'message {i}', f'2026-01-01 12:00:{i // 3:02d}') for i in range(20)])
+    insert_messages([(users[2], a, None, 'other chat', NOON)])
+    history = list(db.iter_messages(a, b))
+    assert len(history) == 20
+    assert walk_history(lambda **page: db.get_messages_page(b, a, **page), limit) == history
+
+    newer = db.get_messages_after(a, b, history[9].id, limit=limit)
+    assert newer == history[10:10 + limit]
+
+
+@pytest.mark.parametrize('limit', [1, 4, 50])
+def test_group_pages_cover_history(db, users, insert_messages, walk_history, limit):
+    a, b = users[:2]
+    group_id = db.create_group('Team', a)
+    other_group = db.create_group('Other', b)
+    insert_messages([(users[i % 2], None, group_id, f'message {i}', NOON) for i in range(15)]
+                    + [(b, None, other_group, 'elsewhere', NOON)])
+    history = list(db.iter_group_messages(group_id))
+    assert [message.content for message in history] == [f'message {i}' for i in range(15)]
+    assert walk_history(lambda **page: db.get_group_messages_page(group_id, **page), limit) == history
+
+    newer = db.get_group_messages_after(group_id, history[4].id, limit=limit)
+    assert newer == history[5:5 + limit]
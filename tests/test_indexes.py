@@ -0,0 +1,33 @@
+import pytest
+
+from database import DIRECT_HISTORY_QUERY, GROUP_HISTORY_QUERY
+
+
+def plan(db, sql, params):
+    rows = db.pool.reader().execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return ' | '.join(row[3] for row in rows)
+
+
+@pytest.mark.parametrize('query, params, index', [
+    (DIRECT_HISTORY_QUERY, ('1:2',), 'idx_messages_conversation'),
+    (GROUP_HISTORY_QUERY, (1,), 'idx_messages_group'),
+])
+@pytest.mark.parametrize('order', [' ORDER BY m.timestamp, m.id', ' ORDER BY m.timestamp DESC, m.id DESC LIMIT 50'])
+def test_history_is_an_index_range_scan(db, query, params, index, order):
+    # Already in display order: no sort, whatever the size of the history
+    steps = plan(db, query + order, params)
+    assert f'USING INDEX {index}' in steps
+    assert 'TEMP B-TREE' not in steps
+
+
+def test_history_uses_index_with_data(db, users, insert_messages):
+    a, b, c = users[:3]
+    group_id = db.create_group('Team', a)
+    insert_messages([(a, b, None, f'direct {i}', f'2026-01-01 12:00:{i:02d}') for i in range(50)]
+                    + [(c, None, group_id, f'group {i}', f'2026-01-01 12:00:{i:02d}') for i in range(50)])
+    with db.pool.write() as conn:
+        conn.execute('ANALYZE')
+    assert 'idx_messages_conversation' in plan(db, DIRECT_HISTORY_QUERY + ' ORDER BY m.timestamp, m.id',
+                                               (f'{a}:{b}',))
+    assert 'idx_messages_group' in plan(db, GROUP_HISTORY_QUERY + ' ORDER BY m.timestamp, m.id', (group_id,))
+    assert [message.content for message in db.get_messages_page(b, a, limit=2)] == ['direct 48', 'direct 49']
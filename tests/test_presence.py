@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def presence(db):
+    return db.presence
+
+
+def status(db, user_id):
+    return db.pool.reader().execute('SELECT is_online, last_seen FROM users WHERE id = ?', (user_id,)).fetchone()
+
+
+def change_count(db):
+    return db.pool.reader().execute('SELECT count(*) FROM change_log').fetchone()[0]
+
+
+def test_heartbeats_are_written_together(db, users, presence):
+    a, b = users[:2]
+    db.update_user_status(b, True)
+    presence.heartbeat(a)
+    presence.heartbeat(a)
+    presence.heartbeat(b)
+    changes = change_count(db)
+    # Only the user that was offline comes online
+    assert presence.write_beats(presence.take_beats()) == [a]
+    assert change_count(db) == changes + 1
+    assert status(db, a)[0] == 1
+    assert presence.take_beats() == {}
+
+    # An ongoing session only moves last_seen
+    seen = status(db, a)[1]
+    presence.heartbeat(a)
+    assert presence.flush() == 1
+    assert status(db, a)[1] > seen
+    assert change_count(db) == changes + 1
+    assert db.get_user_by_id(a)[6] == status(db, a)[1]
+
+
+def test_sweep_expires_silent_users(db, users, presence):
+    a, b, c = users[:3]
+    for user_id in (a, b, c):
+        db.update_user_status(user_id, True)
+    long_ago = (datetime.now() - timedelta(seconds=presence.timeout + 60)).isoformat(' ')
+    with db.pool.write() as conn:
+        conn.executemany('UPDATE users SET last_seen = ? WHERE id = ?', [(long_ago, a), (long_ago, b)])
+    # b's heartbeat is still pending: it is written before the sweep
+    presence.heartbeat(b)
+    assert presence.write_sweep(presence.take_beats()) == ([], [a])
+    assert [status(db, user_id)[0] for user_id in (a, b, c)] == [0, 1, 1]
+    assert db.get_user_by_id(a)[5] == 0
+
+
+def test_heartbeat_in_flight_does_not_undo_logout(db, users, presence):
+    a = users[0]
+    presence.heartbeat(a)
+    # The worker has taken the heartbeat when the user logs out
+    beats = presence.take_beats()
+    db.update_user_status(a, False)
+    assert presence.write_beats(beats) == []
+    assert status(db, a)[0] == 0
+
+    # Heartbeats after logging in again count
+    presence.heartbeat(a)
+    assert presence.write_beats(presence.take_beats()) == [a]
+
+    # Logout also drops a heartbeat that was not taken yet
+    presence.heartbeat(a)
+    presence.discard(a)
+    assert presence.take_beats() == {}
+
+
+def test_changes_are_emitted_together(users, presence):
+    a, b = users[:2]
+    emitted = []
+    presence.presence_changed.connect(emitted.append)
+    presence.note(a, True)
+    assert emitted == []
+    presence.start()
+    try:
+        presence.note(a, True)
+        presence.note(b, True)
+        presence.note(a, False)
+        presence.emit_changes()
+        presence.emit_changes()
+    finally:
+        presence.stop()
+    assert emitted == [[(a, False), (b, True)]]
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import query_stats
+from database import Database
+from query_stats import QueryStats, percentile
+
+
+@pytest.fixture
+def stats():
+    return QueryStats(slow_threshold=0)
+
+
+@pytest.fixture
+def timed_db(tmp_path, stats):
+    db = Database(str(tmp_path / 'timed.db'), stats=stats)
+    yield db
+    db.close()
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    values = list(range(100))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile(values, 1.0) == 99
+
+
+def test_methods_and_statements_are_recorded(timed_db, stats):
+    a = timed_db.add_user('A', 'A', 'a@example.com', 'password')
+    b = timed_db.add_user('B', 'B', 'b@example.com', 'password')
+    for i in range(3):
+        timed_db.add_message(a, b, content=f'message {i}')
+    stats.reset()
+
+    assert len(timed_db.get_messages_page(a, b)) == 3
+    # Generators count the rows they yield, once exhausted
+    assert len(list(timed_db.iter_messages(a, b, batch_size=2))) == 3
+    report = stats.snapshot()
+    assert report['methods']['get_messages_page']['calls'] == 1
+    assert report['methods']['get_messages_page']['rows'] == 3
+    assert report['methods']['iter_messages']['rows'] == 3
+
+    by_rows = {sql: entry['rows'] for sql, entry in report['statements'].items()}
+    assert 3 in by_rows.values()
+    # Whitespace differences between call sites fold into one entry
+    assert all('\n' not in sql and '  ' not in sql for sql in by_rows)
+    slow = report['slow_queries']
+    assert slow and all(entry['plan'] for entry in slow if entry['sql'].startswith('SELECT'))
+    # The plans themselves are not recorded
+    assert not any(sql.startswith('EXPLAIN') for sql in by_rows)
+
+
+def test_summary_percentiles():
+    stats = QueryStats(samples=3)
+    for elapsed in (0.5, 0.001, 0.002, 0.003):
+        stats.record_method('get_users', elapsed, 2)
+    entry = stats.snapshot()['methods']['get_users']
+    assert entry['calls'] == 4
+    assert entry['rows'] == 8
+    assert entry['total_ms'] == pytest.approx(506)
+    # Percentiles cover the last `samples` calls only
+    assert entry['max_recent_ms'] == pytest.approx(3)
+    assert entry['p50_ms'] == pytest.approx(2)
+
+
+def test_report_from_saved_file(timed_db, stats, tmp_path, capsys):
+    timed_db.add_user('A', 'A', 'a@example.com', 'password')
+    path = tmp_path / 'stats' / 'query_stats.json'
+    stats.save(str(path))
+    assert json.loads(path.read_text())['methods']['add_user']['calls'] == 1
+
+    query_stats.main([str(path), '--sort', 'calls', '--limit', '5'])
+    out = capsys.readouterr().out
+    assert 'METHODS (by calls)' in out
+    assert 'add_user' in out
+    assert 'SLOW QUERIES' in out
@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 100])
+def test_recent_conversations_keyset_pages(db, chats, walk_pages, limit):
+    me, _ = chats
+    everyone = db.get_recent_conversations(me, limit=-1)
+    assert len(everyone) == 8
+    assert len({row[0] for row in everyone}) == 8
+    activity = [row[5] for row in everyone]
+    assert activity == sorted(activity, reverse=True)
+    assert walk_pages(lambda **page: db.get_recent_conversations(me, **page), lambda row: (row[5], row[0]),
+                      limit) == everyone
+
+
+def test_rows_carry_the_last_message(db, users, chats):
+    me, groups = chats
+    rows = {row[0]: row for row in db.get_recent_conversations(me)}
+    _, peer_id, group_id, title, unread, _, _, sender_id, preview, first, last = rows[f'{me}:{users[4]}']
+    assert (peer_id, group_id, title, unread) == (users[4], None, 'First4 Last4', 1)
+    assert (sender_id, preview, first, last) == (users[4], 'd', 'First4', 'Last4')
+    assert rows[f'g:{groups[1]}'][2:5] == (groups[1], 'Two', 0)
+    assert rows[f'g:{groups[1]}'][8] == 'hi'
+    # A group without messages yet
+    assert rows[f'g:{groups[0]}'][6:] == (None,) * 5
+
+    db.mark_conversation_read(me, peer_id=users[4])
+    unread = {row[0]: row[4] for row in db.get_recent_conversations(me)}
+    assert unread[f'{me}:{users[4]}'] == 0
@@ -0,0 +1,129 @@
+import sqlite3
+
+import pytest
+
+from database import SCHEMA_VERSION, Database
+
+# The tables as created before schema versioning: no conversation column,
+# search, summaries or attachments
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    is_online BOOLEAN DEFAULT FALSE,
+    last_seen TIMESTAMP
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER,
+    group_id INTEGER,
+    content TEXT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_read BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (sender_id) REFERENCES users(id),
+    FOREIGN KEY (receiver_id) REFERENCES users(id),
+    FOREIGN KEY (group_id) REFERENCES groups(id),
+    CHECK ((receiver_id IS NOT NULL AND group_id IS NULL) OR
+           (receiver_id IS NULL AND group_id IS NOT NULL))
+);
+CREATE TABLE groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    created_by INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (created_by) REFERENCES users(id)
+);
+CREATE TABLE group_members (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    joined_at TIMESTAMP DEFAULT '2026-01-01 08:00:00',
+    PRIMARY KEY (group_id, user_id),
+    FOREIGN KEY (group_id) REFERENCES groups(id),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+'''
+
+BASELINE_DATA = '''
+INSERT INTO users (first_name, last_name, email, password) VALUES
+    ('A', 'A', 'a@example.com', 'plain'), ('B', 'B', 'b@example.com', 'plain'), ('C', 'C', 'c@example.com', 'plain');
+INSERT INTO groups (name, created_by) VALUES ('Team', 1);
+INSERT INTO group_members (group_id, user_id) VALUES (1, 1), (1, 3);
+INSERT INTO messages (sender_id, receiver_id, group_id, content, timestamp) VALUES
+    (2, 1, NULL, 'lunch today?', '2026-01-01 12:00:00'),
+    (1, 2, NULL, 'sure, lunch at one', '2026-01-01 12:01:00'),
+    (3, NULL, 1, 'team lunch friday', '2026-01-01 12:02:00');
+'''
+
+
+def open_database(path):
+    db = Database(str(path))
+    version = db.pool.reader().execute('PRAGMA user_version').fetchone()[0]
+    return db, version
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = tmp_path / 'baseline.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA + BASELINE_DATA)
+    conn.close()
+    return path
+
+
+def check_data(db):
+    assert [message.content for message in db.get_messages_page(1, 2)] == ['lunch today?', 'sure, lunch at one']
+    assert [message.content for message in db.get_group_messages_page(1)] == ['team lunch friday']
+    assert sorted(row[4] for row in db.search_messages(1, 'lunch')) == [
+        'lunch today?', 'sure, lunch at one', 'team lunch friday']
+    # B is not in the group
+    assert sorted(row[4] for row in db.search_messages(2, 'lunch')) == ['lunch today?', 'sure, lunch at one']
+    recent = db.get_recent_conversations(1)
+    assert [(row[0], row[4]) for row in recent] == [('g:1', 0), ('1:2', 1)]
+
+
+def test_unversioned_database_is_migrated(baseline):
+    assert SCHEMA_VERSION == 4
+    db, version = open_database(baseline)
+    try:
+        assert version == SCHEMA_VERSION
+        rows = db.pool.reader().execute('SELECT conversation FROM messages ORDER BY id').fetchall()
+        assert rows == [('1:2',), ('1:2',), (None,)]
+        check_data(db)
+    finally:
+        db.close()
+
+    # Opening it again changes nothing
+    db, version = open_database(baseline)
+    try:
+        assert version == SCHEMA_VERSION
+        check_data(db)
+    finally:
+        db.close()
+
+
+def test_search_index_without_scope_is_rebuilt(baseline):
+    db, _ = open_database(baseline)
+    db.close()
+    # Back to version 3, whose message index had no scope column
+    conn = sqlite3.connect(baseline)
+    conn.executescript('''
+    DROP TRIGGER messages_fts_insert;
+    DROP TRIGGER messages_fts_delete;
+    DROP TRIGGER messages_fts_update;
+    DROP TABLE messages_fts;
+    CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='id', prefix='2 3');
+    INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+    PRAGMA user_version = 3;
+    ''')
+    conn.close()
+
+    db, version = open_database(baseline)
+    try:
+        assert version == SCHEMA_VERSION
+        check_data(db)
+    finally:
+        db.close()
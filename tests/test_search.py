@@ -0,0 +1,70 @@
+import pytest
+
+
+def found(db, user_id, term, **page):
+    return [row[4] for row in db.search_messages(user_id, term, **page)]
+
+
+@pytest.fixture
+def many_users(db, users):
+    # Ids past 9, so 'u1' and 'u12' are both scope tokens
+    return users + [db.add_user(f'More{i}', 'User', f'more{i}@example.com', 'password') for i in range(6)]
+
+
+def test_only_visible_messages_match(db, many_users):
+    u1, u2, u3 = many_users[0], many_users[1], many_users[11]
+    assert (u1, u3) == (1, 12)
+    team = db.create_group('Team', u1)
+    db.add_group_member(team, u1)
+    db.add_group_member(team, u2)
+    private = db.create_group('Private', u3)
+    db.add_group_member(private, u3)
+
+    db.add_message(u1, u2, content='pizza tonight')
+    db.add_message(u3, u2, content='pizza later')
+    db.add_message(u2, None, group_id=team, content='pizza for the team')
+    db.add_message(u3, None, group_id=private, content='secret pizza')
+    # Text that looks like scope tokens only matches as content
+    db.add_message(u3, u2, content=f'u{u1} g{private} pizza')
+
+    assert sorted(found(db, u1, 'pizza')) == ['pizza for the team', 'pizza tonight']
+    assert sorted(found(db, u2, 'pizza')) == [
+        'pizza for the team', 'pizza later', 'pizza tonight', f'u{u1} g{private} pizza']
+    assert sorted(found(db, u3, 'piz')) == [
+        'pizza later', 'secret pizza', f'u{u1} g{private} pizza']
+    assert found(db, u1, f'u{u1}') == []
+    assert found(db, u1, 'secret') == []
+
+    # Joining a group makes its history searchable
+    db.add_group_member(private, u1)
+    assert found(db, u1, 'secret') == ['secret pizza']
+
+
+def test_queries_are_never_parsed_as_syntax(db, users):
+    a, b = users[:2]
+    db.add_message(a, b, content='meet AND greet "at noon"')
+    for term in ('AND', 'greet OR', '"at', 'noon*', 'scope : u1', 'NEAR(meet greet)'):
+        db.search_messages(a, term)
+    assert found(db, a, 'AND greet') == ['meet AND greet "at noon"']
+    assert found(db, a, '   ') == []
+    assert found(db, a, '*') == []
+
+
+def test_results_are_paged(db, users):
+    a, b = users[:2]
+    for i in range(5):
+        db.add_message(a, b, content=f'report {i}')
+    everything = db.search_messages(b, 'report', limit=10)
+    assert len(everything) == 5
+    pages = db.search_messages(b, 'report', limit=2) + db.search_messages(b, 'report', limit=2, offset=2) \
+        + db.search_messages(b, 'report', limit=2, offset=4)
+    assert pages == everything
+
+
+def test_user_search(db, users):
+    rows = db.search_users('First3')
+    assert [row[0] for row in rows] == [users[3]]
+    assert '<b>' in rows[0][5]
+    assert {row[0] for row in db.search_users('user', limit=100)} == set(users)
+    assert users[0] not in {row[0] for row in db.search_users('user', exclude_user_id=users[0], limit=100)}
+    assert db.search_users('nobody') == []
@@ -0,0 +1,104 @@
+import pytest
+
+NOON = '2026-01-01 12:00:00'
+
+
+def summaries(db):
+    return db.pool.reader().execute('''
+    SELECT user_id, conversation, peer_id, group_id, unread_count, last_message_id, last_activity
+    FROM conversation_summaries ORDER BY user_id, conversation
+    ''').fetchall()
+
+
+def backfill(db):
+    with db.pool.write() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        db.backfill_summaries(cursor)
+
+
+def test_backfill_matches_triggers_for_direct_chats(db, users, insert_messages):
+    a, b, c = users[:3]
+    insert_messages([
+        (a, b, None, 'first', '2026-01-01 09:00:00'),
+        (b, a, None, 'same second 1', NOON),
+        (a, b, None, 'same second 2', NOON),
+        (b, a, None, 'same second 3', NOON),
+        # Arrives late with an older timestamp: not the last message
+        (a, b, None, 'late', '2026-01-01 08:00:00'),
+        (c, a, None, 'hello', NOON),
+        (a, a, None, 'note to self', NOON),
+    ])
+    db.mark_conversation_read(a, peer_id=c)
+    by_triggers = summaries(db)
+    backfill(db)
+    assert summaries(db) == by_triggers
+
+    last = {(row[0], row[1]): row[5] for row in by_triggers}
+    newest_at_noon = db.pool.reader().execute(
+        "SELECT max(id) FROM messages WHERE content LIKE 'same second%'").fetchone()[0]
+    assert last[(a, f'{a}:{b}')] == last[(b, f'{a}:{b}')] == newest_at_noon
+    unread = {(row[0], row[1]): row[4] for row in by_triggers}
+    assert unread[(a, f'{a}:{b}')] == 2
+    assert unread[(b, f'{a}:{b}')] == 3
+    assert unread[(a, f'{a}:{c}')] == 0
+    assert unread[(a, f'{a}:{a}')] == 0
+
+
+def test_backfill_matches_triggers_for_groups(db, users, insert_messages):
+    a, b, c, d = users[:4]
+    group_id = db.create_group('Team', a)
+    empty_group = db.create_group('Quiet', b)
+    with db.pool.write() as conn:
+        conn.executemany('INSERT INTO group_members (group_id, user_id, joined_at) VALUES (?, ?, ?)', [
+            (group_id, a, '2026-01-01 08:00:00'),
+            (group_id, b, '2026-01-01 08:00:00'),
+            (group_id, c, '2026-01-01 11:30:00'),
+            # Joined after the last message: no last message yet
+            (group_id, d, '2026-01-01 13:00:00'),
+            (empty_group, b, '2026-01-01 08:00:00'),
+        ])
+    ids = insert_messages([
+        (a, None, group_id, 'one', NOON),
+        (b, None, group_id, 'two', NOON),
+        (c, None, group_id, 'older', '2026-01-01 11:00:00'),
+    ])
+    # Existing group messages count as read after a backfill
+    for user_id in (a, b, c, d):
+        db.mark_conversation_read(user_id, group_id=group_id)
+    by_triggers = summaries(db)
+    backfill(db)
+    assert summaries(db) == by_triggers
+
+    last = {row[0]: row[5:] for row in by_triggers if row[3] == group_id}
+    assert last == {a: (ids[1], NOON), b: (ids[1], NOON), c: (ids[1], NOON), d: (None, '2026-01-01 13:00:00')}
+    assert [row[5] for row in by_triggers if row[3] == empty_group] == [None]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 100])
+def test_contacts_keyset_pages(db, users, chats, walk_pages, limit):
+    me, _ = chats
+    everyone = db.get_user_contacts(me)
+    assert sorted(row[0] for row in everyone) == sorted(users[1:])
+    # Online first; within each, chats by activity then the rest by id
+    assert [row[0] for row in everyone] == [
+        users[4], users[3], users[5],
+        users[2], users[1], users[6], users[7],
+    ]
+
+    def page_key(row):
+        return row[4], row[6], row[0]
+
+    assert walk_pages(lambda **page: db.get_user_contacts(me, **page), page_key, limit) == everyone
+    online = walk_pages(lambda **page: db.get_user_contacts(me, online_only=True, **page), page_key, limit)
+    assert online == [row for row in everyone if row[4]]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 100])
+def test_group_summaries_keyset_pages(db, chats, walk_pages, limit):
+    me, groups = chats
+    everyone = db.get_user_group_summaries(me)
+    assert sorted(row[0] for row in everyone) == sorted(groups)
+    assert everyone[0][0] == groups[1]
+    assert walk_pages(lambda **page: db.get_user_group_summaries(me, **page), lambda row: (row[5], row[0]),
+                      limit) == everyone
@@ -0,0 +1,59 @@
+from user_cache import UserCache
+
+
+def row(user_id, email=None):
+    return (user_id, f'First{user_id}', f'Last{user_id}', email or f'user{user_id}@example.com', 'password', 0, None)
+
+
+def test_least_recently_used_row_is_evicted():
+    cache = UserCache(capacity=2)
+    for user_id in (1, 2):
+        cache.put(row(user_id), cache.token())
+    assert cache.get(1) == row(1)
+    cache.put(row(3), cache.token())
+    assert cache.get(2) is None
+    assert cache.get_by_email('user2@example.com') is None
+    assert cache.get_by_email('user1@example.com') == row(1)
+    assert cache.get(3) == row(3)
+
+
+def test_changed_email_replaces_the_old_one():
+    cache = UserCache()
+    cache.put(row(1), cache.token())
+    cache.put(row(1, 'new@example.com'), cache.token())
+    assert cache.get_by_email('user1@example.com') is None
+    assert cache.get_by_email('new@example.com') == row(1, 'new@example.com')
+
+
+def test_row_read_before_an_invalidation_is_not_stored():
+    cache = UserCache()
+    cache.put(row(1), cache.token())
+    token = cache.token()
+    # Another thread changes user 2 while this one is reading it
+    cache.invalidate(2)
+    cache.put(row(2), token)
+    assert cache.get(2) is None
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.get_by_email('user1@example.com') is None
+
+    cache.put(row(2), cache.token())
+    cache.clear()
+    assert cache.get(2) is None
+
+
+def test_database_reads_through_and_invalidates_on_writes(db, users):
+    a = users[0]
+    reads = []
+    db.pool.reader().set_trace_callback(lambda sql: reads.append(sql) if 'FROM users' in sql else None)
+    first = db.get_user_by_id(a)
+    assert db.get_user_by_id(a) is first
+    assert db.get_users([a]) == {a: first}
+    assert db.get_user_by_email(first[3]) is first
+    assert len(reads) == 1
+
+    db.update_user_password(a, 'changed')
+    assert db.get_user_by_id(a)[4] == 'changed'
+    db.update_user_status(a, True)
+    assert db.get_user_by_id(a)[5] == 1
+    assert db.get_user_by_email(first[3])[5] == 1
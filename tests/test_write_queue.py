@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from write_queue import WriteQueue
+
+INSERT_USER = 'INSERT INTO users (first_name, last_name, email, password) VALUES (?, ?, ?, ?)'
+
+
+@pytest.fixture
+def write_queue(db):
+    # All three statements of a test go into one batch
+    write_queue = WriteQueue(db.pool, max_batch=3, max_delay=5)
+    yield write_queue
+    write_queue.close()
+
+
+def emails(db):
+    return [row[0] for row in db.pool.reader().execute('SELECT email FROM users ORDER BY id')]
+
+
+def test_failed_statement_rolls_back_alone(db, users, write_queue):
+    first = write_queue.submit(INSERT_USER, ('A', 'A', 'a@example.com', 'password'))
+    # The first row is valid, the second a duplicate: neither may stay
+    failing = write_queue.submit(INSERT_USER.replace('(?, ?, ?, ?)', '(?, ?, ?, ?), (?, ?, ?, ?)'),
+                                 ('B', 'B', 'b@example.com', 'password', 'C', 'C', 'user0@example.com', 'password'))
+    last = write_queue.submit(INSERT_USER, ('D', 'D', 'd@example.com', 'password'))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result(timeout=10)
+    assert last.result(timeout=10) == first.result(timeout=10) + 1
+    assert emails(db)[len(users):] == ['a@example.com', 'd@example.com']
+
+
+def test_batch_commits_together(db, write_queue):
+    futures = [write_queue.submit(INSERT_USER, (name, name, f'{name}@example.com', 'password'))
+               for name in ('x', 'y', 'z')]
+    assert [future.result(timeout=10) for future in futures] == [1, 2, 3]
+    assert emails(db) == ['x@example.com', 'y@example.com', 'z@example.com']
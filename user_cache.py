@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class UserCache:
+    # Bounded LRU of full users rows (as returned by SELECT * FROM users),
+    # shared by all threads. Misses are not cached. Every invalidation bumps
+    # a version, and a row read from disk is only stored if no invalidation
+    # happened since the read started (see token), so a slow reader can't
+    # put back a row that was already replaced.
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._rows = OrderedDict()
+        self._emails = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        return self._version
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is not None:
+                self._rows.move_to_end(user_id)
+            return row
+
+    def get_by_email(self, email):
+        with self._lock:
+            user_id = self._emails.get(email)
+            if user_id is None:
+                return None
+            self._rows.move_to_end(user_id)
+            return self._rows[user_id]
+
+    def put(self, row, token):
+        with self._lock:
+            if token != self._version:
+                return
+            old = self._rows.pop(row[0], None)
+            if old is not None:
+                del self._emails[old[3]]
+            self._rows[row[0]] = row
+            self._emails[row[3]] = row[0]
+            while len(self._rows) > self.capacity:
+                _, evicted = self._rows.popitem(last=False)
+                del self._emails[evicted[3]]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._version += 1
+            row = self._rows.pop(user_id, None)
+            if row is not None:
+                del self._emails[row[3]]
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._rows.clear()
+            self._emails.clear()
@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class WriteQueue:
+    # Group commit: writes submitted from any thread are applied by one
+    # background thread, many statements per transaction, so a burst of
+    # inserts pays for a single fsync instead of one each.
+
+    def __init__(self, pool, max_batch=1000, max_delay=0.005):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-write-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        # The future resolves to the statement's lastrowid once its batch commits
+        future = Future()
+        self._queue.put((sql, params, future))
+        return future
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        results = []
+        try:
+            with self.pool.write() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for sql, params, future in batch:
+                    # A savepoint per statement keeps one bad row from failing
+                    # the rest of the batch.
+                    conn.execute('SAVEPOINT queued_write')
+                    try:
+                        results.append((future, conn.execute(sql, params).lastrowid, None))
+                    except Exception as error:
+                        conn.execute('ROLLBACK TO queued_write')
+                        results.append((future, None, error))
+                    conn.execute('RELEASE queued_write')
+        except Exception as error:
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+
+        for future, lastrowid, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(lastrowid)